@@ -61,6 +61,15 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         raise credentials_exception
     return user
 
+# Comma-separated app account emails allowed to see operational internals
+ADMIN_EMAILS = {e.strip().lower() for e in os.getenv("ADMIN_EMAILS", "").split(",") if e.strip()}
+
+def get_admin_user(current_user = Depends(get_current_user)):
+    """Like get_current_user, but only for accounts listed in ADMIN_EMAILS (403 otherwise)."""
+    if (current_user.email or "").lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return current_user
+
 
 # --- Garmin Password Encryption ---
 from cryptography.fernet import Fernet
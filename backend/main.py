@@ -68,13 +68,50 @@ async def lifespan(app: FastAPI):
                 conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_users_telegram_chat_id ON users (telegram_chat_id)"))
                 conn.commit()
                 logger.info("✅ Migration complete: telegram columns added")
+
+            # Add the VO2 max refresh marker if missing
+            if inspector.has_table('garmin_vo2max'):
+                vo2_columns = [c['name'] for c in inspector.get_columns('garmin_vo2max')]
+                if 'refresh_attempted_at' not in vo2_columns:
+                    logger.info("Running migration: adding refresh_attempted_at to garmin_vo2max...")
+                    conn.execute(text("ALTER TABLE garmin_vo2max ADD COLUMN refresh_attempted_at TIMESTAMP"))
+                    conn.commit()
+                    logger.info("✅ Migration complete: refresh_attempted_at added to garmin_vo2max")
+
+            # Add the activity details expiry if missing
+            if inspector.has_table('garmin_activity_details'):
+                detail_columns = [c['name'] for c in inspector.get_columns('garmin_activity_details')]
+                if 'expires_at' not in detail_columns:
+                    logger.info("Running migration: adding expires_at to garmin_activity_details...")
+                    conn.execute(text("ALTER TABLE garmin_activity_details ADD COLUMN expires_at TIMESTAMP"))
+                    conn.commit()
+                    logger.info("✅ Migration complete: expires_at added to garmin_activity_details")
     except Exception as migration_err:
         logger.error(f"Migration warning (non-fatal): {migration_err}")
     
     # Initialize global CoachBrain singleton
     app.state.brain = CoachBrain()
+
+    # Learned Garmin endpoint health (which fallback variants work) from previous runs
+    import asyncio
+    from backend.services.endpoint_health import ENDPOINT_HEALTH
+    await asyncio.to_thread(ENDPOINT_HEALTH.load)
+
+    # Refresh cached daily metrics shortly before users usually open the app
+    from backend.services.daily_metrics import DAILY_METRICS_PREWARMER
+    if os.getenv("DAILY_METRICS_PREWARM_ENABLED", "true").lower() == "true":
+        DAILY_METRICS_PREWARMER.start()
+
+    # Probe the Garmin egress proxies in the background (no-op without proxies)
+    from backend.services.garmin_egress import GARMIN_EGRESS
+    GARMIN_EGRESS.start()
     yield
     logger.info(">>> SHUTTING DOWN AI COACH API <<<")
+    await DAILY_METRICS_PREWARMER.stop()
+    await GARMIN_EGRESS.stop()
+    await asyncio.to_thread(ENDPOINT_HEALTH.flush)
+    from backend.services.garmin_async_client import close_http_clients
+    await close_http_clients()
 
 
 app = FastAPI(title="AI Coach API", version="1.0.0", lifespan=lifespan)
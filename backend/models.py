@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, JSON, Float, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, JSON, Float, DateTime, ForeignKey, Boolean, BigInteger, LargeBinary, UniqueConstraint
 from sqlalchemy.orm import relationship
 from backend.database import Base
 
@@ -49,6 +49,140 @@ class UserSetting(Base):
     # Relationship back to User (optional convenience)
     user = relationship("User", back_populates="settings")
 
+class GarminSession(Base):
+    """Garth OAuth tokens of one user's Garmin account, shared by all workers.
+    `version` increases on every write so workers only re-read tokens when it changes."""
+    __tablename__ = "garmin_sessions"
+    __table_args__ = (UniqueConstraint("user_id", "garmin_email", name="uq_garmin_session_user"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True, index=True)
+    garmin_email = Column(String, index=True, nullable=False)
+    version = Column(Integer, default=1, nullable=False)
+    tokens = Column(JSON)  # {filename: content} in the layout garth.dump() writes
+    tokens_hash = Column(String, nullable=True)  # sha256 of tokens, lets unchanged writes be skipped
+    display_name = Column(String, nullable=True)  # Resolved Garmin displayName (never the email)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+class GarminCacheEntry(Base):
+    """L2 (shared) tier of the Garmin response cache. `expires_at` is NULL for immutable data."""
+    __tablename__ = "garmin_cache"
+
+    id = Column(Integer, primary_key=True, index=True)
+    cache_key = Column(String, unique=True, index=True, nullable=False)  # email|method|args
+    garmin_email = Column(String, index=True, nullable=False)
+    method = Column(String, index=True, nullable=False)
+    value = Column(JSON)
+    expires_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+class GarminActivity(Base):
+    """Local copy of a Garmin activity (raw activity-list JSON), keyed by activityId per account."""
+    __tablename__ = "garmin_activities"
+    __table_args__ = (UniqueConstraint("garmin_email", "activity_id", name="uq_garmin_activity"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    garmin_email = Column(String, index=True, nullable=False)
+    activity_id = Column(BigInteger, nullable=False)
+    start_time_gmt = Column(String, index=True)  # "YYYY-MM-DD HH:MM:SS", sorts chronologically
+    data = Column(JSON)
+
+class GarminActivityDetail(Base):
+    """One component (summary, splits, high_res) of an activity's details, zlib-compressed JSON."""
+    __tablename__ = "garmin_activity_details"
+    __table_args__ = (UniqueConstraint("garmin_email", "activity_id", "component", name="uq_garmin_activity_detail"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    garmin_email = Column(String, index=True, nullable=False)
+    activity_id = Column(BigInteger, index=True, nullable=False)
+    component = Column(String, nullable=False)
+    payload = Column(LargeBinary, nullable=False)
+    stored_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, nullable=True)  # None for finished activities (kept forever)
+
+class GarminActivitySync(Base):
+    """Incremental activity sync state: newest start time seen for an account."""
+    __tablename__ = "garmin_activity_sync"
+
+    id = Column(Integer, primary_key=True, index=True)
+    garmin_email = Column(String, unique=True, index=True, nullable=False)
+    watermark = Column(String, nullable=True)  # startTimeGMT of the newest stored activity
+    last_synced_at = Column(DateTime, nullable=True)
+
+class GarminVo2Max(Base):
+    """Last resolved VO2 max / fitness age for an account, with where and when each value came from."""
+    __tablename__ = "garmin_vo2max"
+
+    id = Column(Integer, primary_key=True, index=True)
+    garmin_email = Column(String, unique=True, index=True, nullable=False)
+    data = Column(JSON)  # {vo2Max, vo2MaxValue, vo2MaxPrecise, fitnessAge}
+    vo2_source = Column(String, nullable=True)  # e.g. "training_status", "max_metrics"
+    vo2_date = Column(String, nullable=True)  # Date the VO2 max value was measured for
+    fitness_age_source = Column(String, nullable=True)
+    resolved_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    refresh_attempted_at = Column(DateTime, nullable=True)  # Last background re-resolve (UTC), at most one per day
+
+class GarminEndpointHealth(Base):
+    """Observed health of one variant of a Garmin endpoint with fallbacks (e.g. schedule_workout/v3)."""
+    __tablename__ = "garmin_endpoint_health"
+    __table_args__ = (UniqueConstraint("endpoint_group", "variant", name="uq_garmin_endpoint_variant"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    endpoint_group = Column(String, index=True, nullable=False)
+    variant = Column(String, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    successes = Column(Integer, default=0, nullable=False)
+    consecutive_failures = Column(Integer, default=0, nullable=False)
+    score = Column(Float, default=1.0, nullable=False)  # Moving success score, 0-1
+    latency_ms = Column(Float, nullable=True)  # Moving average of successful calls
+    dead_until = Column(DateTime, nullable=True)  # Skipped until then; probed again afterwards
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+class WorkoutSyncJob(Base):
+    """Background job that creates, schedules and sends a workout to Garmin; polled by the client."""
+    __tablename__ = "workout_sync_jobs"
+
+    id = Column(String, primary_key=True, index=True)  # uuid4 hex, returned as jobId
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True, nullable=False)
+    dedupe_key = Column(String, unique=True, index=True, nullable=False)  # sha256(user, workout, device, day)
+    status = Column(String, default="queued", nullable=False)  # queued, running, succeeded, failed
+    step = Column(String, nullable=True)  # creating, scheduling, sending, saving, done
+    progress = Column(Integer, default=0, nullable=False)  # 0-100
+    result = Column(JSON, nullable=True)  # {workoutId, scheduled, sentToDevice, message}
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+class DailyMetricsSchedule(Base):
+    """A user's typical first /daily-metrics access (UTC minute of day), kept up to date as accesses are recorded."""
+    __tablename__ = "daily_metrics_schedule"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), unique=True, nullable=False)
+    typical_minute = Column(Integer, index=True, nullable=True)  # None until there is enough history
+    last_access_day = Column(String, nullable=True)  # UTC date of the latest recorded first access, ISO format
+
+class DailyMetricsPrewarmClaim(Base):
+    """A worker's claim to pre-warm one user's daily metrics on one day; the unique key lets only one worker win."""
+    __tablename__ = "daily_metrics_prewarm_claims"
+    __table_args__ = (UniqueConstraint("user_id", "day", name="uq_daily_metrics_prewarm_claim"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    day = Column(String, index=True, nullable=False)  # UTC date, ISO format
+    claimed_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+class AdviceCacheEntry(Base):
+    """Generated daily advice, keyed by a fingerprint of the inputs it was generated from."""
+    __tablename__ = "ai_advice_cache"
+
+    id = Column(Integer, primary_key=True, index=True)
+    fingerprint = Column(String, unique=True, index=True, nullable=False)  # sha256 of the normalized inputs
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True, nullable=False)
+    value = Column(String, nullable=False)  # Advice JSON string as returned by CoachBrain
+    expires_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
 class PromoCode(Base):
     __tablename__ = "promo_codes"
 
@@ -1,4 +1,5 @@
 import os
+import asyncio
 import requests
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from sqlalchemy.orm import Session
@@ -205,8 +206,20 @@ def get_current_user_info(current_user: User = Depends(get_current_user)):
         "subscription_status": getattr(current_user, 'subscription_status', 'inactive')
     }
 
+def _save_garmin_credentials(db: Session, user: User, garmin_email, encrypted_password):
+    """Store a connected Garmin account on the user (run in a worker thread from async handlers)."""
+    user.garmin_email = garmin_email
+    user.garmin_password = encrypted_password
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+
+    # (Re)connected account: start from fresh Garmin data
+    from backend.services.garmin_cache import GARMIN_CACHE
+    GARMIN_CACHE.invalidate(garmin_email)
+
 @router.post("/connect-garmin")
-def connect_garmin_account(
+async def connect_garmin_account(
     garmin_data: GarminConnectRequest, 
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -215,7 +228,7 @@ def connect_garmin_account(
     
     try:
         client = GarminClient(garmin_data.garmin_email, garmin_data.garmin_password, user_id=current_user.id)
-        success, login_status, error_msg = client.login(db=db)
+        success, login_status, error_msg = await client.login_async(db=db)
         
         if not success:
             if login_status == "MFA_REQUIRED":
@@ -233,18 +246,14 @@ def connect_garmin_account(
         raise HTTPException(status_code=400, detail=f"Failed to connect to Garmin: {str(e)}")
         
     # Login succeeded without MFA — save credentials
-    current_user.garmin_email = garmin_data.garmin_email
-    current_user.garmin_password = encrypt_garmin_password(garmin_data.garmin_password)
-    
-    db.add(current_user)
-    db.commit()
-    db.refresh(current_user)
+    await asyncio.to_thread(_save_garmin_credentials, db, current_user, garmin_data.garmin_email,
+                            encrypt_garmin_password(garmin_data.garmin_password))
     
     return {"status": "SUCCESS", "message": "Garmin account connected successfully"}
 
 
 @router.post("/connect-garmin/mfa")
-def connect_garmin_mfa(
+async def connect_garmin_mfa(
     mfa_data: GarminMFARequest,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -254,24 +263,18 @@ def connect_garmin_mfa(
     
     try:
         client = GarminClient(mfa_data.garmin_email, user_id=current_user.id)
-        success, login_status, error_msg = client.login(db=db, mfa_code=mfa_data.mfa_code)
+        success, login_status, error_msg = await client.login_async(db=db, mfa_code=mfa_data.mfa_code)
         
         if not success:
             raise HTTPException(status_code=400, detail=f"MFA verification failed: {error_msg}")
         
         # MFA succeeded — save credentials
-        # We need the password too; it's stored in the PENDING_SESSION's GarminClient
-        current_user.garmin_email = mfa_data.garmin_email
-        # The password was already set during the initial /connect-garmin call
-        # Retrieve it from the client if available
-        if client.password and client.password != "session_restore_placeholder":
-            current_user.garmin_password = encrypt_garmin_password(client.password)
-        else:
+        # We need the password too; the pending LoginSession kept it from the initial
+        # /connect-garmin call and login_async() put it back on the client
+        if not client.password or client.password == "session_restore_placeholder":
             raise HTTPException(status_code=400, detail="MFA verification failed: Garmin password is lost from session.")
-        
-        db.add(current_user)
-        db.commit()
-        db.refresh(current_user)
+        await asyncio.to_thread(_save_garmin_credentials, db, current_user, mfa_data.garmin_email,
+                                encrypt_garmin_password(client.password))
         
         return {"status": "SUCCESS", "message": "Garmin account connected successfully"}
         
@@ -283,8 +286,13 @@ def connect_garmin_mfa(
 @router.delete("/me")
 def delete_current_user(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     try:
+        garmin_email = current_user.garmin_email
         db.delete(current_user)
         db.commit()
+        if garmin_email:
+            # Don't keep the deleted user's Garmin data around in the response cache
+            from backend.services.garmin_cache import GARMIN_CACHE
+            GARMIN_CACHE.invalidate(garmin_email)
         return {"status": "SUCCESS", "message": "Account deleted successfully"}
     except Exception as e:
         db.rollback()
@@ -1,8 +1,10 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from pydantic import BaseModel
 from typing import List, Optional, Dict
-from backend.services.coach_brain import CoachBrain
-import os
+from backend.utils import sse_event, sse_response
+from backend.auth_utils import get_current_user, is_user_premium
+from backend.services.ai_rate_limiter import request_priority
+from backend.models import User
 import logging
 
 router = APIRouter()
@@ -18,20 +20,39 @@ class ChatRequest(BaseModel):
     language: str = "en"
 
 @router.post("/")
-async def chat_with_coach(request: ChatRequest):
+async def chat_with_coach(payload: ChatRequest, request: Request):
     try:
-        gemini_key = os.getenv("GEMINI_API_KEY")
-        if not gemini_key:
-            raise HTTPException(status_code=500, detail="Gemini API Key not configured.")
-        
-        brain = CoachBrain()
+        # The app-wide brain keeps its prompt prefix cache between requests
+        brain = request.app.state.brain
         
         # Convert Pydantic models to dicts for the brain service
-        messages_dicts = [msg.model_dump() for msg in request.messages]
+        messages_dicts = [msg.model_dump() for msg in payload.messages]
         
-        response_text = brain.generate_chat_response(messages_dicts, request.user_context, request.language)
+        response_text = await brain.generate_chat_response_async(messages_dicts, payload.user_context, payload.language)
         
         return {"response": response_text}
     except Exception as e:
         logger.error(f"Error in chat endpoint: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/stream")
+async def stream_chat_with_coach(payload: ChatRequest, request: Request, current_user: User = Depends(get_current_user)):
+    """
+    Chat over Server-Sent Events: `delta` events ({text}) as the reply is written,
+    then `done` ({response}) with the full reply, or `error` ({message}).
+    """
+    brain = request.app.state.brain
+    messages_dicts = [msg.model_dump() for msg in payload.messages]
+    priority = request_priority(premium=is_user_premium(current_user))
+
+    async def events():
+        async for event, data in brain.stream_chat_response(messages_dicts, payload.user_context, payload.language,
+                                                            user_key=current_user.id, priority=priority):
+            if event == "delta":
+                yield sse_event("delta", {"text": data})
+            elif event == "done":
+                yield sse_event("done", {"response": data})
+            else:
+                yield sse_event("error", {"message": data})
+
+    return sse_response(events())
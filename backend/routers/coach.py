@@ -1,13 +1,22 @@
 from fastapi import APIRouter, HTTPException, Depends
 from backend.services.garmin_client import GarminClient
-from backend.services.data_processor import DataProcessor
+from backend.services.garmin_async_client import AsyncGarminClient
+from backend.services.activity_store import ACTIVITY_STORE
+from backend.services.workout_sync_jobs import WORKOUT_SYNC_JOBS
+from backend.services.daily_metrics import (
+    DAILY_METRICS_PREWARMER,
+    DAILY_METRICS_CACHE_KEY,
+    DAILY_METRICS_CACHE_TTL,
+    build_daily_metrics,
+    store_daily_metrics,
+)
 from backend.services.coach_brain import CoachBrain
 from backend.database import get_db
 from backend.auth_utils import create_access_token
 from sqlalchemy.orm import Session
 import os
 from datetime import date
-from backend.utils import sanitize_for_json
+from backend.utils import sanitize_for_json, sse_event, sse_response
 import traceback
 import logging
 import asyncio
@@ -21,7 +30,8 @@ logger = logging.getLogger(__name__)
 
 from pydantic import BaseModel
 from backend.routers.settings import load_settings
-from backend.auth_utils import get_current_user, decrypt_garmin_password
+from backend.auth_utils import get_current_user, decrypt_garmin_password, is_user_premium
+from backend.services.ai_rate_limiter import request_priority
 from backend.models import User
 from datetime import datetime
 from typing import Optional
@@ -42,22 +52,24 @@ async def get_daily_metrics(
             raise HTTPException(status_code=400, detail="GARMIN_NOT_CONNECTED")
             
         decrypted_pass = decrypt_garmin_password(current_user.garmin_password)
-        client = GarminClient(current_user.garmin_email, decrypted_pass)
+        client = GarminClient(current_user.garmin_email, decrypted_pass, user_id=current_user.id)
         
+        # Learn when this user usually opens the app so the cache can be pre-warmed
+        await asyncio.to_thread(DAILY_METRICS_PREWARMER.record_access, db, current_user.id)
+
         # 0. Check DB Cache first (TTL: 15 minutes)
-        import time
         from backend.models import UserSetting
         
         setting = db.query(UserSetting).filter(
             UserSetting.user_id == current_user.id,
-            UserSetting.key == "cache_daily_metrics"
+            UserSetting.key == DAILY_METRICS_CACHE_KEY
         ).first()
 
         force_refresh = payload.force_refresh if hasattr(payload, 'force_refresh') else False
         if setting and setting.value and not force_refresh:
             cached_data = setting.value
             timestamp = cached_data.get("timestamp", 0)
-            if time.time() - timestamp < 900:  # 15 minutes
+            if time.time() - timestamp < DAILY_METRICS_CACHE_TTL:
                 # Validate cache quality — discard if health data was empty (captured during an error state)
                 cached_health = cached_data.get("data", {}).get("metrics", {}).get("health", {})
                 health_is_stale = (
@@ -88,9 +100,8 @@ async def get_daily_metrics(
                 else:
                     logger.warning(f"Cache for {current_user.email} has empty health data — forcing fresh fetch")
         
-        # Pass DB session to login for persistence
-        # We run login in a thread since it's synchronous
-        success, status, error_msg = await asyncio.to_thread(client.login, db)
+        # Pass DB session to login for persistence; an SSO login is awaited, not waited on in a thread
+        success, status, error_msg = await client.login_async(db)
         
         if not success:
              logger.warning(f"Login failed: {status} - {error_msg}")
@@ -102,45 +113,16 @@ async def get_daily_metrics(
                  
              raise HTTPException(status_code=401, detail=f"Garmin auth failed: {error_msg}")
              
-        processor = DataProcessor()
-        
-        # 1. Fetch Data Concurrently
-        # Reduced from 30 down to 10 activities to drastically improve login speed.
-        activities_task = asyncio.to_thread(client.get_activities, 60)
-        health_stats_task = asyncio.to_thread(client.get_health_stats)
-        sleep_data_task = asyncio.to_thread(client.get_sleep_data)
-        profile_task = asyncio.to_thread(client.get_profile)
-        vo2_max_task = asyncio.to_thread(client.get_vo2_max)
-        
-        activities, health_stats, sleep_data, profile, vo2_max_data = await asyncio.gather(
-            activities_task, health_stats_task, sleep_data_task, profile_task, vo2_max_task
-        )
-        
-        # Merge VO2 max data into profile if available
-        if vo2_max_data and profile:
-            profile.update(vo2_max_data)
-            
-        # 2. Process Data for summary block
-        processed_activities = processor.process_activities(activities)
-        activities_summary_dict = processor.calculate_weekly_summary(processed_activities)
-        
-        # Filter for TODAY'S activities (Timezone-Aware)
-        todays_activities = []
-        if processed_activities:
-            if payload.client_local_time:
-                try:
-                    cleaned_time = payload.client_local_time.replace('Z', '+00:00')
-                    client_dt = datetime.fromisoformat(cleaned_time)
-                    today = client_dt.date()
-                except (ValueError, AttributeError):
-                    today = date.today()
-            else:
-                today = date.today()
-                
-            today_str = today.isoformat()
-            todays_activities = [row for row in processed_activities if row.get('date', '').startswith(today_str)]
+        today = date.today()
+        if payload.client_local_time:
+            try:
+                cleaned_time = payload.client_local_time.replace('Z', '+00:00')
+                today = datetime.fromisoformat(cleaned_time).date()
+            except (ValueError, AttributeError):
+                pass
 
-        # Sanitize helpers
+        # 1. Fetch and assemble (timezone-aware "today" for today's activities)
+        cleaned_response = await build_daily_metrics(AsyncGarminClient(client), today)
 
         # Only refresh token if less than 24 hours remain
         needs_refresh = False
@@ -155,30 +137,9 @@ async def get_daily_metrics(
             except JWTError:
                 needs_refresh = True
 
-        response_data = {
-            "metrics": {
-                "health": health_stats,
-                "sleep": sleep_data,
-                "weekly_volume": activities_summary_dict,
-                "recent_activities": activities,
-                "profile": profile
-            },
-            "todays_activities": todays_activities # Pass down for the AI to use later
-        }
-        
-        cleaned_response = sanitize_for_json(response_data)
-        
         # Save payload to DB cache
-        try:
-            if not setting:
-                setting = UserSetting(user_id=current_user.id, key="cache_daily_metrics")
-                db.add(setting)
-            setting.value = {"timestamp": time.time(), "data": cleaned_response}
-            db.commit()
+        if store_daily_metrics(db, current_user.id, cleaned_response, setting):
             logger.info(f"Saved /daily-metrics to DB cache for {current_user.email}")
-        except Exception as cache_err:
-            logger.error(f"Failed to save metrics cache: {cache_err}")
-            db.rollback()
         
         if needs_refresh:
             cleaned_response["access_token"] = create_access_token(data={"sub": current_user.email})
@@ -208,6 +169,53 @@ class AIAdviceRequest(BaseModel):
     language: Optional[str] = None  # Add explicit language parameter
     client_local_time: Optional[str] = None
 
+def _advice_settings(current_user, payload):
+    """The user's personalization settings, with the payload's explicit language applied."""
+    settings = load_settings(current_user.email)
+    user_settings_dict = settings.model_dump()
+    if payload.language:
+        user_settings_dict['language'] = payload.language
+    return user_settings_dict
+
+def _advice_kwargs(payload, current_user):
+    return dict(
+        client_local_time=payload.client_local_time,
+        available_time_mins=payload.available_time_mins,
+        selected_sports=payload.selected_sports,
+        sport_durations=payload.sport_durations,
+        user_key=current_user.id,
+        priority=request_priority(premium=is_user_premium(current_user))
+    )
+
+def _parse_advice(raw_advice):
+    """Split the JSON string from Gemini into (advice_text, workout)."""
+    try:
+        parsed_advice = json.loads(raw_advice)
+        return parsed_advice.get("advice_text", raw_advice), parsed_advice.get("workout", None)
+    except json.JSONDecodeError as e:
+        logger.warning(f"Failed to parse advice JSON, returning raw text: {e}")
+        return raw_advice, None
+
+def _save_daily_briefing(user_id, advice_text, workout):
+    """Save the generated advice to DB for the Telegram bot to read."""
+    try:
+        from backend.models import UserSetting
+        db = next(get_db())
+        briefing_key = "cache_daily_briefing"
+        setting = db.query(UserSetting).filter(
+            UserSetting.user_id == user_id,
+            UserSetting.key == briefing_key
+        ).first()
+        
+        save_payload = {"advice": advice_text, "workout": workout}
+        if not setting:
+            setting = UserSetting(user_id=user_id, key=briefing_key)
+            db.add(setting)
+        setting.value = save_payload
+        db.commit()
+    except Exception as cache_err:
+        logger.error(f"Failed to save daily briefing cache: {cache_err}")
+
 @router.post("/generate-advice")
 async def generate_advice(
     request: Request,
@@ -218,16 +226,10 @@ async def generate_advice(
         brain = request.app.state.brain
         
         # Load user personalization
-        settings = load_settings(current_user.email)
-        user_settings_dict = settings.model_dump()
-        
-        # Override language if provided explicitly in the payload
-        if payload.language:
-            user_settings_dict['language'] = payload.language
+        user_settings_dict = _advice_settings(current_user, payload)
         
         # 3. AI Generation (Offloaded to second request)
-        raw_advice = await asyncio.to_thread(
-            brain.generate_daily_advice,
+        raw_advice = await brain.generate_daily_advice_async(
             payload.profile, 
             payload.activities_summary_dict, 
             payload.health_stats, 
@@ -235,40 +237,11 @@ async def generate_advice(
             user_settings_dict, 
             payload.todays_activities,
             payload.recent_activities,
-            client_local_time=payload.client_local_time,
-            available_time_mins=payload.available_time_mins,
-            selected_sports=payload.selected_sports,
-            sport_durations=payload.sport_durations
+            **_advice_kwargs(payload, current_user)
         )
         
-        # Parse the JSON string from Gemini
-        try:
-            parsed_advice = json.loads(raw_advice)
-            advice_text = parsed_advice.get("advice_text", raw_advice)
-            workout = parsed_advice.get("workout", None)
-        except json.JSONDecodeError as e:
-            logger.warning(f"Failed to parse advice JSON, returning raw text: {e}")
-            advice_text = raw_advice
-            workout = None
-
-        # Save the generated advice to DB for Telegram Bot to read
-        try:
-            from backend.models import UserSetting
-            db = next(get_db())
-            briefing_key = "cache_daily_briefing"
-            setting = db.query(UserSetting).filter(
-                UserSetting.user_id == current_user.id,
-                UserSetting.key == briefing_key
-            ).first()
-            
-            save_payload = {"advice": advice_text, "workout": workout}
-            if not setting:
-                setting = UserSetting(user_id=current_user.id, key=briefing_key)
-                db.add(setting)
-            setting.value = save_payload
-            db.commit()
-        except Exception as cache_err:
-            logger.error(f"Failed to save daily briefing cache: {cache_err}")
+        advice_text, workout = _parse_advice(raw_advice)
+        await asyncio.to_thread(_save_daily_briefing, current_user.id, advice_text, workout)
 
         return {
             "advice": advice_text,
@@ -280,87 +253,83 @@ async def generate_advice(
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
-from backend.routers.dashboard import get_garmin_client
+@router.post("/generate-advice/stream")
+async def stream_advice(
+    request: Request,
+    payload: AIAdviceRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    /generate-advice as Server-Sent Events: `delta` events ({text}) carry the advice text as
+    Gemini writes it, then `workout` ({workout}, null on rest days) once the JSON is complete and
+    `done` ({advice, workout}). A failure ends the stream with `error` ({message}).
+    """
+    brain = request.app.state.brain
+    try:
+        user_settings_dict = _advice_settings(current_user, payload)
+    except Exception as e:
+        logger.error(f"Error loading settings for streamed advice: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def events():
+        async for event, data in brain.stream_daily_advice(
+            payload.profile,
+            payload.activities_summary_dict,
+            payload.health_stats,
+            payload.sleep_data,
+            user_settings_dict,
+            payload.todays_activities,
+            payload.recent_activities,
+            **_advice_kwargs(payload, current_user)
+        ):
+            if event == "delta":
+                yield sse_event("delta", {"text": data})
+            elif event == "done":
+                advice_text, workout = _parse_advice(data)
+                yield sse_event("workout", {"workout": workout})
+                await asyncio.to_thread(_save_daily_briefing, current_user.id, advice_text, workout)
+                yield sse_event("done", {"advice": advice_text, "workout": workout})
+            else:
+                yield sse_event("error", {"message": _parse_advice(data)[0]})
+
+    return sse_response(events())
+
+from backend.routers.dashboard import get_async_garmin_client
 from typing import Optional, Union
 
 class WorkoutSyncRequest(BaseModel):
     workout: dict
     deviceId: Optional[Union[str, int]] = None
 
-@router.post("/sync")
+@router.post("/sync", status_code=202)
 async def sync_workout_to_watch(
     request: WorkoutSyncRequest,
-    client: GarminClient = Depends(get_garmin_client)
+    client: AsyncGarminClient = Depends(get_async_garmin_client),
+    current_user: User = Depends(get_current_user)
 ):
     """
-    Send AI-generated workout to Garmin Connect and schedule it for today.
+    Queue sending an AI-generated workout to Garmin Connect (scheduled for today).
+    Returns a job ID immediately; poll GET /sync/{jobId} for progress.
     """
-    try:
-        workout = request.workout
-        device_id = request.deviceId
-        
-        if not workout:
-            raise HTTPException(status_code=400, detail="No workout data provided")
-        
-        logger.info(f"Received workout sync request: {workout.get('workoutName', 'Unnamed')} for device: {device_id}")
-        
-        # 1. Create Workout in Garmin Connect (Async wrapper around blocking call)
-        try:
-            created_workout = await asyncio.to_thread(client.create_workout, workout)
-            workout_id = created_workout.get("workoutId")
-        except Exception as e:
-            logger.error(f"Failed to create workout: {e}")
-            raise HTTPException(status_code=500, detail=f"Failed to save workout to Garmin Connect: {e}")
-            
-        if not workout_id:
-            raise HTTPException(status_code=500, detail="Failed to retrieve workout ID after creation")
-            
-        # 2. Schedule Workout for Today (non-fatal - workout is already saved if this fails)
-        today_str = date.today().isoformat()
-        scheduled = False
-        try:
-            scheduled = await asyncio.to_thread(client.schedule_workout, workout_id, today_str)
-        except Exception as sched_err:
-            logger.warning(f"Could not schedule workout on calendar (non-fatal): {sched_err}")
-        
-        # 3. Queue for specific device (if provided)
-        if device_id:
-            try:
-                await asyncio.to_thread(client.send_workout_to_device, workout_id, device_id)
-            except Exception as dev_err:
-                logger.warning(f"Could not send workout to device (non-fatal): {dev_err}")
-            
-        # 4. Save to DB for our custom Garmin Watch App
-        try:
-            from backend.database import SessionLocal
-            from backend.models import UserSetting
-            db = SessionLocal()
-            try:
-                setting = db.query(UserSetting).filter(UserSetting.key == "last_synced_workout").first()
-                if not setting:
-                    setting = UserSetting(key="last_synced_workout", value=workout)
-                    db.add(setting)
-                else:
-                    setting.value = workout
-                db.commit()
-            except Exception as db_err:
-                logger.error(f"Could not save workout to DB: {db_err}")
-            finally:
-                db.close()
-        except Exception as e:
-            logger.error(f"Failed setting up db session for workout cache: {e}")
+    workout = request.workout
+    device_id = request.deviceId
 
-        msg = "Workout saved and scheduled for today." if scheduled else "Workout saved to Garmin Connect. Calendar scheduling unavailable - open the Garmin Connect app to see it."
-        return {
-            "status": "success", 
-            "message": msg,
-            "workoutId": workout_id,
-            "scheduled": scheduled
-        }
-        
-    except HTTPException as he:
-        raise he
+    if not workout:
+        raise HTTPException(status_code=400, detail="No workout data provided")
+
+    logger.info(f"Received workout sync request: {workout.get('workoutName', 'Unnamed')} for device: {device_id}")
+    try:
+        job, deduplicated = await WORKOUT_SYNC_JOBS.submit(current_user.id, client, workout, device_id)
     except Exception as e:
-        logger.error(f"Error syncing workout: {e}")
+        logger.error(f"Error queueing workout sync: {e}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
+    return {**job, "deduplicated": deduplicated}
+
+@router.get("/sync/{job_id}")
+async def get_workout_sync_job(job_id: str, current_user: User = Depends(get_current_user)):
+    """Status of a workout sync job: status (queued/running/succeeded/failed), step, progress and result."""
+    job = await WORKOUT_SYNC_JOBS.get(current_user.id, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Sync job not found")
+    return job
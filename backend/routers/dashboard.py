@@ -1,13 +1,17 @@
 from fastapi import APIRouter, HTTPException, Depends, Request
-from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from backend.services.garmin_client import GarminClient
+from backend.services.garmin_async_client import AsyncGarminClient
+from backend.services.activity_store import ACTIVITY_STORE
+from backend.services.activity_streams import downsample_streams, DOWNSAMPLE_METHODS
 from backend.services.coach_brain import CoachBrain
 from backend.routers.settings import load_settings
 from backend.database import get_db
-from backend.auth_utils import get_current_user, decrypt_garmin_password
+from backend.auth_utils import get_current_user, decrypt_garmin_password, is_user_premium
+from backend.services.ai_rate_limiter import request_priority
 from backend.models import User
-from backend.utils import sanitize_for_json
+from backend.utils import sanitize_for_json, sse_event, sse_response
 import os
 import traceback
 import logging
@@ -47,7 +51,7 @@ async def get_garmin_client(
     # Attempt to authenticate/resume session from DB
     try:
         logger.info("Attempting to authenticate from DB session...")
-        success, status, msg = await asyncio.to_thread(client.login, db=db)
+        success, status, msg = await client.login_async(db=db)
         logger.info(f"Authentication result: success={success}, status={status}")
     except Exception as e:
         logger.error(f"Exception during authentication: {e}")
@@ -80,22 +84,27 @@ async def get_garmin_client(
     request.state.garmin_client = client
     return client
 
+async def get_async_garmin_client(client: GarminClient = Depends(get_garmin_client)) -> AsyncGarminClient:
+    """
+    Authenticated Garmin client whose data calls are awaitable (no executor threads).
+    """
+    return AsyncGarminClient(client)
+
 @router.get("/summary")
-async def get_daily_summary(client: GarminClient = Depends(get_garmin_client)):
+async def get_daily_summary(client: AsyncGarminClient = Depends(get_async_garmin_client)):
     try:
         today = date.today().isoformat()
-        # client.client is the internal Garmin object
-        stats = await asyncio.to_thread(client.client.get_user_summary, today)
+        stats = await client.get_user_summary(today)
         return sanitize_for_json(stats)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/profile")
-async def get_user_profile(client: GarminClient = Depends(get_garmin_client)):
+async def get_user_profile(client: AsyncGarminClient = Depends(get_async_garmin_client)):
     """Fetch user profile including VO2 max and other metrics"""
     try:
         logger.info("Fetching user profile from Garmin...")
-        profile = await asyncio.to_thread(client.get_profile)
+        profile = await client.get_profile()
         logger.info(f"Profile fetched successfully: {type(profile)}")
         
         if not profile:
@@ -106,7 +115,7 @@ async def get_user_profile(client: GarminClient = Depends(get_garmin_client)):
         
         # Fetch VO2 Max data separately using get_max_metrics()
         try:
-            vo2_data = await asyncio.to_thread(client.get_vo2_max)
+            vo2_data = await client.get_vo2_max()
             if vo2_data:
                 # Merge all VO2 Max fields into profile for maximum compatibility
                 logger.info(f"Merging VO2 Max data into profile: {vo2_data}")
@@ -125,9 +134,9 @@ async def get_user_profile(client: GarminClient = Depends(get_garmin_client)):
         raise HTTPException(status_code=500, detail=f"Failed to fetch profile: {str(e)}")
 
 @router.get("/activities")
-async def get_recent_activities(limit: int = 5, client: GarminClient = Depends(get_garmin_client)):
+async def get_recent_activities(limit: int = 5, client: AsyncGarminClient = Depends(get_async_garmin_client)):
     try:
-        activities = await asyncio.to_thread(client.get_activities, limit)
+        activities = await ACTIVITY_STORE.get_recent(client, limit)
         return sanitize_for_json(activities)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -136,57 +145,55 @@ async def get_recent_activities(limit: int = 5, client: GarminClient = Depends(g
 async def get_activity_details(
     request: Request,
     activity_id: int, 
-    client: GarminClient = Depends(get_garmin_client),
+    components: str = "summary,splits,high_res",
+    analyze: bool = True,
+    client: AsyncGarminClient = Depends(get_async_garmin_client),
     current_user: User = Depends(get_current_user)
 ):
-    logger.info(f"Fetching activity details for {activity_id}")
+    logger.info(f"Fetching activity details for {activity_id} ({components})")
     analysis = None
     details = None
     
     try:
-        # 1. Fetch details from Garmin
-        details = await asyncio.to_thread(client.get_activity_details, activity_id)
+        # 1. Fetch details (served from the activity details store once fetched)
+        wanted = tuple(c.strip() for c in components.split(",") if c.strip())
+        details = await client.get_activity_details(activity_id, components=wanted)
         
         if not details:
             logger.warning(f"Activity {activity_id} not found in Garmin.")
             raise HTTPException(status_code=404, detail="Activity not found")
         
-        # DEBUG: Log the structure to see actual field names
-        logger.info(f"Activity details keys: {list(details.keys())[:20]}")  # First 20 keys
-        if 'summaryDTO' in details:
-            logger.info(f"summaryDTO keys: {list(details['summaryDTO'].keys())[:20]}")
-            
-        # Clean potential NaNs which break JSON serialization
-        try:
-            details = sanitize_for_json(details)
-        except Exception as e:
-            logger.error(f"Error cleaning NaNs from details: {e}")
-            # Continue with original details if cleaning fails
-            
+        # Components are sanitized (NaN-free) before they are stored, so no cleaning pass here
+
         # 2. AI Analysis - wrapped in try-catch to return partial data if it fails
-        try:
-            logger.info("Starting AI Analysis...")
-            brain = request.app.state.brain
-            
-            user_settings_dict = {}
+        if analyze:
             try:
-                settings = await asyncio.to_thread(load_settings, current_user.email)
-                user_settings_dict = settings.model_dump()
-            except Exception as se:
-                logger.warning(f"Failed to load settings: {se}")
+                logger.info("Starting AI Analysis...")
+                brain = request.app.state.brain
             
-            analysis = await asyncio.to_thread(brain.analyze_activity, details, user_settings_dict)
-            logger.info("AI analysis completed successfully")
-        except Exception as ai_error:
-            logger.error(f"AI analysis failed but continuing with activity data: {ai_error}")
-            analysis = f"Activity analysis temporarily unavailable. Please try again later."
+                user_settings_dict = {}
+                try:
+                    settings = await asyncio.to_thread(load_settings, current_user.email)
+                    user_settings_dict = settings.model_dump()
+                except Exception as se:
+                    logger.warning(f"Failed to load settings: {se}")
+            
+                analysis = await brain.analyze_activity_async(
+                    details, user_settings_dict,
+                    user_key=current_user.id, priority=request_priority(premium=is_user_premium(current_user))
+                )
+                logger.info("AI analysis completed successfully")
+            except Exception as ai_error:
+                logger.error(f"AI analysis failed but continuing with activity data: {ai_error}")
+                analysis = f"Activity analysis temporarily unavailable. Please try again later."
         
         response_data = {
             "details": details,
             "analysis": analysis
         }
         
-        return jsonable_encoder(response_data)
+        # Details are already JSON-ready; skip jsonable_encoder's walk over the large high_res stream
+        return JSONResponse(content=response_data)
         
     except HTTPException as he:
         raise he
@@ -195,8 +202,80 @@ async def get_activity_details(
         logger.error(f"Error fetching activity details: {error_trace}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch activity: {str(e)}")
 
+@router.get("/activities/{activity_id}/analysis/stream")
+async def stream_activity_analysis(
+    request: Request,
+    activity_id: int,
+    client: AsyncGarminClient = Depends(get_async_garmin_client),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    AI analysis of an activity over Server-Sent Events: `delta` events ({text}) as it is
+    written, then `done` ({analysis}) or `error` ({message}). Fetch the details themselves
+    with /details?analyze=false.
+    """
+    try:
+        details = await client.get_activity_details(activity_id, components=("summary", "splits"))
+    except Exception as e:
+        logger.error(f"Error fetching activity {activity_id} for analysis: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch activity: {str(e)}")
+    if not details:
+        raise HTTPException(status_code=404, detail="Activity not found")
+
+    user_settings_dict = {}
+    try:
+        settings = await asyncio.to_thread(load_settings, current_user.email)
+        user_settings_dict = settings.model_dump()
+    except Exception as se:
+        logger.warning(f"Failed to load settings: {se}")
+
+    brain = request.app.state.brain
+
+    async def events():
+        async for event, data in brain.stream_activity_analysis(
+            details, user_settings_dict,
+            user_key=current_user.id, priority=request_priority(premium=is_user_premium(current_user))
+        ):
+            if event == "delta":
+                yield sse_event("delta", {"text": data})
+            elif event == "done":
+                yield sse_event("done", {"analysis": data})
+            else:
+                yield sse_event("error", {"message": data})
+
+    return sse_response(events())
+
+@router.get("/activities/{activity_id}/streams")
+async def get_activity_streams(
+    activity_id: int,
+    points: int = 400,
+    method: str = "lttb",
+    channels: str = "heart_rate,pace,power,elevation",
+    client: AsyncGarminClient = Depends(get_async_garmin_client),
+):
+    """
+    Chart streams for an activity as compact parallel arrays, decimated to `points`
+    samples per channel (method: lttb, minmax, or raw for the original resolution).
+    """
+    if method not in DOWNSAMPLE_METHODS:
+        raise HTTPException(status_code=400, detail=f"method must be one of {', '.join(DOWNSAMPLE_METHODS)}")
+    points = min(max(points, 10), 5000)
+    try:
+        details = await client.get_activity_details(activity_id, components=("high_res",))
+        high_res = (details or {}).get("high_res")
+        if not high_res:
+            raise HTTPException(status_code=404, detail="No stream data for this activity")
+        wanted = [c.strip() for c in channels.split(",") if c.strip()]
+        streams = await asyncio.to_thread(downsample_streams, high_res, points, method, wanted)
+        return JSONResponse(content={"activityId": activity_id, **streams})
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error building streams for activity {activity_id}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/health-history")
-async def get_health_history(days: int = 7, client: GarminClient = Depends(get_garmin_client)):
+async def get_health_history(days: int = 7, client: AsyncGarminClient = Depends(get_async_garmin_client)):
     try:
         from datetime import timedelta
         history = []
@@ -204,29 +283,25 @@ async def get_health_history(days: int = 7, client: GarminClient = Depends(get_g
         
         # Limit days to prevent long waits
         days = min(days, 30)
-        
-        for i in range(days):
-            d = today - timedelta(days=i)
-            d_str = d.isoformat()
-            try:
-                # Run concurrently
-                stats_task = asyncio.to_thread(client.get_health_stats, d_str)
-                sleep_task = asyncio.to_thread(client.get_sleep_data, d_str)
-                
-                stats, sleep = await asyncio.gather(stats_task, sleep_task)
-                
-                day_data = {
-                    "date": d_str,
-                    "resting_hr": stats.get('restingHeartRate') if stats else None,
-                    "max_hr": stats.get('maxHeartRate') if stats else None,
-                    "stress": stats.get('averageStressLevel') if stats else None,
-                    "body_battery_max": stats.get('bodyBatteryLargestChargedValue') if stats else None,
-                    "sleep_seconds": sleep.get('dailySleepDTO', {}).get('sleepTimeSeconds') if sleep and sleep.get('dailySleepDTO') else None,
-                    "sleep_score": sleep.get('dailySleepDTO', {}).get('sleepScore') if sleep and sleep.get('dailySleepDTO') else None
-                }
-                history.append(sanitize_for_json(day_data))
-            except Exception as e:
-                logger.warning(f"Failed to fetch stats for {d_str}: {e}")
+        start = today - timedelta(days=days - 1)
+
+        # Whole window at once: one summary per day (closed days cached forever) + ranged sleep scores
+        summaries, sleep_scores = await asyncio.gather(
+            client.get_daily_summaries(start, today),
+            client.get_sleep_scores(start, today)
+        )
+
+        for d_str, stats in summaries.items():
+            day_data = {
+                "date": d_str,
+                "resting_hr": stats.get('restingHeartRate') if stats else None,
+                "max_hr": stats.get('maxHeartRate') if stats else None,
+                "stress": stats.get('averageStressLevel') if stats else None,
+                "body_battery_max": (stats.get('bodyBatteryLargestChargedValue') or stats.get('bodyBatteryHighestValue')) if stats else None,
+                "sleep_seconds": stats.get('sleepingSeconds') if stats else None,
+                "sleep_score": sleep_scores.get(d_str)
+            }
+            history.append(sanitize_for_json(day_data))
                 
         # Return oldest to newest for charts
         return sorted(history, key=lambda x: x['date'])
@@ -1,9 +1,20 @@
 from fastapi import APIRouter, HTTPException, Depends, Request
 from datetime import date
-from backend.services.garmin_client import GarminClient
-from backend.routers.dashboard import get_garmin_client
+from typing import Optional
+from backend.services.garmin_async_client import AsyncGarminClient
+from backend.services.garmin_client import SESSION_REGISTRY
+from backend.services.garmin_singleflight import SINGLE_FLIGHT
+from backend.services.garmin_cache import GARMIN_CACHE
+from backend.services.garmin_rate_governor import RATE_GOVERNOR
+from backend.services.daily_metrics import DAILY_METRICS_PREWARMER
+from backend.services.endpoint_health import ENDPOINT_HEALTH
+from backend.services.garmin_egress import GARMIN_EGRESS
+from backend.services.ai_rate_limiter import AI_RATE_LIMITER
+from backend.services.advice_cache import ADVICE_CACHE
+from backend.services.prompt_context import PROMPT_STATS
+from backend.routers.dashboard import get_async_garmin_client
 from backend.database import get_db
-from backend.auth_utils import get_current_user
+from backend.auth_utils import get_current_user, get_admin_user
 from backend.models import User, UserSetting
 from sqlalchemy.orm import Session
 import time
@@ -18,11 +29,37 @@ router = APIRouter()
 
 import asyncio
 
+@router.get("/fetch-stats")
+def get_fetch_stats(request: Request, current_user: User = Depends(get_admin_user)):
+    """Admin only. Per-worker Garmin fetch counters: coalesced calls, response cache, rate governor, session cache, pre-warm usage, endpoint health, egress proxies, the AI request queue, the advice cache, AI prompt sizes and the prompt prefix cache."""
+    return {
+        "single_flight": SINGLE_FLIGHT.stats(),
+        "rate_governor": RATE_GOVERNOR.stats(),
+        "response_cache": GARMIN_CACHE.stats(),
+        "sessions": SESSION_REGISTRY.stats(),
+        "daily_metrics_prewarm": DAILY_METRICS_PREWARMER.stats(),
+        "endpoint_health": ENDPOINT_HEALTH.stats(),
+        "egress": GARMIN_EGRESS.stats(),
+        "ai_rate_limiter": AI_RATE_LIMITER.stats(),
+        "advice_cache": ADVICE_CACHE.stats(),
+        "prompt_sizes": PROMPT_STATS.stats(),
+        "prompt_prefix_cache": request.app.state.brain.prompt_cache.stats(),
+    }
+
+@router.delete("/cache")
+async def invalidate_garmin_cache(garmin_email: Optional[str] = None, current_user: User = Depends(get_admin_user)):
+    """Admin only. Forget cached Garmin responses for an account (default: the admin's own); next requests hit Garmin."""
+    garmin_email = garmin_email or current_user.garmin_email
+    if not garmin_email:
+        raise HTTPException(status_code=400, detail="GARMIN_NOT_CONNECTED")
+    await asyncio.to_thread(GARMIN_CACHE.invalidate, garmin_email)
+    return {"status": "success"}
+
 @router.get("/devices")
-async def get_devices(client: GarminClient = Depends(get_garmin_client)):
+async def get_devices(client: AsyncGarminClient = Depends(get_async_garmin_client)):
     """Fetch available Garmin devices."""
     try:
-        devices = await asyncio.to_thread(client.get_devices)
+        devices = await client.get_devices()
         return devices
     except Exception as e:
         logger.error(f"Error fetching devices: {e}")
@@ -31,42 +68,13 @@ async def get_devices(client: GarminClient = Depends(get_garmin_client)):
 @router.get("/stats/yearly")
 async def get_yearly_stats(
     years: int = 5,
-    client: GarminClient = Depends(get_garmin_client),
-    db: Session = Depends(get_db),
+    client: AsyncGarminClient = Depends(get_async_garmin_client),
     current_user: User = Depends(get_current_user)
 ):
-    """Get yearly activity statistics."""
+    """Get yearly activity statistics (finished years cached permanently, current year hourly)."""
     try:
-        # 1. Check DB Cache first (TTL: 24 hours)
-        setting = db.query(UserSetting).filter(
-            UserSetting.user_id == current_user.id,
-            UserSetting.key == "cache_yearly_stats"
-        ).first()
-
-        force_refresh = False
-        if setting and setting.value and not force_refresh:
-            cached_data = setting.value
-            timestamp = cached_data.get("timestamp", 0)
-            if time.time() - timestamp < 86400:  # 24 hours
-                logger.info(f"Serving /stats/yearly from DB cache for {current_user.email}")
-                return cached_data.get("data", {})
-                
         start_year = date.today().year - years
-        stats = await asyncio.to_thread(client.get_yearly_stats, start_year)
-        
-        # Save payload to DB cache
-        try:
-            if not setting:
-                setting = UserSetting(user_id=current_user.id, key="cache_yearly_stats")
-                db.add(setting)
-            setting.value = {"timestamp": time.time(), "data": stats}
-            db.commit()
-            logger.info(f"Saved /stats/yearly to DB cache for {current_user.email}")
-        except Exception as cache_err:
-            logger.error(f"Failed to save yearly stats cache: {cache_err}")
-            db.rollback()
-            
-        return stats
+        return await client.get_yearly_stats(start_year)
     except Exception as e:
         logger.error(f"Error fetching yearly stats: {e}")
         raise HTTPException(status_code=500, detail=str(e))
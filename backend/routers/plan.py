@@ -3,15 +3,18 @@ from pydantic import BaseModel
 from typing import Optional
 from sqlalchemy.orm import Session
 from backend.services.coach_brain import CoachBrain
-from backend.services.garmin_client import GarminClient
+from backend.services.garmin_async_client import AsyncGarminClient
+from backend.services.activity_store import ACTIVITY_STORE
 from backend.services.data_processor import DataProcessor
 from backend.routers.settings import load_settings
-from backend.routers.dashboard import get_garmin_client
+from backend.routers.dashboard import get_async_garmin_client
 from backend.database import get_db
 import os
 import logging
 import json
-from backend.auth_utils import get_current_user
+import asyncio
+from backend.auth_utils import get_current_user, is_user_premium
+from backend.services.ai_rate_limiter import request_priority
 from backend.models import User
 
 router = APIRouter()
@@ -22,10 +25,10 @@ class PlanRequest(BaseModel):
     language: Optional[str] = "en"
 
 @router.post("/generate")
-def generate_plan(
+async def generate_plan(
     request: Request,
     payload: PlanRequest, 
-    client: GarminClient = Depends(get_garmin_client),
+    client: AsyncGarminClient = Depends(get_async_garmin_client),
     current_user: User = Depends(get_current_user)
 ):
     try:
@@ -38,14 +41,14 @@ def generate_plan(
         if payload.language:
             user_settings_dict["language"] = payload.language
         
-        # Fetch necessary context
-        activities = client.get_activities(60)
-        health_stats = client.get_health_stats()
-        sleep_data = client.get_sleep_data() 
-        
-        # Get profile with VO2 max
-        profile = client.get_profile()
-        vo2_data = client.get_vo2_max()
+        # Fetch necessary context (profile with VO2 max) concurrently
+        activities, health_stats, sleep_data, profile, vo2_data = await asyncio.gather(
+            ACTIVITY_STORE.get_recent(client, 60),
+            client.get_health_stats(),
+            client.get_sleep_data(),
+            client.get_profile(),
+            client.get_vo2_max()
+        )
         if profile and vo2_data:
             profile.update(vo2_data)
         
@@ -75,13 +78,15 @@ def generate_plan(
             except AttributeError:
                 pass
 
-        plan_json_str = brain.generate_structured_plan(
+        plan_json_str = await brain.generate_structured_plan_async(
             duration_str=payload.duration,
             user_profile=profile,
             activities_summary=activities_summary_dict,
             health_stats=health_stats,
             sleep_data=sleep_data,
-            user_settings=user_settings_dict
+            user_settings=user_settings_dict,
+            user_key=current_user.id,
+            priority=request_priority(premium=is_user_premium(current_user))
         )
         
         # Parse JSON
@@ -5,6 +5,7 @@ from sqlalchemy.orm import Session
 from backend.database import get_db, engine
 from backend import models
 from backend.auth_utils import get_current_user
+from backend.services.advice_cache import ADVICE_CACHE
 
 # Create tables if they don't exist
 models.Base.metadata.create_all(bind=engine)
@@ -88,6 +89,8 @@ def save_settings(settings: UserSettings, db: Session = Depends(get_db), current
     
     db.commit()
     db.refresh(db_setting)
+    # Cached advice was generated for the old settings
+    ADVICE_CACHE.invalidate(current_user.id)
     return UserSettings(**db_setting.value)
 
 # Legacy load support 
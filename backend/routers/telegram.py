@@ -7,6 +7,7 @@ from sqlalchemy.orm import Session
 from backend.database import get_db
 from backend.models import User
 from backend.auth_utils import get_current_user, is_user_premium
+from backend.services.ai_rate_limiter import request_priority
 from backend.services.coach_brain import CoachBrain
 
 router = APIRouter(tags=["telegram"])
@@ -119,7 +120,10 @@ async def telegram_webhook(request: Request, db: Session = Depends(get_db)):
         # Format message for Gemini
         messages = [{"role": "user", "content": text}]
         
-        response = brain.generate_chat_response(messages, user_context=user_context, language="en")
+        response = await brain.generate_chat_response_async(
+            messages, user_context=user_context, language="en",
+            user_key=user.id, priority=request_priority(premium=True)  # Only premium users get this far
+        )
         
         # Send chunks if response is too long, but usually it's fine
         await send_telegram_message(chat_id, response)
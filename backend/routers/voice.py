@@ -48,7 +48,7 @@ async def process_voice_input(request: Request):
         prompt = f"You are Coach Onur, an expert triathlon coach. An athlete just said: '{user_speech}'. Give a very brief, motivating, and professional coach response in 2 sentences max."
         
         try:
-            ai_response = client.models.generate_content(model=model_id, contents=prompt)
+            ai_response = await client.aio.models.generate_content(model=model_id, contents=prompt)
             coach_text = ai_response.text.strip()
         except Exception as e:
             coach_text = "I'm having trouble connecting to my coaching brain, but keep pushing hard!"
@@ -0,0 +1,125 @@
+import os
+import json
+import zlib
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from backend.models import GarminActivityDetail
+
+logger = logging.getLogger(__name__)
+
+ACTIVITY_DETAIL_COMPONENTS = ("summary", "splits", "high_res")
+
+
+def is_finished(summary):
+    """True once Garmin has finished processing an activity summary (it has a duration and no processing flag)."""
+    if not isinstance(summary, dict):
+        return False
+    dto = summary.get("summaryDTO") or summary
+    if dto.get("duration") is None and dto.get("elapsedDuration") is None:
+        return False
+    metadata = summary.get("metadataDTO") or {}
+    return not any(source.get(flag) for source in (summary, metadata) for flag in ("processing", "isProcessing"))
+
+
+class ActivityDetailsStore:
+    """
+    Store for activity details, one compressed row per component.
+
+    Completed activities only change when the user edits them, so once the
+    summary shows the activity is finished each component is fetched from Garmin
+    once and then served from here; activity sync drops the rows of edited or
+    deleted activities. Components of activities still being processed are kept
+    for `pending_ttl` seconds only. The high_res stream is by far the largest
+    part; compressing it typically shrinks it by an order of magnitude.
+    """
+
+    def __init__(self, pending_ttl=15 * 60):
+        self.pending_ttl = pending_ttl
+
+    @staticmethod
+    def _session():
+        from backend.database import SessionLocal
+        return SessionLocal()
+
+    @staticmethod
+    def _pack(data):
+        return zlib.compress(json.dumps(data, separators=(",", ":")).encode(), 6)
+
+    @staticmethod
+    def _unpack(payload):
+        return json.loads(zlib.decompress(payload))
+
+    def load(self, email, activity_id, components):
+        """Return {component: data} for the stored components among `components`."""
+        db = self._session()
+        try:
+            rows = db.query(GarminActivityDetail).filter(
+                GarminActivityDetail.garmin_email == email,
+                GarminActivityDetail.activity_id == activity_id,
+                GarminActivityDetail.component.in_(components),
+                or_(GarminActivityDetail.expires_at.is_(None), GarminActivityDetail.expires_at > datetime.utcnow()),
+            ).all()
+            return {row.component: self._unpack(row.payload) for row in rows}
+        except Exception as e:
+            logger.warning(f"Could not load stored details for activity {activity_id}: {e}")
+            return {}
+        finally:
+            db.close()
+
+    def save(self, email, activity_id, parts, finished=True):
+        """
+        Persist {component: data}, permanently if the activity is `finished`, else for
+        `pending_ttl` seconds. Components stored concurrently by another worker are kept.
+        """
+        expires_at = None if finished else datetime.utcnow() + timedelta(seconds=self.pending_ttl)
+        db = self._session()
+        try:
+            existing = {
+                row.component: row
+                for row in db.query(GarminActivityDetail).filter(
+                    GarminActivityDetail.garmin_email == email,
+                    GarminActivityDetail.activity_id == activity_id,
+                    GarminActivityDetail.component.in_(list(parts)),
+                ).all()
+            }
+            for component, data in parts.items():
+                row = existing.get(component)
+                if not row:
+                    row = GarminActivityDetail(garmin_email=email, activity_id=activity_id, component=component)
+                    db.add(row)
+                row.payload = self._pack(data)
+                row.expires_at = expires_at
+                row.stored_at = datetime.utcnow()
+                try:
+                    db.commit()
+                except IntegrityError:
+                    db.rollback()
+                    logger.debug(f"{component} of activity {activity_id} was stored by another request")
+        except Exception as e:
+            logger.warning(f"Could not store details for activity {activity_id}: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def invalidate(self, email, activity_ids):
+        """Drop every stored component of the given activities (edited or deleted on Garmin)."""
+        if not activity_ids:
+            return
+        db = self._session()
+        try:
+            db.query(GarminActivityDetail).filter(
+                GarminActivityDetail.garmin_email == email,
+                GarminActivityDetail.activity_id.in_(list(activity_ids)),
+            ).delete(synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            logger.warning(f"Could not drop stored details for activities {sorted(activity_ids)}: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+ACTIVITY_DETAILS_STORE = ActivityDetailsStore(
+    pending_ttl=int(os.getenv("GARMIN_ACTIVITY_DETAILS_PENDING_TTL", str(15 * 60))),
+)
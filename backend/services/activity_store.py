@@ -0,0 +1,212 @@
+import os
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from backend.models import GarminActivity, GarminActivitySync
+from backend.services.advice_cache import ADVICE_CACHE
+from backend.services.activity_details_store import ACTIVITY_DETAILS_STORE
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityStore:
+    """
+    Persistent per-account activity store with incremental sync.
+
+    Activities are stored by activityId together with a high-watermark (the
+    newest startTimeGMT seen). A sync pages through the Garmin activity list
+    (newest start first) storing every activityId it does not know yet, and
+    stops at the first stored activity that started more than
+    `late_upload_window` seconds before the watermark. Activities uploaded late
+    (a watch synced after a newer phone activity) sit below the watermark in
+    the list and are still picked up; an account with no new activities
+    usually costs one small request. Stored activities seen again with changed
+    data (edited on Garmin) are updated, and stored activities missing from the
+    span of the list a sync walked are removed as deleted; both drop their
+    stored details.
+    Consumers (DataProcessor, prompt builders) read the raw activity dicts from
+    the store instead of refetching the last 60 activities every time.
+    """
+
+    def __init__(self, page_size=20, initial_limit=60, max_pages=10, min_sync_interval=60, late_upload_window=7 * 86400):
+        self.page_size = page_size
+        self.initial_limit = initial_limit
+        self.max_pages = max_pages
+        self.min_sync_interval = min_sync_interval
+        self.late_upload_window = late_upload_window
+
+    def _page_limit(self, watermark):
+        """startTimeGMT at or below which a stored activity ends the sync (the watermark minus the late-upload window)."""
+        try:
+            limit = datetime.fromisoformat(watermark) - timedelta(seconds=self.late_upload_window)
+        except (TypeError, ValueError):
+            return watermark
+        return limit.strftime("%Y-%m-%d %H:%M:%S")
+
+    # --- DB helpers (run in a worker thread) ------------------------------
+
+    @staticmethod
+    def _session():
+        from backend.database import SessionLocal
+        return SessionLocal()
+
+    def _load_state(self, email):
+        db = self._session()
+        try:
+            state = db.query(GarminActivitySync).filter(GarminActivitySync.garmin_email == email).first()
+            if not state:
+                return None, None
+            return state.watermark, state.last_synced_at
+        finally:
+            db.close()
+
+    def _known(self, email, activity_ids):
+        """{activityId: stored data} for the given ids that are stored."""
+        db = self._session()
+        try:
+            rows = db.query(GarminActivity.activity_id, GarminActivity.data).filter(
+                GarminActivity.garmin_email == email,
+                GarminActivity.activity_id.in_(activity_ids),
+            ).all()
+            return {row[0]: row[1] for row in rows}
+        finally:
+            db.close()
+
+    def _remove_missing(self, email, seen_ids, oldest_start):
+        """Delete stored activities that started after `oldest_start` but were not in the walked list. Returns their ids."""
+        db = self._session()
+        try:
+            rows = db.query(GarminActivity).filter(
+                GarminActivity.garmin_email == email,
+                GarminActivity.start_time_gmt > oldest_start,
+                GarminActivity.activity_id.notin_(seen_ids),
+            ).all()
+            removed = [row.activity_id for row in rows]
+            for row in rows:
+                db.delete(row)
+            db.commit()
+            return removed
+        finally:
+            db.close()
+
+    def _store(self, email, activities):
+        """Upsert activities and advance the watermark. Returns the new watermark."""
+        db = self._session()
+        try:
+            for attempt in range(2):
+                try:
+                    ids = [a["activityId"] for a in activities]
+                    existing = {
+                        row.activity_id: row
+                        for row in db.query(GarminActivity).filter(
+                            GarminActivity.garmin_email == email,
+                            GarminActivity.activity_id.in_(ids),
+                        ).all()
+                    } if ids else {}
+                    for activity in activities:
+                        row = existing.get(activity["activityId"])
+                        if not row:
+                            row = GarminActivity(garmin_email=email, activity_id=activity["activityId"])
+                            db.add(row)
+                        row.start_time_gmt = activity.get("startTimeGMT")
+                        row.data = activity
+
+                    state = db.query(GarminActivitySync).filter(GarminActivitySync.garmin_email == email).first()
+                    if not state:
+                        state = GarminActivitySync(garmin_email=email)
+                        db.add(state)
+                    newest = max((a.get("startTimeGMT") or "" for a in activities), default="")
+                    if newest and (not state.watermark or newest > state.watermark):
+                        state.watermark = newest
+                    state.last_synced_at = datetime.utcnow()
+                    db.commit()
+                    return state.watermark
+                except IntegrityError:
+                    # Another worker stored the same activities first — retry as updates
+                    db.rollback()
+                    if attempt:
+                        raise
+        finally:
+            db.close()
+
+    def _recent(self, email, limit):
+        db = self._session()
+        try:
+            rows = (
+                db.query(GarminActivity.data)
+                .filter(GarminActivity.garmin_email == email)
+                .order_by(GarminActivity.start_time_gmt.desc())
+                .limit(limit)
+                .all()
+            )
+            return [row[0] for row in rows]
+        finally:
+            db.close()
+
+    # --- public API -------------------------------------------------------
+
+    async def sync(self, client, seed_limit=None):
+        """Fetch activities not stored yet. Returns the number of new activities stored."""
+        email = client.email
+        watermark, last_synced_at = await asyncio.to_thread(self._load_state, email)
+        if last_synced_at and (datetime.utcnow() - last_synced_at).total_seconds() < self.min_sync_interval:
+            return 0
+
+        edited, removed = [], []
+        if not watermark:
+            # First sync for this account: seed the store with the usual window
+            fresh = await client.get_activities_page(0, seed_limit or self.initial_limit)
+        else:
+            fresh, walked = [], []
+            page_limit = self._page_limit(watermark)
+            for page in range(self.max_pages):
+                batch = await client.get_activities_page(page * self.page_size, self.page_size)
+                if not batch:
+                    break
+                walked += batch
+                known = await asyncio.to_thread(self._known, email, [a["activityId"] for a in batch])
+                reached_known = False
+                for activity in batch:
+                    if activity["activityId"] not in known:
+                        fresh.append(activity)  # New, or uploaded late with an older start time
+                        continue
+                    if activity != known[activity["activityId"]]:
+                        edited.append(activity)  # Renamed, retyped or otherwise edited on Garmin
+                    if (activity.get("startTimeGMT") or "") <= page_limit:
+                        reached_known = True
+                        break
+                if reached_known or len(batch) < self.page_size:
+                    break
+
+            starts = [a.get("startTimeGMT") for a in walked if a.get("startTimeGMT")]
+            if starts:
+                removed = await asyncio.to_thread(
+                    self._remove_missing, email, [a["activityId"] for a in walked], min(starts))
+
+        await asyncio.to_thread(self._store, email, fresh + edited)
+        if edited or removed:
+            logger.info(f"🔄 {len(edited)} edited / {len(removed)} deleted Garmin activities for {email}")
+            await asyncio.to_thread(
+                ACTIVITY_DETAILS_STORE.invalidate, email, [a["activityId"] for a in edited] + removed)
+        if fresh:
+            logger.info(f"✅ Synced {len(fresh)} new Garmin activities for {email}")
+        if fresh or edited or removed:
+            # Advice generated before this change no longer reflects today's training
+            await asyncio.to_thread(ADVICE_CACHE.invalidate_account, email)
+        return len(fresh)
+
+    async def get_recent(self, client, limit=60):
+        """Sync incrementally, then return the newest `limit` raw activities from the local store."""
+        try:
+            await self.sync(client, seed_limit=max(limit, self.initial_limit))
+        except Exception as e:
+            logger.warning(f"⚠️ Incremental activity sync failed for {client.email}, serving stored activities: {e}")
+        return await asyncio.to_thread(self._recent, client.email, limit)
+
+
+ACTIVITY_STORE = ActivityStore(
+    page_size=int(os.getenv("GARMIN_ACTIVITY_PAGE_SIZE", "20")),
+    min_sync_interval=int(os.getenv("GARMIN_ACTIVITY_SYNC_INTERVAL", "60")),
+    late_upload_window=int(os.getenv("GARMIN_ACTIVITY_LATE_UPLOAD_WINDOW", str(7 * 86400))),
+)
@@ -0,0 +1,143 @@
+# Chart channel -> Garmin metric descriptor keys (first match wins)
+STREAM_CHANNELS = {
+    "heart_rate": ("directHeartRate",),
+    "pace": ("directSpeed",),  # Derived: min/km from m/s
+    "power": ("directPower",),
+    "elevation": ("directElevation", "directAltitude"),
+}
+TIME_KEYS = ("sumDuration", "sumElapsedDuration", "sumMovingDuration")
+DISTANCE_KEYS = ("sumDistance",)
+DOWNSAMPLE_METHODS = ("lttb", "minmax", "raw")
+MAX_PACE = 30  # min/km; slower samples are standing still or GPS noise
+
+
+def lttb(xs, ys, threshold):
+    """
+    Largest-Triangle-Three-Buckets: indices of `threshold` samples that keep the
+    visual shape of the series (peaks, troughs and first/last sample).
+    """
+    n = len(xs)
+    if threshold >= n:
+        return list(range(n))
+    if threshold < 3:
+        return [0, n - 1][:threshold]
+
+    selected = [0]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third triangle vertex
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        count = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / count
+        avg_y = sum(ys[next_start:next_end]) / count
+
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        ax, ay = xs[a], ys[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        a = best
+    selected.append(n - 1)
+    return selected
+
+
+def min_max(ys, threshold):
+    """Min/max decimation: the lowest and highest sample of each bucket, in order. Keeps every extreme."""
+    n = len(ys)
+    if threshold >= n:
+        return list(range(n))
+    buckets = max(1, threshold // 2)
+    selected = []
+    for b in range(buckets):
+        start, end = b * n // buckets, (b + 1) * n // buckets
+        if start >= end:
+            continue
+        lo = min(range(start, end), key=ys.__getitem__)
+        hi = max(range(start, end), key=ys.__getitem__)
+        selected.extend(sorted({lo, hi}))
+    return selected
+
+
+def _rows(high_res):
+    """Per-sample metric lists from either Garmin layout (activityDetailMetrics/metrics or metrics/metricsItems)."""
+    if high_res.get("activityDetailMetrics") is not None:
+        return [row.get("metrics") or [] for row in high_res["activityDetailMetrics"]]
+    return [row.get("metricsItems") or [] for row in high_res.get("metrics") or []]
+
+
+def _index(descriptors, keys):
+    for key in keys:
+        for descriptor in descriptors:
+            if descriptor.get("key") == key:
+                return descriptor.get("metricsIndex"), (descriptor.get("unit") or {}).get("key")
+    return None, None
+
+
+def _column(rows, idx):
+    return [row[idx] if idx is not None and idx < len(row) else None for row in rows]
+
+
+def _round(values, digits):
+    return [None if v is None else round(v, digits) for v in values]
+
+
+def downsample_streams(high_res, points=400, method="lttb", channels=None):
+    """
+    Decimate the high_res metric stream of an activity to about `points` samples per channel.
+
+    Returns compact parallel arrays per channel:
+    {"source_points", "points", "method", "channels": {name: {"unit", "time", "distance", "value"}}}
+    where time is elapsed seconds and distance is metres. method="raw" (or points=0)
+    returns every sample.
+    """
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(f"Unknown downsampling method '{method}'")
+    descriptors = high_res.get("metricDescriptors") or []
+    rows = _rows(high_res)
+    time_idx, _ = _index(descriptors, TIME_KEYS)
+    distance_idx, _ = _index(descriptors, DISTANCE_KEYS)
+    times = _column(rows, time_idx)
+    distances = _column(rows, distance_idx)
+
+    result = {"source_points": len(rows), "points": points, "method": method, "channels": {}}
+    for name in channels or STREAM_CHANNELS:
+        if name not in STREAM_CHANNELS:
+            continue
+        idx, unit = _index(descriptors, STREAM_CHANNELS[name])
+        if idx is None:
+            continue
+        values = _column(rows, idx)
+        if name == "pace":
+            values = [
+                (1000 / v) / 60 if v and v > 0 and (1000 / v) / 60 < MAX_PACE else None
+                for v in values
+            ]
+            unit = "min/km"
+
+        # Decimate over the samples that carry a value; gaps would distort the triangles
+        present = [i for i, v in enumerate(values) if v is not None]
+        if not present:
+            continue
+        ys = [values[i] for i in present]
+        if method == "raw" or not points or points >= len(present):
+            keep = range(len(present))
+        elif method == "lttb":
+            xs = [times[i] if times[i] is not None else i for i in present]
+            keep = lttb(xs, ys, points)
+        else:
+            keep = min_max(ys, points)
+
+        picked = [present[k] for k in keep]
+        result["channels"][name] = {
+            "unit": unit,
+            "time": _round([times[i] for i in picked], 1),
+            "distance": _round([distances[i] for i in picked], 1),
+            "value": _round([values[i] for i in picked], 2),
+        }
+    return result
@@ -0,0 +1,162 @@
+import os
+import json
+import hashlib
+import logging
+from datetime import date, datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from backend.models import AdviceCacheEntry, User
+
+logger = logging.getLogger(__name__)
+
+# Bump when the advice prompt changes in a way that should retire cached advice
+ADVICE_PROMPT_VERSION = 3
+
+# Arguments of CoachBrain.generate_daily_advice, in order
+ADVICE_ARGS = ("user_profile", "activities_summary", "health_stats", "sleep_data", "user_settings",
+               "todays_activities", "recent_activities", "client_local_time", "available_time_mins",
+               "selected_sports", "sport_durations")
+
+
+def _normalize(value):
+    """Canonical JSON-able form: sorted keys, no None/empty members, rounded floats, DataFrames as text."""
+    if hasattr(value, "to_string"):
+        return value.to_string()
+    if isinstance(value, dict):
+        items = ((str(k), _normalize(v)) for k, v in value.items())
+        return {k: v for k, v in sorted(items) if v not in (None, "", [], {})}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, float):
+        return round(value, 3)
+    return value
+
+
+def _hour_bucket(client_local_time):
+    """The athlete's local date and hour: advice differs by time of day, not by the minute."""
+    if client_local_time:
+        try:
+            return datetime.fromisoformat(client_local_time.replace('Z', '+00:00')).strftime("%Y-%m-%dT%H")
+        except (ValueError, AttributeError):
+            pass
+    return datetime.now().strftime("%Y-%m-%dT%H")
+
+
+class AdviceCache:
+    """
+    Cache for generated daily advice, keyed by a fingerprint of its inputs.
+
+    The fingerprint is a sha256 over the normalized arguments of
+    generate_daily_advice (profile, weekly summary, health, sleep, settings,
+    today's and recent activities, selected sports, ...) with the client time
+    reduced to its hour, so a reload or a second device within the same hour
+    gets the stored advice instead of another Gemini call. Entries live in the
+    ai_advice_cache table, shared by all workers, for `ttl` seconds.
+
+    Entries belong to a user: saving settings or syncing a new activity drops
+    that user's advice, so the next request regenerates it even if the client
+    sends the same (stale) payload.
+    """
+
+    def __init__(self, ttl=3600):
+        self.ttl = ttl
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "invalidations": 0}
+
+    @staticmethod
+    def _session():
+        from backend.database import SessionLocal
+        return SessionLocal()
+
+    def fingerprint(self, user_id, model_name, args):
+        """Cache key for generate_daily_advice(*args) by `user_id` with `model_name`."""
+        inputs = dict(zip(ADVICE_ARGS, args))
+        recent = inputs.get("recent_activities") or []
+        inputs["recent_activities"] = recent[:15]  # The prompt only uses the newest 15
+        inputs["client_local_time"] = _hour_bucket(inputs.get("client_local_time"))
+        raw = json.dumps(
+            {"v": ADVICE_PROMPT_VERSION, "model": model_name, "user": user_id,
+             "server_date": date.today().isoformat(), "inputs": _normalize(inputs)},
+            sort_keys=True, separators=(",", ":"), default=str,
+        )
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, fingerprint):
+        """Stored advice for `fingerprint`, or None when missing or expired."""
+        db = self._session()
+        try:
+            row = db.query(AdviceCacheEntry.value).filter(
+                AdviceCacheEntry.fingerprint == fingerprint,
+                AdviceCacheEntry.expires_at > datetime.utcnow(),
+            ).first()
+        except Exception as e:
+            logger.warning(f"Advice cache read failed: {e}")
+            row = None
+        finally:
+            db.close()
+        self._stats["hits" if row else "misses"] += 1
+        return row[0] if row else None
+
+    def put(self, fingerprint, user_id, advice):
+        """Store advice for `fingerprint` and drop the user's expired entries."""
+        db = self._session()
+        try:
+            now = datetime.utcnow()
+            db.query(AdviceCacheEntry).filter(
+                AdviceCacheEntry.user_id == user_id,
+                AdviceCacheEntry.expires_at <= now,
+            ).delete(synchronize_session=False)
+            row = db.query(AdviceCacheEntry).filter(AdviceCacheEntry.fingerprint == fingerprint).first()
+            if not row:
+                row = AdviceCacheEntry(fingerprint=fingerprint, user_id=user_id)
+                db.add(row)
+            row.value = advice
+            row.expires_at = now + timedelta(seconds=self.ttl)
+            db.commit()
+            self._stats["stores"] += 1
+        except IntegrityError:
+            db.rollback()  # Another worker stored the same advice first
+        except Exception as e:
+            logger.warning(f"Advice cache write failed: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def invalidate(self, user_id):
+        """Forget all cached advice for a user (settings changed)."""
+        db = self._session()
+        try:
+            deleted = db.query(AdviceCacheEntry).filter(
+                AdviceCacheEntry.user_id == user_id
+            ).delete(synchronize_session=False)
+            db.commit()
+            self._stats["invalidations"] += 1
+            if deleted:
+                logger.info(f"Invalidated {deleted} cached advice entries for user {user_id}")
+        except Exception as e:
+            logger.warning(f"Advice cache invalidation failed for user {user_id}: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def invalidate_account(self, garmin_email):
+        """Forget cached advice for every user linked to a Garmin account (new activity synced)."""
+        db = self._session()
+        try:
+            user_ids = db.query(User.id).filter(User.garmin_email == garmin_email)
+            deleted = db.query(AdviceCacheEntry).filter(
+                AdviceCacheEntry.user_id.in_(user_ids.scalar_subquery())
+            ).delete(synchronize_session=False)
+            db.commit()
+            self._stats["invalidations"] += 1
+            if deleted:
+                logger.info(f"Invalidated {deleted} cached advice entries for {garmin_email}")
+        except Exception as e:
+            logger.warning(f"Advice cache invalidation failed for {garmin_email}: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def stats(self):
+        return dict(self._stats)
+
+
+ADVICE_CACHE = AdviceCache(ttl=int(os.getenv("ADVICE_CACHE_TTL", "3600")))
@@ -0,0 +1,255 @@
+import os
+import time
+import asyncio
+import logging
+import itertools
+import threading
+from collections import deque
+from backend.services.garmin_rate_governor import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first
+PRIORITY_PREMIUM = 0
+PRIORITY_INTERACTIVE = 1
+PRIORITY_BACKGROUND = 2
+PRIORITY_NAMES = {PRIORITY_PREMIUM: "premium", PRIORITY_INTERACTIVE: "interactive", PRIORITY_BACKGROUND: "background"}
+
+
+class AIRateLimitExceeded(Exception):
+    """The request could not get an AI call slot within its max wait."""
+
+
+def request_priority(premium=False, interactive=True):
+    """Priority for an AI request: premium users first, then interactive requests, then background work."""
+    if not interactive:
+        return PRIORITY_BACKGROUND
+    return PRIORITY_PREMIUM if premium else PRIORITY_INTERACTIVE
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "user", "granted", "event", "loop", "future")
+
+    def __init__(self, priority, seq, user):
+        self.priority = priority
+        self.seq = seq
+        self.user = user
+        self.granted = False
+        self.event = None  # Sync callers block on this
+        self.loop = None  # Async callers await `future` on `loop`
+        self.future = None
+
+    def wake(self):
+        if self.event is not None:
+            self.event.set()
+        elif self.future is not None:
+            try:
+                self.loop.call_soon_threadsafe(_resolve, self.future)
+            except RuntimeError:
+                pass  # Loop closed; the caller is gone
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AIRateLimiter:
+    """
+    Paces Gemini calls with a global token bucket plus one bucket per user.
+
+    A call proceeds at once when both its user's bucket and the global bucket
+    have a token and nobody is queued. Otherwise it queues; slots are handed out
+    by priority (premium, interactive, background), first come first served
+    within a priority. A user whose own bucket is empty is skipped rather than
+    holding up the queue, so one heavy user only slows themselves down.
+
+    Waiting never holds the lock or a thread: async callers await a future, sync
+    callers wait on an Event in their own thread, and a waiter whose deadline
+    (`max_wait`) passes gets AIRateLimitExceeded. Queue waits are recorded per
+    priority for stats().
+    """
+
+    def __init__(self, global_rate=1.0, global_burst=20, user_rate=0.2, user_burst=5, max_wait=60,
+                 history=500):
+        self.max_wait = max_wait
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self._user_config = (user_rate, user_burst)
+        self._users = {}  # user key -> TokenBucket
+        self._queue = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._last_prune = time.monotonic()
+        self._waits = {priority: deque(maxlen=history) for priority in PRIORITY_NAMES}
+        self._stats = {"immediate": 0, "queued": 0, "rejected": 0}
+
+    def _user_bucket(self, user):
+        bucket = self._users.get(user)
+        if bucket is None:
+            bucket = self._users[user] = TokenBucket(*self._user_config)
+        return bucket
+
+    def _prune_locked(self, now):
+        """Forget idle, full user buckets (they'd be recreated identically)."""
+        if now - self._last_prune < 300:
+            return
+        self._last_prune = now
+        waiting = {waiter.user for waiter in self._queue}
+        for user in [u for u, b in self._users.items() if u not in waiting and b.is_idle(now)]:
+            del self._users[user]
+
+    def _has_token(self, user, now):
+        self.global_bucket._refill(now)
+        if self.global_bucket.tokens < 1:
+            return False
+        if user is None:
+            return True
+        bucket = self._user_bucket(user)
+        bucket._refill(now)
+        return bucket.tokens >= 1
+
+    def _take(self, user):
+        self.global_bucket.tokens -= 1
+        if user is not None:
+            self._users[user].tokens -= 1
+
+    def _dispatch_locked(self, now):
+        """Hand free slots to queued waiters in priority order. Returns the waiters to wake."""
+        granted = []
+        for waiter in sorted(self._queue, key=lambda w: (w.priority, w.seq)):
+            if not self._has_token(waiter.user, now):
+                if self.global_bucket.tokens < 1:
+                    break
+                continue  # This user is over their own budget; the next one may go
+            self._take(waiter.user)
+            waiter.granted = True
+            granted.append(waiter)
+        if granted:
+            self._queue = [waiter for waiter in self._queue if not waiter.granted]
+        return granted
+
+    def _next_check_in(self, now):
+        """Seconds until some queued waiter could get a token."""
+        needs = []
+        global_need = max(0.0, (1 - self.global_bucket.tokens) / self.global_bucket.rate)
+        for waiter in self._queue:
+            need = global_need
+            bucket = self._users.get(waiter.user)
+            if bucket is not None:
+                need = max(need, (1 - bucket.tokens) / bucket.rate)
+            needs.append(need)
+        return min(5.0, max(0.01, min(needs, default=0.01)))
+
+    def _enter(self, user, priority):
+        """Take a slot now (returns None) or enqueue a waiter (returns it)."""
+        now = time.monotonic()
+        with self._lock:
+            self._prune_locked(now)
+            if not self._queue and self._has_token(user, now):
+                self._take(user)
+                self._stats["immediate"] += 1
+                self._waits[priority].append(0.0)
+                return None
+            waiter = _Waiter(priority, next(self._seq), user)
+            self._queue.append(waiter)
+            self._stats["queued"] += 1
+            return waiter
+
+    def _poll(self, waiter):
+        """Dispatch free slots; returns (granted, seconds until the next check)."""
+        now = time.monotonic()
+        with self._lock:
+            woken = self._dispatch_locked(now)
+            delay = self._next_check_in(now)
+        for other in woken:
+            if other is not waiter:
+                other.wake()
+        return waiter.granted, delay
+
+    def _give_up(self, waiter, user, waited):
+        with self._lock:
+            if waiter.granted:
+                return
+            self._queue = [w for w in self._queue if w is not waiter]
+            self._stats["rejected"] += 1
+        logger.warning(f"⚠️ AI request for {user or 'anonymous'} gave up after {waited:.1f}s in the rate-limit queue")
+        raise AIRateLimitExceeded(f"AI is busy right now (waited {waited:.0f}s). Please try again in a moment.")
+
+    def _done(self, priority, start):
+        self._waits[priority].append(time.monotonic() - start)
+
+    async def acquire(self, user=None, priority=PRIORITY_INTERACTIVE, max_wait=None):
+        """Wait (without holding a thread) for an AI call slot. `user=None` only counts against the global budget."""
+        waiter = self._enter(user, priority)
+        if waiter is None:
+            return
+        start = time.monotonic()
+        deadline = start + (self.max_wait if max_wait is None else max_wait)
+        waiter.loop = asyncio.get_running_loop()
+        while True:
+            waiter.future = waiter.loop.create_future()
+            granted, delay = self._poll(waiter)
+            now = time.monotonic()
+            if not granted and now >= deadline:
+                self._give_up(waiter, user, now - start)  # Raises unless granted at the last moment
+                granted = True
+            if granted:
+                self._done(priority, start)
+                return
+            try:
+                await asyncio.wait_for(waiter.future, min(delay, deadline - now))
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                with self._lock:
+                    self._queue = [w for w in self._queue if w is not waiter]
+                raise
+
+    def acquire_sync(self, user=None, priority=PRIORITY_INTERACTIVE, max_wait=None):
+        """acquire() for sync callers: waits in the calling thread, never while holding the lock."""
+        waiter = self._enter(user, priority)
+        if waiter is None:
+            return
+        start = time.monotonic()
+        deadline = start + (self.max_wait if max_wait is None else max_wait)
+        waiter.event = threading.Event()
+        while True:
+            waiter.event.clear()
+            granted, delay = self._poll(waiter)
+            now = time.monotonic()
+            if not granted and now >= deadline:
+                self._give_up(waiter, user, now - start)  # Raises unless granted at the last moment
+                granted = True
+            if granted:
+                self._done(priority, start)
+                return
+            waiter.event.wait(min(delay, deadline - now))
+
+    def stats(self):
+        with self._lock:
+            queue = {name: sum(1 for w in self._queue if w.priority == p) for p, name in PRIORITY_NAMES.items()}
+            waits = {}
+            for priority, name in PRIORITY_NAMES.items():
+                samples = sorted(self._waits[priority])
+                waits[name] = {
+                    "count": len(samples),
+                    "avg": round(sum(samples) / len(samples), 3) if samples else 0.0,
+                    "p95": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3) if samples else 0.0,
+                    "max": round(samples[-1], 3) if samples else 0.0,
+                }
+            return {
+                **self._stats,
+                "queue_depth": queue,
+                "wait_seconds": waits,
+                "global_tokens": round(self.global_bucket.tokens, 2),
+                "user_buckets": len(self._users),
+            }
+
+
+AI_RATE_LIMITER = AIRateLimiter(
+    global_rate=float(os.getenv("AI_RATE_GLOBAL_PER_MIN", "60")) / 60,
+    global_burst=float(os.getenv("AI_BURST_GLOBAL", "20")),
+    user_rate=float(os.getenv("AI_RATE_PER_USER_PER_MIN", "10")) / 60,
+    user_burst=float(os.getenv("AI_BURST_PER_USER", "5")),
+    max_wait=float(os.getenv("AI_RATE_MAX_WAIT", "60")),
+)
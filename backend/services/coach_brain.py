@@ -1,15 +1,27 @@
 import os
+import asyncio
 import logging
 import json
-import time
-import threading
-from functools import lru_cache, wraps
-from tenacity import retry, stop_after_attempt, wait_exponential
+import re
+from collections import namedtuple
+from functools import lru_cache
+from tenacity import retry, stop_after_attempt, wait_exponential, RetryError
 from datetime import datetime
 
 from google import genai
 from google.genai import types
 from dotenv import load_dotenv
+from backend.services.ai_rate_limiter import AI_RATE_LIMITER, PRIORITY_INTERACTIVE
+from backend.services.advice_cache import ADVICE_CACHE
+from backend.services.prompt_cache import PromptParts, prefix_cache_for
+from backend.services.prompt_context import (
+    PromptContext,
+    render_briefing,
+    render_plan,
+    render_settings,
+    render_value,
+    render_weekly_summary,
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -17,23 +29,126 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-def rate_limit(max_calls=10, period=60):
-    """Thread-safe rate limiter decorator"""
-    calls = []
-    lock = threading.Lock()
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            now = time.time()
-            with lock:
-                calls[:] = [c for c in calls if c > now - period]
-                if len(calls) >= max_calls:
-                    wait_time = period - (now - calls[0])
-                    time.sleep(wait_time)
-                calls.append(time.time())
-            return func(*args, **kwargs)
-        return wrapper
-    return decorator
+# How a CoachBrain operation calls Gemini: JSON response mode, error log prefix, reply on failure
+_GeminiTask = namedtuple("_GeminiTask", "json_response error fallback")
+
+
+# Static part of the daily advice prompt (JSON format and Garmin workout rules): sent as the
+# system instruction, identical for every user, so it can be served from the prompt prefix cache
+_ADVICE_OUTPUT_RULES = """
+        **Output Format:**
+        JSON object:
+        {
+            "advice_text": "Markdown string with physiological analysis and training protocol...",
+            "workout": {
+                "workoutName": "CoachOnur - Duration/Type",
+                "sportType": { "sportTypeId": 1, "sportTypeKey": "running" },
+                "description": "Short summary",
+                "instructions": "Detailed instructions...",
+                "workoutSegments": [
+                    {
+                        "sportType": { "sportTypeId": 2, "sportTypeKey": "cycling" },
+                        "workoutSteps": [
+                            {
+                                "type": "ExecutableStepDTO",
+                                "description": "Warm-up / Initial set",
+                                "stepType": { "stepTypeId": 1, "stepTypeKey": "warmup" },
+                                "endCondition": { "conditionTypeId": 2, "conditionTypeKey": "time" },
+                                "endConditionValue": 900,
+                                "targetType": { "workoutTargetTypeId": 4, "workoutTargetTypeKey": "heart.rate.zone" },
+                                "targetValueOne": 1, 
+                                "targetValueTwo": 2
+                            }
+                        ]
+                    },
+                    {
+                        "sportType": { "sportTypeId": 1, "sportTypeKey": "running" },
+                        "workoutSteps": [
+                            {
+                                "type": "ExecutableStepDTO",
+                                "description": "Main set / Phase 2",
+                                "stepType": { "stepTypeId": 3, "stepTypeKey": "active" },
+                                "endCondition": { "conditionTypeId": 2, "conditionTypeKey": "time" },
+                                "endConditionValue": 6300,
+                                "targetType": { "workoutTargetTypeId": 4, "workoutTargetTypeKey": "heart.rate.zone" },
+                                "targetValueOne": 2, 
+                                "targetValueTwo": 3
+                            }
+                        ]
+                    }
+                ]
+            }
+        }
+
+        **MULTI-SPORT JSON RULE**: If the athlete requested a multi-sport set (e.g. Bike + Run), you MUST provide a separate entry in the `workoutSegments` array for each sport. The `workoutSteps` for each segment should reflect its specific sport.
+        
+        **CRITICAL GARMIN WORKOUT JSON RULES:**
+        You must strictly adhere to the specific Garmin ID and Key mappings for workouts:
+        - `sportType`: running (1), cycling (2), swimming (5), strength_training (9)
+        - `stepType`: warmup (1), cooldown (2), active (3), rest (4), recovery (5)
+        - `endCondition`: lap.button (1), time (2) [value in seconds], distance (3) [value in meters]
+        - `targetType` for Running: heart.rate.zone (4), pace.zone (2) 
+        - `targetType` for Cycling: power.zone (6), heart.rate.zone (4), cadence.zone (5)
+        - Do not output target values as strings, they MUST be numeric/integers (e.g. `targetValueOne`: 1).
+        - IF NO TARGET: use `no.target` (1). CRITICAL: If using no.target, you MUST OMIT the `targetValueOne`, `targetValueTwo`, and `zoneNumber` fields completely from that step's JSON. Sending them as null causes a server crash.
+        - CRITICAL: DO NOT include `segmentOrder` or `stepOrder` anywhere in the JSON. Garmin will reject the upload if you do.
+        - CRITICAL: For standard single-sport workouts, the `workoutSegments` array should usually contain exactly ONE item. However, for **MULTI-SPORT** (Brick/Transition) sessions, you MUST provide a separate segment for each sport discipline to ensure the timings add up correctly.
+        (Set "workout": null if it's a rest day/evening. Workout steps should be valid Garmin JSON structure.)
+        Output ONLY valid JSON.
+        """
+
+
+class _JsonStringField:
+    """
+    Decodes one string field (e.g. advice_text) of a JSON object while the object
+    is still being streamed, so its text can be forwarded before the JSON is complete.
+    """
+    _ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+    def __init__(self, field):
+        self._key = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self._buffer = ""
+        self._pos = None  # Next undecoded character of the value, once the key was seen
+        self.done = False
+
+    def feed(self, chunk):
+        """Add streamed JSON text; returns the newly decoded part of the field (may be empty)."""
+        self._buffer += chunk
+        if self.done:
+            return ""
+        if self._pos is None:
+            match = self._key.search(self._buffer)
+            if not match:
+                return ""
+            self._pos = match.end()
+        buf, pos, out = self._buffer, self._pos, []
+        while pos < len(buf):
+            char = buf[pos]
+            if char == '"':
+                self.done = True
+                break
+            if char != '\\':
+                out.append(char)
+                pos += 1
+                continue
+            if pos + 1 >= len(buf):
+                break  # Escape split across chunks
+            if buf[pos + 1] != 'u':
+                out.append(self._ESCAPES.get(buf[pos + 1], buf[pos + 1]))
+                pos += 2
+                continue
+            size = 6
+            if buf[pos + 2:pos + 4].upper() in ("D8", "D9", "DA", "DB"):
+                size = 12  # High surrogate: decode together with the low one that follows
+            if pos + size > len(buf):
+                break
+            try:
+                out.append(json.loads(f'"{buf[pos:pos + size]}"'))
+            except ValueError:
+                out.append(buf[pos:pos + size])
+            pos += size
+        self._pos = pos
+        return "".join(out)
 
 class CoachBrain:
     SUPPORTED_LANGUAGES = {
@@ -50,6 +165,7 @@ class CoachBrain:
         
         self.client = genai.Client(api_key=self.api_key)
         self.model_name = 'gemini-2.5-flash'
+        self.prompt_cache = prefix_cache_for(self.client, self.model_name)
 
     @lru_cache(maxsize=32)
     def _get_target_language(self, language_code):
@@ -59,6 +175,23 @@ class CoachBrain:
             "English"  # Safe default
         )
 
+    ADVICE_TASK = _GeminiTask(True, "Failed to generate advice with Gemini",
+                              '{"advice_text": "Sorry, I could not generate advice today.", "workout": null}')
+    # What _clean_json_response returns when Gemini's JSON can't be recovered
+    JSON_FORMAT_FALLBACK = '{"advice_text": "AI response formatting error", "workout": null}'
+    CHAT_TASK = _GeminiTask(False, "Failed to generate chat response", "Connection error. Please try again.")
+    PLAN_TASK = _GeminiTask(True, "Failed to generate plan", '{"error": "Failed to generate plan"}')
+    ANALYSIS_TASK = _GeminiTask(False, "Failed to analyze activity", "Could not analyze activity due to an internal error.")
+
+    # Known chat context fields: (renderer, priority); unknown ones are rendered as compact JSON at priority 1
+    CHAT_CONTEXT_FIELDS = {
+        "source": (render_value, 0),
+        "athlete_name": (render_value, 0),
+        "settings": (render_settings, 1),
+        "today_daily_briefing_and_workout": (render_briefing, 2),
+        "latest_training_plan": (render_plan, 3),
+    }
+
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
     def _call_gemini_with_retry(self, prompt, generation_config=None):
         """Robust API call with retries"""
@@ -71,11 +204,227 @@ class CoachBrain:
             config=config
         )
 
-    @rate_limit(max_calls=20, period=60)
-    def generate_daily_advice(self, user_profile, activities_summary, health_stats, sleep_data, user_settings=None, todays_activities=None, recent_activities=None, client_local_time=None, available_time_mins=None, selected_sports=None, sport_durations=None):
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
+    async def _call_gemini_with_retry_async(self, prompt, generation_config=None):
+        """Async API call with retries; waits on Gemini (and between retries) without holding a thread."""
+        config = None
+        if generation_config:
+            config = types.GenerateContentConfig(**generation_config)
+        return await self.client.aio.models.generate_content(
+            model=self.model_name,
+            contents=prompt,
+            config=config
+        )
+
+    async def _stream_gemini(self, prompt, generation_config=None):
+        """Text chunks from Gemini's streaming API as they arrive."""
+        config = None
+        if generation_config:
+            config = types.GenerateContentConfig(**generation_config)
+        stream = await self.client.aio.models.generate_content_stream(
+            model=self.model_name,
+            contents=prompt,
+            config=config
+        )
+        async for chunk in stream:
+            if chunk.text:
+                yield chunk.text
+
+    def _request(self, prompt, generation_config=None, user_key=None, use_cache=True):
+        """
+        (contents, generation config) for a built prompt. For PromptParts the system
+        instruction and athlete context go out as a cached prefix when the backend has
+        one (and use_cache), inline as the system instruction otherwise.
+        """
+        if not isinstance(prompt, PromptParts):
+            return prompt, generation_config
+        config = dict(generation_config or {})
+        cached = self.prompt_cache.cached_content(prompt, user_key) if use_cache else None
+        if cached:
+            config["cached_content"] = cached
+        else:
+            config["system_instruction"] = "\n\n".join(part for part in (prompt.system, prompt.context) if part)
+        return prompt.contents, config
+
+    def _cache_rejected(self, error, config):
+        """True if Gemini refused the request's cached_content; that cache is then forgotten."""
+        if isinstance(error, RetryError):
+            error = error.last_attempt.exception()
+        name = (config or {}).get("cached_content")
+        if not name or not self.prompt_cache.is_rejection(error):
+            return False
+        logger.warning(f"⚠️ Gemini rejected prompt prefix cache {name}, resending inline: {error}")
+        self.prompt_cache.discard(name)
+        return True
+
+    def _cacheable_advice(self, advice):
+        """Whether generated advice may go to ADVICE_CACHE: never a failure or formatting fallback."""
+        return bool(advice) and advice not in (self.ADVICE_TASK.fallback, self.JSON_FORMAT_FALLBACK)
+
+    def _finish(self, task, text):
+        return self._clean_json_response(text) if task.json_response else text
+
+    def _run(self, task, build_prompt, args, user_key=None, priority=PRIORITY_INTERACTIVE):
+        """Wait for an AI slot, build the prompt and call Gemini, blocking. Any failure returns the task's fallback."""
+        try:
+            AI_RATE_LIMITER.acquire_sync(user_key, priority)
+            prompt = build_prompt(*args)
+            base = {"response_mime_type": "application/json"} if task.json_response else None
+            contents, config = self._request(prompt, base, user_key)
+            try:
+                response = self._call_gemini_with_retry(contents, generation_config=config)
+            except Exception as e:
+                if not self._cache_rejected(e, config):
+                    raise
+                contents, config = self._request(prompt, base, user_key, use_cache=False)
+                response = self._call_gemini_with_retry(contents, generation_config=config)
+            return self._finish(task, response.text)
+        except Exception as e:
+            logger.error(f"{task.error}: {e}")
+            return task.fallback
+
+    async def _run_async(self, task, build_prompt, args, user_key=None, priority=PRIORITY_INTERACTIVE):
+        """Async _run(): the AI slot and the Gemini call are awaited, so no thread is held."""
+        try:
+            await AI_RATE_LIMITER.acquire(user_key, priority)
+            prompt = build_prompt(*args)
+            base = {"response_mime_type": "application/json"} if task.json_response else None
+            contents, config = await asyncio.to_thread(self._request, prompt, base, user_key)
+            try:
+                response = await self._call_gemini_with_retry_async(contents, generation_config=config)
+            except Exception as e:
+                if not self._cache_rejected(e, config):
+                    raise
+                contents, config = self._request(prompt, base, user_key, use_cache=False)
+                response = await self._call_gemini_with_retry_async(contents, generation_config=config)
+            return self._finish(task, response.text)
+        except Exception as e:
+            logger.error(f"{task.error}: {e}")
+            return task.fallback
+
+    async def _stream(self, task, build_prompt, args, user_key=None, priority=PRIORITY_INTERACTIVE, text_field=None):
         """
-        Generate daily coaching advice based on the user's data and settings.
+        Streaming _run_async(): yields ("delta", text) while Gemini writes, then ("done", result)
+        with what the non-streaming call would return. JSON tasks forward only `text_field` as
+        deltas. Failures yield ("error", fallback); there is no retry once text may have been sent.
         """
+        try:
+            await AI_RATE_LIMITER.acquire(user_key, priority)
+            prompt = build_prompt(*args)
+            base = {"response_mime_type": "application/json"} if task.json_response else None
+            contents, config = await asyncio.to_thread(self._request, prompt, base, user_key)
+            field = _JsonStringField(text_field) if text_field else None
+            chunks = []
+            for attempt in range(2):
+                try:
+                    async for text in self._stream_gemini(contents, generation_config=config):
+                        chunks.append(text)
+                        delta = field.feed(text) if field else text
+                        if delta:
+                            yield "delta", delta
+                    break
+                except Exception as e:
+                    if chunks or attempt or not self._cache_rejected(e, config):
+                        raise
+                    contents, config = self._request(prompt, base, user_key, use_cache=False)
+            result = self._finish(task, "".join(chunks))
+        except Exception as e:
+            logger.error(f"{task.error}: {e}")
+            yield "error", task.fallback
+            return
+        yield "done", result
+
+    # --- public API: async variants for the event loop, sync wrappers for scripts/threads ---
+    # user_key (e.g. the user id) selects the per-user AI budget and the advice cache; priority orders
+    # queued requests (see ai_rate_limiter.request_priority).
+
+    async def generate_daily_advice_async(self, user_profile, activities_summary, health_stats, sleep_data, user_settings=None, todays_activities=None, recent_activities=None, client_local_time=None, available_time_mins=None, selected_sports=None, sport_durations=None, *, user_key=None, priority=PRIORITY_INTERACTIVE):
+        """Generate daily coaching advice based on the user's data and settings (cached per user and inputs)."""
+        args = (user_profile, activities_summary, health_stats, sleep_data, user_settings, todays_activities,
+                recent_activities, client_local_time, available_time_mins, selected_sports, sport_durations)
+        if user_key is None:
+            return await self._run_async(self.ADVICE_TASK, self._daily_advice_prompt, args, user_key, priority)
+        fingerprint = ADVICE_CACHE.fingerprint(user_key, self.model_name, args)
+        cached = await asyncio.to_thread(ADVICE_CACHE.get, fingerprint)
+        if cached is not None:
+            return cached
+        advice = await self._run_async(self.ADVICE_TASK, self._daily_advice_prompt, args, user_key, priority)
+        if self._cacheable_advice(advice):
+            await asyncio.to_thread(ADVICE_CACHE.put, fingerprint, user_key, advice)
+        return advice
+
+    def generate_daily_advice(self, user_profile, activities_summary, health_stats, sleep_data, user_settings=None, todays_activities=None, recent_activities=None, client_local_time=None, available_time_mins=None, selected_sports=None, sport_durations=None, *, user_key=None, priority=PRIORITY_INTERACTIVE):
+        """Generate daily coaching advice based on the user's data and settings (cached per user and inputs)."""
+        args = (user_profile, activities_summary, health_stats, sleep_data, user_settings, todays_activities,
+                recent_activities, client_local_time, available_time_mins, selected_sports, sport_durations)
+        if user_key is None:
+            return self._run(self.ADVICE_TASK, self._daily_advice_prompt, args, user_key, priority)
+        fingerprint = ADVICE_CACHE.fingerprint(user_key, self.model_name, args)
+        cached = ADVICE_CACHE.get(fingerprint)
+        if cached is not None:
+            return cached
+        advice = self._run(self.ADVICE_TASK, self._daily_advice_prompt, args, user_key, priority)
+        if self._cacheable_advice(advice):
+            ADVICE_CACHE.put(fingerprint, user_key, advice)
+        return advice
+
+    async def stream_daily_advice(self, user_profile, activities_summary, health_stats, sleep_data, user_settings=None, todays_activities=None, recent_activities=None, client_local_time=None, available_time_mins=None, selected_sports=None, sport_durations=None, *, user_key=None, priority=PRIORITY_INTERACTIVE):
+        """Streaming generate_daily_advice_async(): advice_text deltas, then ("done", advice JSON). Shares its cache."""
+        args = (user_profile, activities_summary, health_stats, sleep_data, user_settings, todays_activities,
+                recent_activities, client_local_time, available_time_mins, selected_sports, sport_durations)
+        fingerprint = None
+        if user_key is not None:
+            fingerprint = ADVICE_CACHE.fingerprint(user_key, self.model_name, args)
+            cached = await asyncio.to_thread(ADVICE_CACHE.get, fingerprint)
+            if cached is not None:
+                yield "done", cached
+                return
+        async for event, data in self._stream(self.ADVICE_TASK, self._daily_advice_prompt, args, user_key, priority,
+                                              text_field="advice_text"):
+            if event == "done" and fingerprint and self._cacheable_advice(data):
+                await asyncio.to_thread(ADVICE_CACHE.put, fingerprint, user_key, data)
+            yield event, data
+
+    async def generate_chat_response_async(self, messages, user_context=None, language="en", *, user_key=None, priority=PRIORITY_INTERACTIVE):
+        """Generate a conversational response based on chat history and user context."""
+        return await self._run_async(self.CHAT_TASK, self._chat_prompt, (messages, user_context, language, user_key), user_key, priority)
+
+    def generate_chat_response(self, messages, user_context=None, language="en", *, user_key=None, priority=PRIORITY_INTERACTIVE):
+        """Generate a conversational response based on chat history and user context."""
+        return self._run(self.CHAT_TASK, self._chat_prompt, (messages, user_context, language, user_key), user_key, priority)
+
+    async def stream_chat_response(self, messages, user_context=None, language="en", *, user_key=None, priority=PRIORITY_INTERACTIVE):
+        """Streaming generate_chat_response_async(): text deltas, then ("done", full reply)."""
+        async for event in self._stream(self.CHAT_TASK, self._chat_prompt, (messages, user_context, language, user_key), user_key, priority):
+            yield event
+
+    async def generate_structured_plan_async(self, duration_str, user_profile, activities_summary, health_stats, sleep_data=None, user_settings=None, *, user_key=None, priority=PRIORITY_INTERACTIVE):
+        """Generate a structured training plan (JSON) for the dashboard."""
+        args = (duration_str, user_profile, activities_summary, health_stats, sleep_data, user_settings)
+        return await self._run_async(self.PLAN_TASK, self._structured_plan_prompt, args, user_key, priority)
+
+    def generate_structured_plan(self, duration_str, user_profile, activities_summary, health_stats, sleep_data=None, user_settings=None, *, user_key=None, priority=PRIORITY_INTERACTIVE):
+        """Generate a structured training plan (JSON) for the dashboard."""
+        args = (duration_str, user_profile, activities_summary, health_stats, sleep_data, user_settings)
+        return self._run(self.PLAN_TASK, self._structured_plan_prompt, args, user_key, priority)
+
+    async def analyze_activity_async(self, activity_data, user_settings=None, *, user_key=None, priority=PRIORITY_INTERACTIVE):
+        """Analyze a specific activity in detail."""
+        return await self._run_async(self.ANALYSIS_TASK, self._activity_analysis_prompt, (activity_data, user_settings), user_key, priority)
+
+    def analyze_activity(self, activity_data, user_settings=None, *, user_key=None, priority=PRIORITY_INTERACTIVE):
+        """Analyze a specific activity in detail."""
+        return self._run(self.ANALYSIS_TASK, self._activity_analysis_prompt, (activity_data, user_settings), user_key, priority)
+
+    async def stream_activity_analysis(self, activity_data, user_settings=None, *, user_key=None, priority=PRIORITY_INTERACTIVE):
+        """Streaming analyze_activity_async(): text deltas, then ("done", full analysis)."""
+        async for event in self._stream(self.ANALYSIS_TASK, self._activity_analysis_prompt, (activity_data, user_settings), user_key, priority):
+            yield event
+
+    # --- prompts ------------------------------------------------------------
+
+    def _daily_advice_prompt(self, user_profile, activities_summary, health_stats, sleep_data, user_settings=None, todays_activities=None, recent_activities=None, client_local_time=None, available_time_mins=None, selected_sports=None, sport_durations=None):
+        """Prompt for generate_daily_advice()."""
         
         # Calculate time context
         current_hour = datetime.now().hour
@@ -109,9 +458,6 @@ class CoachBrain:
             except:
                 pass
         
-        # Prepare context strings
-        activities_str = activities_summary.to_string() if hasattr(activities_summary, 'to_string') else str(activities_summary)
-        
         # Format Today's Activities
         today_context = "No activities recorded today yet."
         total_duration_today_mins = 0
@@ -149,6 +495,13 @@ class CoachBrain:
 
         training_completed_today = (total_duration_today_mins >= MAX_DAILY_TRAINING_MINUTES) or (session_count_today >= 2)
 
+        # Athlete data, fitted to the prompt budget (older activities are cut first)
+        context = PromptContext("advice")
+        context.add("today", today_context, priority=0)
+        context.add("weekly_load", render_weekly_summary(activities_summary), priority=1)
+        context.add("recent_activities", recent_context, priority=2)
+        fitted = context.fit()
+
         # Extract specific data points safely
         name = user_profile.get('fullName', 'Athlete') if user_profile else 'Athlete'
         vo2max = user_profile.get('vo2MaxRunning', 'N/A') if user_profile else 'N/A'
@@ -311,10 +664,11 @@ class CoachBrain:
         - Body Battery: {body_battery}/100 (Higher means more energy)
         
         **4. Recent Load (Activities):**
-        - Past Week Load Summary: {activities_str}
+        - Weekly Load Summary (newest week first):
+{fitted["weekly_load"]}
         - Recent Individual Activities (Last 15):
-{recent_context}
-        - Completed Today: {today_context}
+{fitted["recent_activities"]}
+        - Completed Today: {fitted["today"]}
         - Total Today Duration: {total_duration_today_mins:.0f} minutes
         - Session Count Today: {session_count_today}
         - Training Goal Reached: {"YES" if training_completed_today else "NO"}
@@ -341,91 +695,34 @@ class CoachBrain:
         5. **Coach's Note (Mindset)**: One punchy, highly professional psychological framing for the day.
 
         **Output Format:**
-        JSON object:
-        {{
-            "advice_text": "Markdown string with physiological analysis and training protocol...",
-            "workout": {{
-                "workoutName": "CoachOnur - Duration/Type",
-                "sportType": {{ "sportTypeId": 1, "sportTypeKey": "running" }},
-                "description": "Short summary",
-                "instructions": "Detailed instructions...",
-                "workoutSegments": [
-                    {{
-                        "sportType": {{ "sportTypeId": 2, "sportTypeKey": "cycling" }},
-                        "workoutSteps": [
-                            {{
-                                "type": "ExecutableStepDTO",
-                                "description": "Warm-up / Initial set",
-                                "stepType": {{ "stepTypeId": 1, "stepTypeKey": "warmup" }},
-                                "endCondition": {{ "conditionTypeId": 2, "conditionTypeKey": "time" }},
-                                "endConditionValue": 900,
-                                "targetType": {{ "workoutTargetTypeId": 4, "workoutTargetTypeKey": "heart.rate.zone" }},
-                                "targetValueOne": 1, 
-                                "targetValueTwo": 2
-                            }}
-                        ]
-                    }},
-                    {{
-                        "sportType": {{ "sportTypeId": 1, "sportTypeKey": "running" }},
-                        "workoutSteps": [
-                            {{
-                                "type": "ExecutableStepDTO",
-                                "description": "Main set / Phase 2",
-                                "stepType": {{ "stepTypeId": 3, "stepTypeKey": "active" }},
-                                "endCondition": {{ "conditionTypeId": 2, "conditionTypeKey": "time" }},
-                                "endConditionValue": 6300,
-                                "targetType": {{ "workoutTargetTypeId": 4, "workoutTargetTypeKey": "heart.rate.zone" }},
-                                "targetValueOne": 2, 
-                                "targetValueTwo": 3
-                            }}
-                        ]
-                    }}
-                ]
-            }}
-        }}
-
-        **MULTI-SPORT JSON RULE**: If the athlete requested a multi-sport set (e.g. Bike + Run), you MUST provide a separate entry in the `workoutSegments` array for each sport. The `workoutSteps` for each segment should reflect its specific sport.
-        
-        **CRITICAL GARMIN WORKOUT JSON RULES:**
-        You must strictly adhere to the specific Garmin ID and Key mappings for workouts:
-        - `sportType`: running (1), cycling (2), swimming (5), strength_training (9)
-        - `stepType`: warmup (1), cooldown (2), active (3), rest (4), recovery (5)
-        - `endCondition`: lap.button (1), time (2) [value in seconds], distance (3) [value in meters]
-        - `targetType` for Running: heart.rate.zone (4), pace.zone (2) 
-        - `targetType` for Cycling: power.zone (6), heart.rate.zone (4), cadence.zone (5)
-        - Do not output target values as strings, they MUST be numeric/integers (e.g. `targetValueOne`: 1).
-        - IF NO TARGET: use `no.target` (1). CRITICAL: If using no.target, you MUST OMIT the `targetValueOne`, `targetValueTwo`, and `zoneNumber` fields completely from that step's JSON. Sending them as null causes a server crash.
-        - CRITICAL: DO NOT include `segmentOrder` or `stepOrder` anywhere in the JSON. Garmin will reject the upload if you do.
-        - CRITICAL: For standard single-sport workouts, the `workoutSegments` array should usually contain exactly ONE item. However, for **MULTI-SPORT** (Brick/Transition) sessions, you MUST provide a separate segment for each sport discipline to ensure the timings add up correctly.
-        (Set "workout": null if it's a rest day/evening. Workout steps should be valid Garmin JSON structure.)
-        Output ONLY valid JSON.
+        A JSON object with `advice_text` and `workout`, exactly as specified in the system instructions.
         """
         
-        try:
-            logger.info("Sending request to Gemini...")
-            response = self._call_gemini_with_retry(prompt, generation_config={"response_mime_type": "application/json"})
-            return self._clean_json_response(response.text)
-        except Exception as e:
-            logger.error(f"Failed to generate advice with Gemini: {e}")
-            return '{"advice_text": "Sorry, I could not generate advice today.", "workout": null}'
+        logger.info("Sending request to Gemini...")
+        system = self.prompt_cache.static("advice", lambda: _ADVICE_OUTPUT_RULES)
+        return context.finish(PromptParts(system, "", prompt))
 
-    @rate_limit(max_calls=20, period=60)
-    def generate_chat_response(self, messages, user_context=None, language="en"):
-        """
-        Generate a conversational response based on chat history and user context.
-        """
-        # Context building
-        context_str = ""
-        if user_context:
-            context_str = f"User Context: {user_context}"
-            
+    def _chat_prompt(self, messages, user_context=None, language="en", user_key=None):
+        """Prompt for generate_chat_response(): static coach instructions, the athlete's context, then the chat."""
         target_language = self._get_target_language(language)
+        system = self.prompt_cache.static(("chat", target_language), lambda: self._chat_instructions(target_language))
+        context_str = self.prompt_cache.context(user_key, user_context, self._chat_context)
+
+        # Old messages are cut before new ones
+        history = PromptContext("chat")
+        history.add("history", "\n".join(f"{msg['role']}: {msg['content']}" for msg in messages), priority=1, keep="tail")
+        conversation_history = history.fit()["history"]
 
-        system_instruction = f"""
+        contents = f"Chat History:\n{conversation_history}\n\nCoach:"
+        logger.info(f"Sending chat request to Gemini (Language: {target_language})...")
+        return history.finish(PromptParts(system, context_str, contents))
+
+    def _chat_instructions(self, target_language):
+        """The coach persona and rules for chat; the same for every athlete with this language."""
+        return f"""
         You are an elite, empathetic, and data-driven sports coach.
         Your goal is to support the athlete's training, recovery, and mental state.
-        
-        {context_str}
+        The athlete's context, when available, follows these instructions.
         
         **Your Personality:**
         - Professional yet approachable.
@@ -444,24 +741,32 @@ class CoachBrain:
         
         Respond naturally to the last message in the history. Keep responses concise.
         """
-        
-        try:
-            conversation_history = "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages])
-            full_prompt = f"{system_instruction}\n\nChat History:\n{conversation_history}\n\nCoach:"
-            logger.info(f"Sending chat request to Gemini (Language: {target_language})...")
-            response = self._call_gemini_with_retry(full_prompt)
-            return response.text
-        except Exception as e:
-            logger.error(f"Failed to generate chat response: {e}")
-            return "Connection error. Please try again."
 
-    @rate_limit(max_calls=20, period=60)
-    def generate_structured_plan(self, duration_str, user_profile, activities_summary, health_stats, sleep_data=None, user_settings=None):
+    def _chat_context(self, user_context):
         """
-        Generate a structured training plan (JSON) for the dashboard.
+        The athlete's chat context fitted to its budget. Structured context (e.g. from Telegram)
+        is rendered per field; the training plan and briefing are cut before the settings.
         """
+        if not user_context:
+            return ""
+        context = PromptContext("chat_context")
+        if isinstance(user_context, dict):
+            for key, value in user_context.items():
+                render, priority = self.CHAT_CONTEXT_FIELDS.get(key, (render_value, 1))
+                context.add(key, render(value), priority)
+        else:
+            context.add("user_context", render_value(user_context), priority=1)
+        fitted = context.fit()
+        return "User Context:\n" + "\n".join(
+            f"{key}:\n{text}" if "\n" in text else f"{key}: {text}" for key, text in fitted.items() if text
+        )
+
+    def _structured_plan_prompt(self, duration_str, user_profile, activities_summary, health_stats, sleep_data=None, user_settings=None):
+        """Prompt for generate_structured_plan(): static plan rules, then the athlete's profile, readiness and load."""
         # Prepare context
-        activities_str = activities_summary.to_string() if hasattr(activities_summary, 'to_string') else str(activities_summary)
+        context = PromptContext("plan")
+        context.add("weekly_load", render_weekly_summary(activities_summary), priority=1)
+        activities_str = context.fit()["weekly_load"]
         
         # Safe extract
         user_settings = user_settings or {}
@@ -510,17 +815,10 @@ class CoachBrain:
             if sleep_secs:
                 sleep_duration = f"{sleep_secs / 3600:.1f} hrs"
         
-        # Build prompt
-        prompt = f"""
-        Act as an elite {sport} coach.
+        # Build prompt: static coaching rules per sport and language, then this athlete's data
+        system = self.prompt_cache.static(("plan", sport, target_language), lambda: self._plan_instructions(sport, target_language))
+        contents = f"""
         Create a **{duration_str}** professional structured training plan for this athlete.
-        
-        **CRITICAL INSTRUCTION: Analyze Context FIRST**
-        Before generating any activities, you MUST formulate your plan based heavily on these three pillars:
-        1. **User Settings & Profile**: The athlete's primary sport, performance limits, and explicitly stated goals.
-        2. **Recent Activities**: What training load they have accumulated recently (prevent overtraining if load is high).
-        3. **Physical & Mental Readiness**: Current recovery status (Sleep, Stress, Body Battery).
-        4. **Race Proximity (Tapering)**: Triathletes/endurance athletes should NOT have extreme low volume (e.g., 30 mins) 4-7 days before a race. Maintain moderate volume (1-2 hrs) and activation intervals. Extreme tapers (< 45 mins) should only happen 1-3 days out.
 
         **1. Athlete Profile & Settings:**
         - Name: {name}
@@ -537,14 +835,31 @@ class CoachBrain:
         
         **3. Recent Load (Activities):**
         {activities_str}
-        
+        """
+
+        logger.info("Generating professional structured plan...")
+        return context.finish(PromptParts(system, "", contents))
+
+    def _plan_instructions(self, sport, target_language):
+        """The plan coach persona, scheduling rules and output format; the same for every athlete with this sport and language."""
+        return f"""
+        Act as an elite {sport} coach creating professional structured training plans.
+        The athlete's profile, readiness and recent load follow these instructions.
+
+        **CRITICAL INSTRUCTION: Analyze Context FIRST**
+        Before generating any activities, you MUST formulate your plan based heavily on these three pillars:
+        1. **User Settings & Profile**: The athlete's primary sport, performance limits, and explicitly stated goals.
+        2. **Recent Activities**: What training load they have accumulated recently (prevent overtraining if load is high).
+        3. **Physical & Mental Readiness**: Current recovery status (Sleep, Stress, Body Battery).
+        4. **Race Proximity (Tapering)**: Triathletes/endurance athletes should NOT have extreme low volume (e.g., 30 mins) 4-7 days before a race. Maintain moderate volume (1-2 hrs) and activation intervals. Extreme tapers (< 45 mins) should only happen 1-3 days out.
+
         **Task:**
-        Based on the readiness metrics above, determine if the first few days of the plan need to be recovery-focused or if the athlete is primed for high intensity.
+        Based on the athlete's readiness metrics, determine if the first few days of the plan need to be recovery-focused or if the athlete is primed for high intensity.
         Generate a highly detailed, professional-grade training plan balancing progressive overload and recovery.
         For every workout, you MUST provide structured steps (Warmup, Main Set, Cooldown) and specific intensity targets.
         
         **CRITICAL SCHEDULING RULES:**
-        - You MUST strictly respect the Off Days ({off_days_context}). Set "Rest" for those days.
+        - You MUST strictly respect the Off Days listed in the athlete profile. Set "Rest" for those days.
         - If 'Time Constraint' is provided, strictly follow it! If 0 minutes, tell them to rest.
         - Emphasize recovery if Stress is high or Body Battery is low.
         - **UPCOMING RACE TAPER**: If a race is 4-7 days away, DO NOT drop volume excessively (e.g., don't prescribe just 30 mins). Prescribe moderate volume (1-2 hours of cycling or moderate running) with short race-pace intervals (activation). If a race is 1-3 days away, apply a sharp taper (rest or 15-30 min easy sessions).
@@ -595,137 +910,133 @@ class CoachBrain:
         - Ensure the content is in **{target_language}**.
         - Do not encompass the JSON in code blocks. Just valid JSON.
         """
+
+    def _activity_analysis_prompt(self, activity_data, user_settings=None):
+        """Prompt for analyze_activity(): static report instructions, then the workout's data."""
+        # Safely extract key metrics - handle various data structures from Garmin
+        # 'get_activity' can return different structures depending on activity type
+        summary = activity_data
+        if isinstance(activity_data, dict) and 'summaryDTO' in activity_data:
+            summary = activity_data['summaryDTO']
         
-        try:
-            logger.info("Generating professional structured plan...")
-            response = self._call_gemini_with_retry(prompt, generation_config={"response_mime_type": "application/json"})
-            return self._clean_json_response(response.text)
-        except Exception as e:
-            logger.error(f"Failed to generate plan: {e}")
-            return '{"error": "Failed to generate plan"}'
+        # Safely extract basic info with fallbacks
+        name = summary.get('activityName', 'Activity') if isinstance(summary, dict) else 'Activity'
+        
+        # Handle activityType which can be a dict or missing
+        type_info = summary.get('activityType', {}) if isinstance(summary, dict) else {}
+        type_key = type_info.get('typeKey', 'exercise') if isinstance(type_info, dict) else 'exercise'
+        
+        # Helper for safe float conversion
+        def safe_float(val):
+            try: 
+                return float(val) if val is not None else 0.0
+            except: 
+                return 0.0
 
-    @rate_limit(max_calls=20, period=60)
-    def analyze_activity(self, activity_data, user_settings=None):
-        """
-        Analyze a specific activity in detail.
-        """
-        try:
-            # Safely extract key metrics - handle various data structures from Garmin
-            # 'get_activity' can return different structures depending on activity type
-            summary = activity_data
-            if isinstance(activity_data, dict) and 'summaryDTO' in activity_data:
-                summary = activity_data['summaryDTO']
-            
-            # Safely extract basic info with fallbacks
-            name = summary.get('activityName', 'Activity') if isinstance(summary, dict) else 'Activity'
-            
-            # Handle activityType which can be a dict or missing
-            type_info = summary.get('activityType', {}) if isinstance(summary, dict) else {}
-            type_key = type_info.get('typeKey', 'exercise') if isinstance(type_info, dict) else 'exercise'
-            
-            # Helper for safe float conversion
-            def safe_float(val):
-                try: 
-                    return float(val) if val is not None else 0.0
-                except: 
-                    return 0.0
-
-            # Safely extract metrics with defaults
-            dist = safe_float(summary.get('distance', 0) if isinstance(summary, dict) else 0)
-            dist_km = dist / 1000
-            
-            duration = safe_float(summary.get('duration', 0) if isinstance(summary, dict) else 0)
-            duration_min = duration / 60 if duration > 0 else 0
-            
-            avg_hr = summary.get('averageHR', 'N/A') if isinstance(summary, dict) else 'N/A'
-            max_hr = summary.get('maxHR', 'N/A') if isinstance(summary, dict) else 'N/A'
-            
-            avg_speed = safe_float(summary.get('averageSpeed', 0) if isinstance(summary, dict) else 0)
-            
-            # approximate pace calculation (min/km)
-            avg_pace_str = "N/A"
-            if avg_speed > 0:
-                pace_per_km_sec = 1000 / avg_speed
-                p_min = int(pace_per_km_sec // 60)
-                p_sec = int(pace_per_km_sec % 60)
-                avg_pace_str = f"{p_min}:{p_sec:02d} /km"
-
-            # Laps/Splits context - handle missing or unexpected structures
-            splits_context = ""
-            laps = []
+        # Safely extract metrics with defaults
+        dist = safe_float(summary.get('distance', 0) if isinstance(summary, dict) else 0)
+        dist_km = dist / 1000
+        
+        duration = safe_float(summary.get('duration', 0) if isinstance(summary, dict) else 0)
+        duration_min = duration / 60 if duration > 0 else 0
+        
+        avg_hr = summary.get('averageHR', 'N/A') if isinstance(summary, dict) else 'N/A'
+        max_hr = summary.get('maxHR', 'N/A') if isinstance(summary, dict) else 'N/A'
+        
+        avg_speed = safe_float(summary.get('averageSpeed', 0) if isinstance(summary, dict) else 0)
+        
+        # approximate pace calculation (min/km)
+        avg_pace_str = "N/A"
+        if avg_speed > 0:
+            pace_per_km_sec = 1000 / avg_speed
+            p_min = int(pace_per_km_sec // 60)
+            p_sec = int(pace_per_km_sec % 60)
+            avg_pace_str = f"{p_min}:{p_sec:02d} /km"
+
+        # Laps/Splits context - handle missing or unexpected structures
+        splits_context = ""
+        laps = []
+        
+        # Try to extract splits from various possible structures
+        if isinstance(activity_data, dict):
+            splits_data = activity_data.get('splits')
             
-            # Try to extract splits from various possible structures
-            if isinstance(activity_data, dict):
-                splits_data = activity_data.get('splits')
-                
-                if splits_data:
-                    if isinstance(splits_data, dict) and 'lapDTOs' in splits_data:
-                        laps = splits_data['lapDTOs']
-                    elif isinstance(splits_data, list):
-                        laps = splits_data
-                 
-            # Only process laps if we actually have them
-            if laps and isinstance(laps, list) and len(laps) > 0:
-                splits_context = "Splits/Laps (First 10):\n"
-                for i, lap in enumerate(laps[:10]):
-                    if not isinstance(lap, dict):
-                        continue
-                        
-                    l_dur = safe_float(lap.get('duration', 0))
-                    l_dist = safe_float(lap.get('distance', 0))
-                    l_hr = lap.get('averageHR', 'N/A')
-                    l_speed = safe_float(lap.get('averageSpeed', 0))
-                    l_pace = "N/A"
-                    if l_speed > 0:
-                        l_p_sec = 1000 / l_speed
-                        l_pace = f"{int(l_p_sec//60)}:{int(l_p_sec%60):02d}"
+            if splits_data:
+                if isinstance(splits_data, dict) and 'lapDTOs' in splits_data:
+                    laps = splits_data['lapDTOs']
+                elif isinstance(splits_data, list):
+                    laps = splits_data
+             
+        # Only process laps if we actually have them
+        if laps and isinstance(laps, list) and len(laps) > 0:
+            splits_context = "Splits/Laps (First 10):\n"
+            for i, lap in enumerate(laps[:10]):
+                if not isinstance(lap, dict):
+                    continue
                     
-                    splits_context += f"- Lap {i+1}: {l_dist:.0f}m in {l_dur:.0f}s, Avg HR {l_hr}, Pace {l_pace}\n"
-            else:
-                splits_context = "No detailed lap/split data available for this activity.\n"
-
-            # Settings for personalization
-            sport_context = "Endurance Sports"
-            language_code = "en"
-            if user_settings:
-                sport_context = user_settings.get("primary_sport", "Endurance Sports")
-                language_code = user_settings.get("language", "en")
+                l_dur = safe_float(lap.get('duration', 0))
+                l_dist = safe_float(lap.get('distance', 0))
+                l_hr = lap.get('averageHR', 'N/A')
+                l_speed = safe_float(lap.get('averageSpeed', 0))
+                l_pace = "N/A"
+                if l_speed > 0:
+                    l_p_sec = 1000 / l_speed
+                    l_pace = f"{int(l_p_sec//60)}:{int(l_p_sec%60):02d}"
                 
-            target_language = self._get_target_language(language_code)
+                splits_context += f"- Lap {i+1}: {l_dist:.0f}m in {l_dur:.0f}s, Avg HR {l_hr}, Pace {l_pace}\n"
+        else:
+            splits_context = "No detailed lap/split data available for this activity.\n"
+        context = PromptContext("analysis")
+        context.add("splits", splits_context, priority=1)
+        splits_context = context.fit()["splits"]
 
-            prompt = f"""
-            Act as an elite {sport_context} coach analyzing this workout: "{name}" ({type_key}).
-            
-            **Workout Data:**
-            - Distance: {dist_km:.2f} km
-            - Duration: {duration_min:.1f} min
-            - Avg HR: {avg_hr} bpm (Max: {max_hr})
-            - Avg Pace: {avg_pace_str}
-            
-            {splits_context}
-            
-            **Task:**
-            Provide a professional, structured analysis in {target_language} with these sections. 
-            CRITICAL: You MUST translate the section headers into {target_language} as well, but KEEP the emojis exactly as shown below:
-            
-            📊 PERFORMANCE SUMMARY
-            One sentence summarizing the workout type and execution quality.
-            
-            💓 HEART RATE & EFFORT ANALYSIS  
-            2-3 sentences analyzing HR zones, effort level, and pacing strategy based on the data.
-            
-            🎯 COACHING INSIGHTS
-            2-3 sentences with specific recommendations for improvement or what to maintain in future sessions.
-            
-            Keep each section concise and professional.
-            """
+        # Settings for personalization
+        sport_context = "Endurance Sports"
+        language_code = "en"
+        if user_settings:
+            sport_context = user_settings.get("primary_sport", "Endurance Sports")
+            language_code = user_settings.get("language", "en")
             
-            logger.info(f"Analyzing activity {name} with Gemini...")
-            response = self._call_gemini_with_retry(prompt)
-            return response.text
-        except Exception as e:
-            logger.error(f"Failed to analyze activity: {e}", exc_info=True)
-            return "Could not analyze activity due to an internal error."
+        target_language = self._get_target_language(language_code)
+
+        system = self.prompt_cache.static(("analysis", sport_context, target_language),
+                                          lambda: self._analysis_instructions(sport_context, target_language))
+        contents = f"""
+        Analyze this workout: "{name}" ({type_key}).
+        
+        **Workout Data:**
+        - Distance: {dist_km:.2f} km
+        - Duration: {duration_min:.1f} min
+        - Avg HR: {avg_hr} bpm (Max: {max_hr})
+        - Avg Pace: {avg_pace_str}
+        
+        {splits_context}
+        """
+        
+        logger.info(f"Analyzing activity {name} with Gemini...")
+        return context.finish(PromptParts(system, "", contents))
+
+    def _analysis_instructions(self, sport, target_language):
+        """The analysis coach persona and report sections; the same for every workout with this sport and language."""
+        return f"""
+        Act as an elite {sport} coach analyzing a single workout.
+        The workout's data follows these instructions.
+        
+        **Task:**
+        Provide a professional, structured analysis in {target_language} with these sections. 
+        CRITICAL: You MUST translate the section headers into {target_language} as well, but KEEP the emojis exactly as shown below:
+        
+        📊 PERFORMANCE SUMMARY
+        One sentence summarizing the workout type and execution quality.
+        
+        💓 HEART RATE & EFFORT ANALYSIS  
+        2-3 sentences analyzing HR zones, effort level, and pacing strategy based on the data.
+        
+        🎯 COACHING INSIGHTS
+        2-3 sentences with specific recommendations for improvement or what to maintain in future sessions.
+        
+        Keep each section concise and professional.
+        """
 
     def _clean_json_response(self, response_text):
         """Enhanced JSON cleaning with validation"""
@@ -760,7 +1071,7 @@ class CoachBrain:
                     pass
             
             # Return safe fallback
-            return '{"advice_text": "AI response formatting error", "workout": null}'
+            return self.JSON_FORMAT_FALLBACK
 
 if __name__ == "__main__":
     # simple test
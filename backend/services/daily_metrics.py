@@ -0,0 +1,300 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import statistics
+from datetime import date, datetime, timedelta
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from backend.services.garmin_client import GarminClient
+from backend.services.garmin_async_client import AsyncGarminClient
+from backend.services.garmin_rate_governor import RATE_GOVERNOR
+from backend.services.garmin_egress import GARMIN_EGRESS
+from backend.services.activity_store import ACTIVITY_STORE
+from backend.services.data_processor import DataProcessor
+from backend.utils import sanitize_for_json
+
+logger = logging.getLogger(__name__)
+
+DAILY_METRICS_CACHE_KEY = "cache_daily_metrics"
+DAILY_METRICS_CACHE_TTL = 900  # 15 minutes
+ACCESS_HISTORY_KEY = "daily_metrics_access"
+
+
+async def build_daily_metrics(async_client, today=None):
+    """Fetch and assemble the /daily-metrics payload (JSON-ready, without auth token fields)."""
+    processor = DataProcessor()
+
+    # Fetch Data Concurrently (awaited directly — no executor threads held)
+    activities, health_stats, sleep_data, profile, vo2_max_data = await asyncio.gather(
+        ACTIVITY_STORE.get_recent(async_client, 60),
+        async_client.get_health_stats(),
+        async_client.get_sleep_data(),
+        async_client.get_profile(),
+        async_client.get_vo2_max()
+    )
+
+    # Merge VO2 max data into profile if available
+    if vo2_max_data and profile:
+        profile.update(vo2_max_data)
+
+    # Process Data for summary block
+    processed_activities = processor.process_activities(activities)
+    activities_summary_dict = processor.calculate_weekly_summary(processed_activities)
+
+    # Filter for TODAY'S activities
+    today_str = (today or date.today()).isoformat()
+    todays_activities = [row for row in processed_activities or [] if row.get('date', '').startswith(today_str)]
+
+    return sanitize_for_json({
+        "metrics": {
+            "health": health_stats,
+            "sleep": sleep_data,
+            "weekly_volume": activities_summary_dict,
+            "recent_activities": activities,
+            "profile": profile
+        },
+        "todays_activities": todays_activities  # Pass down for the AI to use later
+    })
+
+
+def store_daily_metrics(db, user_id, data, setting=None):
+    """Save a /daily-metrics payload to the per-user DB cache."""
+    from backend.models import UserSetting
+    try:
+        if setting is None:
+            setting = db.query(UserSetting).filter(
+                UserSetting.user_id == user_id,
+                UserSetting.key == DAILY_METRICS_CACHE_KEY
+            ).first()
+        if not setting:
+            setting = UserSetting(user_id=user_id, key=DAILY_METRICS_CACHE_KEY)
+            db.add(setting)
+        setting.value = {"timestamp": time.time(), "data": data}
+        db.commit()
+        return True
+    except Exception as e:
+        logger.error(f"Failed to save metrics cache: {e}")
+        db.rollback()
+        return False
+
+
+class DailyMetricsPrewarmer:
+    """
+    Refreshes a user's cached /daily-metrics shortly before they usually open the app.
+
+    The first /daily-metrics request of each (UTC) day is recorded per user. Once a
+    user has `min_samples` days of history, the median first-access time is their
+    typical open time, stored (indexed) when the access is recorded so each tick
+    only queries users whose window contains now; the scheduler refreshes their cache `lead_minutes` before it
+    (plus random jitter so users with the same habit don't hit Garmin at the same
+    second), only for users with a resumable Garmin session, and only while the
+    rate governor has headroom — user-facing requests always win. Every worker runs
+    the scheduler, so each (user, day) is claimed in the database first and only the
+    worker whose claim row was inserted warms that user.
+    """
+
+    def __init__(self, lead_minutes=10, jitter_minutes=5, interval=60, history_days=14,
+                 min_samples=3, concurrency=2, calls_per_warm=8):
+        self.lead = timedelta(minutes=lead_minutes)
+        self.jitter = jitter_minutes * 60
+        self.interval = interval
+        self.history_days = history_days
+        self.min_samples = min_samples
+        self.calls_per_warm = calls_per_warm
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._recorded = set()  # (user_id, day) whose first access is already stored
+        self._scheduled = {}  # user_id -> day this worker already handled (claimed here or elsewhere)
+        self._claims_cleaned_on = None  # Day old claim rows were last deleted
+        self._task = None
+        self._warmups = set()  # Strong references to pending warm-up tasks
+        self._stats = {"scheduled": 0, "warmed": 0, "skipped": 0, "failed": 0}
+
+    # --- access history -------------------------------------------------------
+
+    @staticmethod
+    def _session():
+        from backend.database import SessionLocal
+        return SessionLocal()
+
+    def record_access(self, db, user_id, now=None):
+        """Remember the first /daily-metrics access of the day and the resulting typical
+        open time (one DB write per user per day)."""
+        from backend.models import UserSetting, DailyMetricsSchedule
+        now = now or datetime.utcnow()
+        day = now.date().isoformat()
+        if (user_id, day) in self._recorded:
+            return
+        try:
+            setting = db.query(UserSetting).filter(
+                UserSetting.user_id == user_id,
+                UserSetting.key == ACCESS_HISTORY_KEY
+            ).first()
+            history = dict(setting.value or {}) if setting else {}
+            if day not in history:
+                history[day] = now.hour * 60 + now.minute
+                history = dict(sorted(history.items())[-self.history_days:])
+                if not setting:
+                    setting = UserSetting(user_id=user_id, key=ACCESS_HISTORY_KEY)
+                    db.add(setting)
+                setting.value = history
+                schedule = db.query(DailyMetricsSchedule).filter(DailyMetricsSchedule.user_id == user_id).first()
+                if not schedule:
+                    schedule = DailyMetricsSchedule(user_id=user_id)
+                    db.add(schedule)
+                schedule.typical_minute = self.typical_first_access(history)
+                schedule.last_access_day = day
+                db.commit()
+            self._recorded.add((user_id, day))
+            if len(self._recorded) > 50000:
+                self._recorded = {entry for entry in self._recorded if entry[1] == day}
+        except Exception as e:
+            logger.warning(f"Could not record daily-metrics access for user {user_id}: {e}")
+            db.rollback()
+
+    def typical_first_access(self, history):
+        """Median first-access minute of day (UTC), or None without enough history."""
+        minutes = list((history or {}).values())
+        if len(minutes) < self.min_samples:
+            return None
+        return statistics.median_low(minutes)
+
+    def _claim(self, db, user_id, day):
+        """Claim the (user, day) warm-up for this worker. False when another worker already claimed it."""
+        from backend.models import DailyMetricsPrewarmClaim
+        try:
+            db.add(DailyMetricsPrewarmClaim(user_id=user_id, day=day.isoformat()))
+            db.commit()
+            return True
+        except IntegrityError:
+            db.rollback()
+            return False
+
+    def _forget_claims(self, db, today):
+        """Drop claims from before yesterday; they can no longer block anything."""
+        from backend.models import DailyMetricsPrewarmClaim
+        try:
+            db.query(DailyMetricsPrewarmClaim).filter(
+                DailyMetricsPrewarmClaim.day < (today - timedelta(days=1)).isoformat()
+            ).delete(synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            logger.warning(f"Could not clean up daily-metrics pre-warm claims: {e}")
+            db.rollback()
+
+    def _due_users(self, now):
+        """[(user_id, garmin_email, warm_at)] for users whose usual open time is coming up,
+        each claimed for this worker (users another worker claimed are left out)."""
+        from backend.models import User, DailyMetricsSchedule
+        db = self._session()
+        try:
+            today = now.date()
+            midnight = datetime.combine(today, datetime.min.time())
+            # start - interval <= now < usual, with start = usual - lead
+            minutes_now = (now - midnight).total_seconds() / 60
+            horizon = minutes_now + (self.lead.total_seconds() + self.interval) / 60
+            rows = db.query(DailyMetricsSchedule.user_id, DailyMetricsSchedule.typical_minute, User.garmin_email).join(
+                User, User.id == DailyMetricsSchedule.user_id
+            ).filter(
+                DailyMetricsSchedule.typical_minute > minutes_now,
+                DailyMetricsSchedule.typical_minute <= horizon,
+                or_(DailyMetricsSchedule.last_access_day.is_(None), DailyMetricsSchedule.last_access_day != today.isoformat()),
+                User.garmin_email.isnot(None),
+            ).all()
+            due = []
+            for user_id, minute, garmin_email in rows:
+                if self._scheduled.get(user_id) == today:
+                    continue  # Already handled by this worker
+                self._scheduled[user_id] = today
+                if self._claim(db, user_id, today):
+                    start = midnight + timedelta(minutes=minute) - self.lead
+                    due.append((user_id, garmin_email, start + timedelta(seconds=random.uniform(0, self.jitter))))
+            if self._claims_cleaned_on != today:
+                self._forget_claims(db, today)
+                self._claims_cleaned_on = today
+            return due
+        finally:
+            db.close()
+
+    # --- warming --------------------------------------------------------------
+
+    async def warm(self, user_id, garmin_email):
+        """Refresh one user's daily-metrics cache. Returns True if the cache was written."""
+        if RATE_GOVERNOR.headroom(garmin_email, GARMIN_EGRESS.pick(garmin_email)) < self.calls_per_warm:
+            logger.info(f"Skipping daily-metrics pre-warm for user {user_id}: Garmin rate budget is busy")
+            self._stats["skipped"] += 1
+            return False
+
+        async with self._semaphore:
+            db = self._session()
+            try:
+                # Only resume stored sessions; never start an SSO login (or an MFA prompt) unattended
+                client = GarminClient(garmin_email, None, user_id=user_id)
+                success, _, msg = await asyncio.to_thread(client.login, db, None, True)
+                if not success:
+                    logger.info(f"Skipping daily-metrics pre-warm for user {user_id}: {msg}")
+                    self._stats["skipped"] += 1
+                    return False
+
+                data = await build_daily_metrics(AsyncGarminClient(client))
+                if not await asyncio.to_thread(store_daily_metrics, db, user_id, data):
+                    self._stats["failed"] += 1
+                    return False
+                self._stats["warmed"] += 1
+                logger.info(f"✅ Pre-warmed daily metrics for user {user_id}")
+                return True
+            except Exception as e:
+                logger.warning(f"⚠️ Daily-metrics pre-warm failed for user {user_id}: {e}")
+                self._stats["failed"] += 1
+                return False
+            finally:
+                db.close()
+
+    async def _warm_at(self, user_id, garmin_email, warm_at):
+        await asyncio.sleep(max(0.0, (warm_at - datetime.utcnow()).total_seconds()))
+        await self.warm(user_id, garmin_email)
+
+    async def tick(self, now=None):
+        """Schedule warm-ups for users whose usual open time is within the lead window."""
+        now = now or datetime.utcnow()
+        for user_id, garmin_email, warm_at in await asyncio.to_thread(self._due_users, now):
+            self._stats["scheduled"] += 1
+            task = asyncio.create_task(self._warm_at(user_id, garmin_email, warm_at))
+            self._warmups.add(task)
+            task.add_done_callback(self._warmups.discard)
+        # Forget schedules from previous days
+        self._scheduled = {uid: day for uid, day in self._scheduled.items() if day == now.date()}
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.tick()
+            except Exception as e:
+                logger.warning(f"⚠️ Daily-metrics pre-warm scheduler tick failed: {e}")
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        for task in list(self._warmups):
+            task.cancel()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        return {**self._stats, "pending": len(self._warmups)}
+
+
+DAILY_METRICS_PREWARMER = DailyMetricsPrewarmer(
+    lead_minutes=float(os.getenv("DAILY_METRICS_PREWARM_LEAD_MINUTES", "10")),
+    jitter_minutes=float(os.getenv("DAILY_METRICS_PREWARM_JITTER_MINUTES", "5")),
+    interval=float(os.getenv("DAILY_METRICS_PREWARM_INTERVAL", "60")),
+)
@@ -0,0 +1,234 @@
+import os
+import time
+import logging
+import threading
+from datetime import datetime
+from garminconnect import GarminConnectTooManyRequestsError
+
+logger = logging.getLogger(__name__)
+
+
+def _is_rate_limited(error):
+    message = str(error)
+    return isinstance(error, GarminConnectTooManyRequestsError) or "429" in message or "Too Many Requests" in message
+
+
+class EndpointHealthRegistry:
+    """
+    Learns which variant of a Garmin endpoint actually works.
+
+    Code paths with fallbacks (schedule_workout V2/V3/legacy, the VO2 max
+    sources, session verification) report each attempt here. Variants are then
+    tried best-first: by a moving success score, then latency, then their
+    declared order. After `dead_after` consecutive failures a variant is skipped
+    for `probe_interval` seconds; the next call after that tries it first once
+    more, and a success revives it. If every variant is dead they are all tried
+    anyway — that can't be worse than the old fixed order.
+
+    Rate-limit errors say nothing about an endpoint and are not recorded. State
+    is per worker, loaded from the garmin_endpoint_health table at startup and
+    flushed back every `flush_interval` seconds.
+    """
+
+    def __init__(self, dead_after=3, probe_interval=3600, flush_interval=60, alpha=0.2):
+        self.dead_after = dead_after
+        self.probe_interval = probe_interval
+        self.flush_interval = flush_interval
+        self.alpha = alpha
+        self._stats = {}  # (group, variant) -> dict
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._last_flush = time.time()
+
+    @staticmethod
+    def _session():
+        from backend.database import SessionLocal
+        return SessionLocal()
+
+    @staticmethod
+    def _new_entry():
+        return {"attempts": 0, "successes": 0, "consecutive_failures": 0, "score": 1.0,
+                "latency_ms": None, "dead_until": 0.0}
+
+    def _entry(self, group, variant):
+        entry = self._stats.get((group, variant))
+        if entry is None:
+            entry = self._stats[(group, variant)] = self._new_entry()
+        return entry
+
+    # --- selection --------------------------------------------------------
+
+    def _claim(self, entry, now):
+        """True if the variant may be called: alive, or dead with its probe due (claimed for this caller)."""
+        if entry["dead_until"] > now:
+            return False
+        if entry["dead_until"]:
+            # Probe due: let this caller test it, hold everyone else off for another interval
+            entry["dead_until"] = now + self.probe_interval
+        return True
+
+    def order(self, group, variants):
+        """Variants to try, best first (a due probe goes first). Dead variants are left out."""
+        self._ensure_loaded()
+        now = time.time()
+        with self._lock:
+            alive, probes = [], []
+            for index, variant in enumerate(variants):
+                entry = self._entry(group, variant)
+                probing = entry["dead_until"] and entry["dead_until"] <= now
+                if not self._claim(entry, now):
+                    continue
+                if probing:
+                    probes.append(variant)
+                else:
+                    # Untried variants (no latency yet) rank after proven ones with the same score
+                    latency = entry["latency_ms"] if entry["latency_ms"] is not None else float("inf")
+                    alive.append(((-round(entry["score"], 1), latency, index), variant))
+            if not alive and not probes:
+                return list(variants)
+            return probes + [variant for _, variant in sorted(alive)]
+
+    def usable(self, group, variant):
+        """For sources queried concurrently: False while a variant is dead and not due for a probe."""
+        self._ensure_loaded()
+        with self._lock:
+            return self._claim(self._entry(group, variant), time.time())
+
+    # --- reporting --------------------------------------------------------
+
+    def record(self, group, variant, ok, latency=None):
+        now = time.time()
+        with self._lock:
+            entry = self._entry(group, variant)
+            entry["attempts"] += 1
+            entry["score"] = (1 - self.alpha) * entry["score"] + self.alpha * (1.0 if ok else 0.0)
+            if ok:
+                entry["successes"] += 1
+                entry["consecutive_failures"] = 0
+                if entry["dead_until"]:
+                    logger.info(f"✅ Garmin endpoint {group}/{variant} recovered")
+                entry["dead_until"] = 0.0
+                if latency is not None:
+                    ms = latency * 1000
+                    entry["latency_ms"] = ms if entry["latency_ms"] is None else 0.8 * entry["latency_ms"] + 0.2 * ms
+            else:
+                entry["consecutive_failures"] += 1
+                if entry["consecutive_failures"] >= self.dead_after and entry["dead_until"] <= now:
+                    entry["dead_until"] = now + self.probe_interval
+                    logger.warning(f"⚠️ Garmin endpoint {group}/{variant} failed {entry['consecutive_failures']}x in a row; skipping it for {self.probe_interval}s")
+            self._dirty.add((group, variant))
+            flush_due = now - self._last_flush >= self.flush_interval
+            if flush_due:
+                self._last_flush = now
+        if flush_due:
+            threading.Thread(target=self.flush, daemon=True).start()
+
+    def call(self, group, variant, fn, *args, **kwargs):
+        """Run a sync endpoint variant and record the outcome. Exceptions propagate."""
+        start = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if not _is_rate_limited(e):
+                self.record(group, variant, False)
+            raise
+        self.record(group, variant, True, time.monotonic() - start)
+        return result
+
+    async def track(self, group, variant, awaitable):
+        """Await an endpoint variant and record the outcome. Exceptions propagate; cancellation isn't recorded."""
+        start = time.monotonic()
+        try:
+            result = await awaitable
+        except Exception as e:
+            if not _is_rate_limited(e):
+                self.record(group, variant, False)
+            raise
+        self.record(group, variant, True, time.monotonic() - start)
+        return result
+
+    # --- persistence ------------------------------------------------------
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def load(self):
+        from backend.models import GarminEndpointHealth
+        db = self._session()
+        try:
+            rows = db.query(GarminEndpointHealth).all()
+            with self._lock:
+                for row in rows:
+                    key = (row.endpoint_group, row.variant)
+                    if key in self._dirty:
+                        continue  # Fresher in memory
+                    self._stats[key] = {
+                        "attempts": row.attempts or 0,
+                        "successes": row.successes or 0,
+                        "consecutive_failures": row.consecutive_failures or 0,
+                        "score": row.score if row.score is not None else 1.0,
+                        "latency_ms": row.latency_ms,
+                        "dead_until": row.dead_until.timestamp() if row.dead_until else 0.0,
+                    }
+        except Exception as e:
+            logger.warning(f"Could not load Garmin endpoint health: {e}")
+        finally:
+            self._loaded = True
+            db.close()
+
+    def flush(self):
+        from backend.models import GarminEndpointHealth
+        with self._lock:
+            dirty = {key: dict(self._stats[key]) for key in self._dirty}
+            self._dirty.clear()
+        if not dirty:
+            return
+        db = self._session()
+        try:
+            rows = {
+                (row.endpoint_group, row.variant): row
+                for row in db.query(GarminEndpointHealth).filter(
+                    GarminEndpointHealth.endpoint_group.in_({group for group, _ in dirty})
+                ).all()
+            }
+            for (group, variant), entry in dirty.items():
+                row = rows.get((group, variant))
+                if not row:
+                    row = GarminEndpointHealth(endpoint_group=group, variant=variant)
+                    db.add(row)
+                row.attempts = entry["attempts"]
+                row.successes = entry["successes"]
+                row.consecutive_failures = entry["consecutive_failures"]
+                row.score = entry["score"]
+                row.latency_ms = entry["latency_ms"]
+                row.dead_until = datetime.fromtimestamp(entry["dead_until"]) if entry["dead_until"] else None
+            db.commit()
+        except Exception as e:
+            logger.warning(f"Could not persist Garmin endpoint health: {e}")
+            db.rollback()
+            with self._lock:
+                self._dirty.update(dirty)
+        finally:
+            db.close()
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            return {
+                f"{group}/{variant}": {
+                    "attempts": entry["attempts"],
+                    "success_rate": round(entry["successes"] / entry["attempts"], 3) if entry["attempts"] else None,
+                    "score": round(entry["score"], 3),
+                    "latency_ms": round(entry["latency_ms"], 1) if entry["latency_ms"] is not None else None,
+                    "dead_for": round(max(0.0, entry["dead_until"] - now)),
+                }
+                for (group, variant), entry in self._stats.items()
+            }
+
+
+ENDPOINT_HEALTH = EndpointHealthRegistry(
+    dead_after=int(os.getenv("GARMIN_ENDPOINT_DEAD_AFTER", "3")),
+    probe_interval=float(os.getenv("GARMIN_ENDPOINT_PROBE_INTERVAL", "3600")),
+)
@@ -0,0 +1,818 @@
+import json
+import time
+import asyncio
+import logging
+import traceback
+import weakref
+from collections import OrderedDict
+import httpx
+from datetime import date, timedelta
+from garth.auth_tokens import OAuth2Token
+from garth.http import USER_AGENT
+from garminconnect import (
+    GarminConnectAuthenticationError,
+    GarminConnectConnectionError,
+    GarminConnectTooManyRequestsError,
+)
+from backend.services.garmin_client import (
+    GarminClient,
+    GarminAPIEndpoints,
+    _vo2_from_training_status,
+    _vo2_from_max_metrics,
+    _fitness_age_from_stats,
+    _log_missing_vo2,
+    _flatten_yearly_progress,
+)
+from backend.services.garmin_singleflight import coalesced
+from backend.services.garmin_cache import GARMIN_CACHE, cached
+from backend.services.garmin_rate_governor import RATE_GOVERNOR, parse_retry_after
+from backend.services.garmin_egress import GARMIN_EGRESS
+from backend.services.vo2_store import VO2_STORE
+from backend.services.endpoint_health import ENDPOINT_HEALTH
+from backend.services.activity_details_store import ACTIVITY_DETAILS_STORE, ACTIVITY_DETAIL_COMPONENTS, is_finished
+from backend.utils import sanitize_for_json
+
+logger = logging.getLogger(__name__)
+
+# Most recent date with populated data — Key: (email, kind), Value: date.
+# Lets lookbacks skip probing days older than data that is known to exist.
+_LAST_POPULATED = OrderedDict()
+_LAST_POPULATED_MAX = 5000
+
+# Max days per request accepted by Garmin's daily stats range endpoints
+SLEEP_SCORE_PAGE_DAYS = 28
+
+# Daily summary fields the health history uses (what get_daily_summaries returns per day)
+DAILY_SUMMARY_FIELDS = ("restingHeartRate", "maxHeartRate", "averageStressLevel",
+                        "bodyBatteryHighestValue", "bodyBatteryLargestChargedValue", "sleepingSeconds")
+# Seconds a daily summary is cached for when the per-day call failed and only range data is known
+PARTIAL_SUMMARY_TTL = 60 * 60
+
+# Strong references to fire-and-forget tasks so they aren't garbage collected mid-flight
+_BACKGROUND_TASKS = set()
+
+# Serializes OAuth2 refreshes per email so concurrent calls don't each hit oauth/exchange.
+# Weak values: a lock disappears as soon as no refresh is using it.
+_REFRESH_LOCKS = weakref.WeakValueDictionary()
+
+
+def _range_pages(days, page_days=SLEEP_SCORE_PAGE_DAYS):
+    """Split the span of sorted ISO days into [(first date, last date)] pages of at most page_days."""
+    page_start, last = date.fromisoformat(days[0]), date.fromisoformat(days[-1])
+    pages = []
+    while page_start <= last:
+        page_end = min(last, page_start + timedelta(days=page_days - 1))
+        pages.append((page_start, page_end))
+        page_start = page_end + timedelta(days=1)
+    return pages
+
+
+def _body_battery_high(report):
+    """Highest body battery level in a daily report ([timestamp, level] pairs), or None."""
+    levels = [v[1] for v in report.get("bodyBatteryValuesArray") or [] if isinstance(v, list) and len(v) > 1
+              and isinstance(v[1], (int, float))]
+    return max(levels) if levels else None
+
+
+def _remember_populated(email, kind, day):
+    key = (email, kind)
+    previous = _LAST_POPULATED.get(key)
+    if previous is None or day > previous:
+        _LAST_POPULATED[key] = day
+    _LAST_POPULATED.move_to_end(key)
+    while len(_LAST_POPULATED) > _LAST_POPULATED_MAX:
+        _LAST_POPULATED.popitem(last=False)
+
+
+def _get_http_client(proxy_url=None) -> httpx.AsyncClient:
+    # Shared keep-alive pool per egress proxy: every user request on a worker
+    # reuses the same connections instead of each opening its own
+    return GARMIN_EGRESS.http_client(proxy_url)
+
+
+async def close_http_clients():
+    """Close all pooled Garmin HTTP connections (called on app shutdown)."""
+    await GARMIN_EGRESS.close()
+
+
+class AsyncGarminClient:
+    """Async-native counterpart to GarminClient.
+
+    Wraps an authenticated GarminClient and reuses its garth tokens, but performs
+    data calls over a pooled httpx.AsyncClient so routers can await them directly
+    without holding an executor thread while waiting on Garmin. Read calls are
+    served from the two-tier response cache (see garmin_cache.TTL_POLICIES), and
+    identical misses for the same account that overlap in time share one
+    upstream request.
+    """
+
+    def __init__(self, garmin_client: GarminClient):
+        self.sync_client = garmin_client
+        self.email = garmin_client.email
+        self.user_id = garmin_client.user_id
+
+    @property
+    def client(self):
+        """The underlying garminconnect.Garmin instance (None if not authenticated)."""
+        return self.sync_client.client
+
+    async def _ensure_oauth2(self):
+        garth_client = self.client.garth
+        token = garth_client.oauth2_token
+        if isinstance(token, OAuth2Token) and not token.expired:
+            return
+        lock = _REFRESH_LOCKS.get(self.email)
+        if lock is None:
+            lock = _REFRESH_LOCKS[self.email] = asyncio.Lock()
+        async with lock:
+            token = garth_client.oauth2_token
+            if not isinstance(token, OAuth2Token) or token.expired:
+                logger.info(f"Refreshing Garmin OAuth2 token for {self.email}")
+                await asyncio.to_thread(garth_client.refresh_oauth2)
+
+    async def invalidate_cache(self, *methods):
+        """Drop this account's cached Garmin responses (all, or only the given method names)."""
+        await asyncio.to_thread(GARMIN_CACHE.invalidate, self.email, *methods)
+
+    async def connectapi(self, path, method="GET", **kwargs):
+        """Async equivalent of Garmin.connectapi(); raises the same garminconnect exceptions."""
+        await self._ensure_oauth2()
+        garth_client = self.client.garth
+        url = f"https://connectapi.{garth_client.domain}{path}"
+        headers = {"Authorization": str(garth_client.oauth2_token)}
+
+        proxy_url = GARMIN_EGRESS.pick(self.email)
+        for attempt in range(1, 3):
+            http = _get_http_client(proxy_url)
+            await RATE_GOVERNOR.acquire(self.email, proxy_url)
+            start = time.monotonic()
+            try:
+                resp = await http.request(method, url, headers=headers, **kwargs)
+                break
+            except httpx.RemoteProtocolError as e:
+                # Stale keep-alive socket — retry once on a fresh connection
+                if attempt < 2:
+                    logger.debug(f"Stale connection for {path}, retrying: {e}")
+                    continue
+                raise GarminConnectConnectionError(f"Connection error: {e}") from e
+            except (httpx.ProxyError, httpx.ConnectError, httpx.ConnectTimeout) as e:
+                GARMIN_EGRESS.record(proxy_url, False, error=e)
+                # The request never reached Garmin — safe to retry once through another proxy
+                retry_url = GARMIN_EGRESS.pick(self.email, avoid=proxy_url) if attempt < 2 else proxy_url
+                if retry_url != proxy_url:
+                    logger.info(f"Proxy failed for {path}, retrying through another one: {e}")
+                    proxy_url = retry_url
+                    continue
+                prefix = "PROXY_FAILURE" if proxy_url else "Connection error"
+                raise GarminConnectConnectionError(f"{prefix}: {e}") from e
+            except httpx.HTTPError as e:
+                GARMIN_EGRESS.record(proxy_url, False, error=e)
+                raise GarminConnectConnectionError(f"Connection error: {e}") from e
+
+        status = resp.status_code
+        retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+        GARMIN_EGRESS.record(proxy_url, True, time.monotonic() - start, status, retry_after)
+        RATE_GOVERNOR.report(self.email, proxy_url, status, retry_after)
+        if status == 401:
+            raise GarminConnectAuthenticationError(f"Authentication failed: 401 Unauthorized for {path}")
+        if status == 429:
+            raise GarminConnectTooManyRequestsError(f"Rate limit exceeded: 429 Too Many Requests for {path}")
+        if 400 <= status < 500:
+            raise GarminConnectConnectionError(f"API client error ({status}) for {path}")
+        if status >= 500:
+            raise GarminConnectConnectionError(f"HTTP error: {status} for {path}")
+        if status == 204 or not resp.content:
+            return None
+        return resp.json()
+
+    async def _ensure_valid_display_name(self):
+        """Async version of GarminClient._ensure_valid_display_name."""
+        if self.client and self.client.display_name and '@' in self.client.display_name:
+            # 1. Local garth profile dict (read the cached attribute; the property would block on a sync request)
+            prof = getattr(self.client.garth, '_user_profile', None)
+            if isinstance(prof, dict):
+                name = prof.get('displayName') or prof.get('userName') or prof.get('profileId')
+                if name and '@' not in str(name):
+                    self.client.display_name = str(name)
+                    logger.info(f"Fixed display_name from local garth profile: {self.client.display_name}")
+                    await asyncio.to_thread(self.sync_client._remember_display_name)
+                    return
+
+            # 2. Fallback to API Profile sync
+            try:
+                prof = await self.connectapi(self.client.garmin_connect_user_settings_url)
+                if prof and 'displayName' in prof:
+                    self.client.display_name = prof['displayName']
+                    logger.info(f"Fixed display_name from API sync: {self.client.display_name}")
+                    await asyncio.to_thread(self.sync_client._remember_display_name)
+            except Exception as e:
+                logger.warning(f"Could not fix display_name; some Garmin endpoints may 403: {e}")
+
+    async def _stats_and_body(self, cdate):
+        """Async equivalent of Garmin.get_stats_and_body(): daily summary merged with body composition."""
+        summary_url = f"{self.client.garmin_connect_daily_summary_url}/{self.client.display_name}"
+        body_url = f"{self.client.garmin_connect_weight_url}/weight/dateRange"
+        stats, body = await asyncio.gather(
+            self.connectapi(summary_url, params={"calendarDate": cdate}),
+            self.connectapi(body_url, params={"startDate": cdate, "endDate": cdate}),
+        )
+        if not stats:
+            raise GarminConnectConnectionError("No data received from server")
+        if stats.get("privacyProtected") is True:
+            raise GarminConnectAuthenticationError("Authentication error")
+        body_avg = (body or {}).get("totalAverage") or {}
+        if not isinstance(body_avg, dict):
+            body_avg = {}
+        return {**stats, **body_avg}
+
+    async def _sleep(self, cdate):
+        url = f"{self.client.garmin_connect_daily_sleep_url}/{self.client.display_name}"
+        return await self.connectapi(url, params={"date": cdate, "nonSleepBufferMinutes": 60})
+
+    @cached
+    @coalesced
+    async def get_user_summary(self, cdate):
+        """Fetch the daily user summary for cdate (raises on failure, like Garmin.get_user_summary)."""
+        await self._ensure_valid_display_name()
+        url = f"{self.client.garmin_connect_daily_summary_url}/{self.client.display_name}"
+        response = await self.connectapi(url, params={"calendarDate": cdate})
+        if not response:
+            raise GarminConnectConnectionError("No data received from server")
+        if response.get("privacyProtected") is True:
+            raise GarminConnectAuthenticationError("Authentication error")
+        return response
+
+    @cached
+    @coalesced
+    async def get_profile(self):
+        """Fetch user profile."""
+        if not self.client:
+            logger.error("Client not authenticated.")
+            return None
+        await self._ensure_valid_display_name()
+        try:
+            return await self.connectapi(self.client.garmin_connect_user_settings_url)
+        except Exception as e:
+            logger.error(f"Error fetching profile: {e}")
+            return None
+
+    @cached
+    @coalesced
+    async def get_activities(self, limit=60):
+        """Fetch recent activities."""
+        if not self.client:
+            logger.error("Client not authenticated.")
+            return []
+
+        await self._ensure_valid_display_name()
+        # Using 0 as start index to get 'limit' most recent activities regardless of date
+        try:
+            activities = await self.connectapi(
+                self.client.garmin_connect_activities,
+                params={"start": "0", "limit": str(limit)},
+            )
+            return activities or []
+        except Exception as e:
+            logger.error(f"Error fetching activities: {e}")
+            return []
+
+    @coalesced
+    async def get_activities_page(self, start=0, limit=20):
+        """One page of the activity list, newest first. Uncached and raises on failure (used by ActivityStore sync)."""
+        await self._ensure_valid_display_name()
+        activities = await self.connectapi(
+            self.client.garmin_connect_activities,
+            params={"start": str(start), "limit": str(limit)},
+        )
+        return activities or []
+
+    @coalesced
+    async def get_activity_details(self, activity_id, components=ACTIVITY_DETAIL_COMPONENTS):
+        """
+        Fetch detailed activity data. `components` selects any of "summary", "splits"
+        and "high_res" (the large metrics stream). Components are served from the
+        details store; missing ones are fetched from Garmin concurrently and stored
+        (permanently once the summary shows the activity is finished). Returns the summary fields plus 'splits' / 'high_res' keys, or
+        None if the activity does not exist.
+        """
+        if not self.client:
+            logger.error("Client not authenticated.")
+            return None
+
+        components = tuple(c for c in ACTIVITY_DETAIL_COMPONENTS if c in components)
+        parts = await asyncio.to_thread(ACTIVITY_DETAILS_STORE.load, self.email, activity_id, components)
+        missing = [c for c in components if c not in parts]
+
+        if missing:
+            await self._ensure_valid_display_name()
+            base_url = f"{self.client.garmin_connect_activity}/{activity_id}"
+            requests = {
+                "summary": lambda: self.connectapi(base_url),
+                "splits": lambda: self.connectapi(f"{base_url}/splits"),
+                # High-resolution stream data (metrics)
+                "high_res": lambda: self.connectapi(
+                    f"{base_url}/details",
+                    params={"maxChartSize": "2000", "maxPolylineSize": "4000"},
+                ),
+            }
+            logger.info(f"Fetching {', '.join(missing)} for activity {activity_id}...")
+            results = await asyncio.gather(*(requests[c]() for c in missing), return_exceptions=True)
+
+            fetched = {}
+            for component, result in zip(missing, results):
+                if isinstance(result, Exception):
+                    if component == "summary":
+                        logger.error(f"Failed to fetch activity details for {activity_id}: {result}")
+                        return None
+                    logger.warning(f"Could not fetch {component} for {activity_id}: {result}")
+                elif result:
+                    # Sanitized once here, so stored copies are JSON-ready
+                    fetched[component] = sanitize_for_json(result)
+
+            if "summary" in missing and "summary" not in fetched:
+                return None
+            parts.update(fetched)
+            if fetched:
+                finished = is_finished(parts.get("summary"))
+                await asyncio.to_thread(ACTIVITY_DETAILS_STORE.save, self.email, activity_id, fetched, finished)
+
+        details = dict(parts.get("summary") or {"activityId": activity_id})
+        for component in ("splits", "high_res"):
+            if component in parts:
+                details[component] = parts[component]
+        return details
+
+    @cached
+    @coalesced
+    async def _stats_day(self, cdate):
+        """Daily summary + body composition for one date (cached, so overlapping lookbacks share probes)."""
+        return await self._stats_and_body(cdate)
+
+    @cached
+    @coalesced
+    async def _sleep_day(self, cdate):
+        """Sleep data for one date (cached, so overlapping lookbacks share probes)."""
+        return await self._sleep(cdate)
+
+    async def _lookback(self, kind, target_date, fetch_day, is_populated):
+        """
+        Probe target_date and up to 3 earlier days concurrently and return the
+        newest populated result (or the target day's result if none is).
+        Dates older than the account's last known populated day are skipped.
+        """
+        window = [target_date - timedelta(days=i) for i in range(4)]
+        last_populated = _LAST_POPULATED.get((self.email, kind))
+        if last_populated and window[-1] <= last_populated <= target_date:
+            window = [d for d in window if d >= last_populated]
+
+        results = await asyncio.gather(*(fetch_day(d.isoformat()) for d in window), return_exceptions=True)
+        for check_date, result in zip(window, results):
+            if isinstance(result, Exception):
+                logger.debug(f"Failed to fetch {kind} for {check_date}: {result}")
+                continue
+            if is_populated(result):
+                _remember_populated(self.email, kind, check_date)
+                return result
+
+        # Fallback to the target day's (likely empty) data — already fetched above
+        if isinstance(results[0], Exception):
+            logger.error(f"Error fetching {kind} fallback: {results[0]}")
+            return None
+        return results[0]
+
+    @cached
+    @coalesced
+    async def get_health_stats(self, date_str=None):
+        """Fetch health stats, looking back up to 3 days if today's data is empty."""
+        if not self.client:
+            logger.error("Client not authenticated.")
+            return None
+
+        await self._ensure_valid_display_name()
+        target_date = date.fromisoformat(date_str) if date_str else date.today()
+        # Populated = has actual data (like restingHeartRate)
+        return await self._lookback(
+            "health stats", target_date, self._stats_day,
+            lambda stats: bool(stats and stats.get('restingHeartRate')),
+        )
+
+    @cached
+    @coalesced
+    async def get_sleep_data(self, date_str=None):
+        """Fetch sleep data, looking back up to 3 days if today's data is empty."""
+        if not self.client:
+            logger.error("Client not authenticated.")
+            return None
+
+        await self._ensure_valid_display_name()
+        target_date = date.fromisoformat(date_str) if date_str else date.today()
+        return await self._lookback(
+            "sleep data", target_date, self._sleep_day,
+            lambda sleep: bool(sleep and sleep.get('dailySleepDTO')),
+        )
+
+    async def get_daily_summaries(self, start_date, end_date):
+        """
+        Daily summaries (resting/max HR, stress, body battery, sleeping seconds) for every
+        day in [start_date, end_date] -> {iso date: summary or None}. Days not cached come
+        from the resting HR, stress, body battery and sleep range endpoints (28 days per
+        request); no range endpoint carries max HR, so days still lacking it are completed
+        from the per-day summary. Complete closed days are then served from the cache
+        forever; days the per-day call failed for are only cached briefly.
+        """
+        if not self.client:
+            logger.error("Client not authenticated.")
+            return {}
+
+        days = [(start_date + timedelta(days=i)).isoformat() for i in range((end_date - start_date).days + 1)]
+        cached_days = await GARMIN_CACHE.get_days(self.email, "daily_summary_day", days)
+        missing = [d for d in days if d not in cached_days]
+
+        fetched = {}
+        if missing:
+            await self._ensure_valid_display_name()
+            fetched = await self._daily_summary_ranges(missing)
+            lacking = [d for d in missing if "maxHeartRate" not in fetched.get(d, {})]
+            complete = [d for d in missing if d not in lacking]
+            if lacking:
+                results = await asyncio.gather(*(self.get_user_summary(d) for d in lacking), return_exceptions=True)
+                for day, result in zip(lacking, results):
+                    if isinstance(result, Exception) or not result:
+                        logger.debug(f"Failed to fetch daily summary for {day}: {result}")
+                        continue
+                    summary = {k: result[k] for k in DAILY_SUMMARY_FIELDS if result.get(k) is not None}
+                    fetched[day] = {**summary, **fetched.get(day, {})}
+                    complete.append(day)
+            await GARMIN_CACHE.set_days(self.email, "daily_summary_day", {d: fetched[d] for d in complete if d in fetched})
+            await GARMIN_CACHE.set_days(self.email, "daily_summary_day",
+                                        {d: v for d, v in fetched.items() if d not in complete}, ttl=PARTIAL_SUMMARY_TTL)
+
+        merged = {**cached_days, **fetched}
+        return {d: merged.get(d) or None for d in days}
+
+    async def _daily_summary_ranges(self, days):
+        """{day: partial summary} for the days any range endpoint returned data for. A failed page
+        leaves its days out so they fall back to per-day calls."""
+        pages = _range_pages(days)
+        wanted = set(days)
+        requests = []
+        for a, b in pages:
+            requests += [
+                ("restingHeartRate", a, b, self.connectapi(
+                    f"/userstats-service/wellness/daily/{self.client.display_name}",
+                    params={"fromDate": a.isoformat(), "untilDate": b.isoformat(), "metricId": 60})),
+                ("averageStressLevel", a, b, self.connectapi(
+                    f"/usersummary-service/stats/stress/daily/{a.isoformat()}/{b.isoformat()}")),
+                ("bodyBatteryHighestValue", a, b, self.connectapi(
+                    "/wellness-service/wellness/bodyBattery/reports/daily",
+                    params={"startDate": a.isoformat(), "endDate": b.isoformat()})),
+                ("sleepingSeconds", a, b, self.connectapi(
+                    f"/sleep-service/stats/sleep/daily/{a.isoformat()}/{b.isoformat()}")),
+            ]
+        results = await asyncio.gather(*(r[3] for r in requests), return_exceptions=True)
+
+        summaries, failed = {}, set()
+        for (field, a, b, _), result in zip(requests, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Failed to fetch {field} range {a} - {b}: {result}")
+                failed.update(d for d in days if a.isoformat() <= d <= b.isoformat())
+                continue
+            if field == "restingHeartRate":
+                items = ((m.get("calendarDate"), m.get("value")) for m in
+                         ((result or {}).get("allMetrics") or {}).get("metricsMap", {}).get("WELLNESS_RESTING_HEART_RATE") or [])
+            elif field == "averageStressLevel":
+                items = ((m.get("calendarDate"), (m.get("values") or {}).get("overallStressLevel")) for m in result or [])
+            elif field == "bodyBatteryHighestValue":
+                items = ((m.get("date"), _body_battery_high(m)) for m in result or [] if isinstance(m, dict))
+            else:
+                items = ((m.get("calendarDate"), (m.get("values") or {}).get("totalSleepTimeInSeconds"))
+                         for m in (result or {}).get("individualStats") or [])
+            for day, value in items:
+                if day in wanted and value is not None:
+                    summaries.setdefault(day, {})[field] = value
+        return {d: summary for d, summary in summaries.items() if d not in failed}
+
+    async def get_sleep_scores(self, start_date, end_date):
+        """
+        Sleep score per day in [start_date, end_date] -> {iso date: score or None}.
+        Uses the daily sleep-score range endpoint (28 days per request) for days not
+        already cached, so a 30-day window costs at most two upstream calls.
+        """
+        if not self.client:
+            logger.error("Client not authenticated.")
+            return {}
+
+        days = [(start_date + timedelta(days=i)).isoformat() for i in range((end_date - start_date).days + 1)]
+        cached_days = await GARMIN_CACHE.get_days(self.email, "sleep_score_day", days)
+        missing = [d for d in days if d not in cached_days]
+
+        fetched = {}
+        if missing:
+            pages = _range_pages(missing)
+            results = await asyncio.gather(
+                *(self.connectapi(f"/wellness-service/stats/daily/sleep/score/{a.isoformat()}/{b.isoformat()}")
+                  for a, b in pages),
+                return_exceptions=True,
+            )
+            for (a, b), result in zip(pages, results):
+                if isinstance(result, Exception):
+                    logger.warning(f"Failed to fetch sleep scores {a} - {b}: {result}")
+                    continue
+                page = {d: {"value": None} for d in missing if a.isoformat() <= d <= b.isoformat()}
+                for item in result or []:
+                    if isinstance(item, dict) and item.get("calendarDate") in page:
+                        page[item["calendarDate"]] = {"value": item.get("value")}
+                fetched.update(page)
+            await GARMIN_CACHE.set_days(self.email, "sleep_score_day", fetched)
+
+        merged = {**cached_days, **fetched}
+        return {d: merged[d]["value"] if d in merged else None for d in days}
+
+    @coalesced
+    async def get_vo2_max(self):
+        """
+        VO2 Max / fitness age for the account, answered from storage when possible.
+        A value resolved before today is returned immediately and refreshed in the
+        background (at most once a day). Returns a dict with available values, or None.
+        """
+        if not self.client:
+            logger.error("Client not authenticated.")
+            return None
+
+        stored = await asyncio.to_thread(VO2_STORE.load, self.email)
+        if stored:
+            if not VO2_STORE.is_fresh(stored) and await asyncio.to_thread(VO2_STORE.claim_refresh, self.email):
+                self._schedule_vo2_refresh()
+            return stored["data"]
+
+        return await self._resolve_vo2_max()
+
+    def _schedule_vo2_refresh(self):
+        task = asyncio.create_task(self._resolve_vo2_max())
+        _BACKGROUND_TASKS.add(task)
+        task.add_done_callback(_BACKGROUND_TASKS.discard)
+        logger.info(f"Refreshing stored VO2 Max in the background for {self.email}")
+
+    async def _resolve_vo2_max(self):
+        """
+        Query every VO2 max / fitness age source concurrently and resolve first-valid-wins
+        in the old cascade's priority order: training status, then max metrics (newest
+        date first), then stats_and_body, user profile and the fitness age endpoint.
+        Lower-priority requests still in flight are cancelled once both values are known.
+        """
+        await self._ensure_valid_display_name()
+        today = date.today()
+        metric_dates = [(today - timedelta(days=d)).isoformat() for d in [0, 1, 3, 7, 14, 30]]
+
+        sources = [("training_status", None, self.connectapi(
+            f"{self.client.garmin_connect_training_status_url}/{today.isoformat()}"))]
+        sources += [("max_metrics", d, self.connectapi(f"{self.client.garmin_connect_metrics_url}/{d}/{d}"))
+                    for d in metric_dates]
+        sources += [
+            ("stats_and_body", today.isoformat(), self._stats_day(today.isoformat())),
+            ("profile", None, self.connectapi(self.client.garmin_connect_user_settings_url)),
+            ("fitnessage", today.isoformat(), self.get_fitness_age(today.isoformat())),
+        ]
+        # Sources that keep failing are skipped until ENDPOINT_HEALTH probes them again
+        usable = {name: ENDPOINT_HEALTH.usable("vo2_max", name) for name in dict.fromkeys(n for n, _, _ in sources)}
+        tasks = []
+        for name, day, coro in sources:
+            if not usable[name]:
+                coro.close()
+                continue
+            tasks.append((name, day, asyncio.ensure_future(ENDPOINT_HEALTH.track("vo2_max", name, coro))))
+
+        vo2_data, vo2_source, vo2_date, fitness_age_source = {}, None, None, None
+        try:
+            for name, day, task in tasks:
+                if 'vo2Max' in vo2_data and vo2_data.get('fitnessAge'):
+                    break
+                try:
+                    payload = await task
+                except Exception as e:
+                    logger.debug(f"VO2 Max source {name} {day or ''} failed: {e}")
+                    continue
+
+                had_fitness_age = bool(vo2_data.get('fitnessAge'))
+                if name == "training_status":
+                    found = _vo2_from_training_status(payload)
+                    vo2_data.update(found)
+                    if 'vo2Max' in found:
+                        vo2_source, vo2_date = name, today.isoformat()
+                elif name == "max_metrics":
+                    if 'vo2Max' in vo2_data:
+                        continue
+                    if _vo2_from_max_metrics(payload, day, vo2_data):
+                        vo2_source, vo2_date = name, day
+                elif not had_fitness_age:
+                    if name == "stats_and_body":
+                        fitness_age = _fitness_age_from_stats(payload)
+                    else:
+                        fitness_age = payload.get('fitnessAge') if isinstance(payload, dict) else None
+                    if fitness_age:
+                        vo2_data['fitnessAge'] = fitness_age
+                        logger.info(f"✅ Found fitnessAge in {name}: {fitness_age}")
+                if not had_fitness_age and vo2_data.get('fitnessAge'):
+                    fitness_age_source = name
+        except Exception as e:
+            logger.error(f"Failed to fetch VO2 Max data: {e}")
+            logger.error(f"Error traceback: {traceback.format_exc()}")
+            return None
+        finally:
+            for _, _, task in tasks:
+                if not task.done():
+                    task.cancel()
+            # Retrieve exceptions of cancelled/failed tasks so they are not reported as unhandled
+            await asyncio.gather(*(task for _, _, task in tasks), return_exceptions=True)
+
+        if not vo2_data:
+            _log_missing_vo2()
+            return None
+
+        logger.info(f"✅ VO2 Max data retrieved: {vo2_data} (vo2 from {vo2_source} {vo2_date or ''}, fitnessAge from {fitness_age_source})")
+        await asyncio.to_thread(VO2_STORE.save, self.email, vo2_data, vo2_source, vo2_date, fitness_age_source)
+        return vo2_data
+
+    @cached
+    @coalesced
+    async def get_fitness_age(self, date_str=None):
+        """Fetch fitness age data."""
+        if not self.client:
+            logger.error("Client not authenticated.")
+            return None
+
+        await self._ensure_valid_display_name()
+        try:
+            target_date = date_str if date_str else date.today().isoformat()
+            return await self.connectapi(f"{self.client.garmin_connect_fitnessage}/{target_date}")
+        except Exception as e:
+            logger.error(f"Failed to fetch fitness age data: {e}")
+            return None
+
+    @cached
+    @coalesced
+    async def get_devices(self):
+        """Fetch available devices."""
+        if not self.client:
+            logger.error("Client not authenticated.")
+            return []
+        try:
+            return await self.connectapi(self.client.garmin_connect_devices_url) or []
+        except Exception as e:
+            logger.error(f"Failed to fetch devices: {e}")
+            return []
+
+    async def sync_all_devices(self):
+        """See GarminClient.sync_all_devices — explicit device sync queuing is disabled."""
+        return self.sync_client.sync_all_devices()
+
+    async def _progress_summary(self, start_date, end_date, metric):
+        return await self.connectapi(
+            self.client.garmin_connect_fitnessstats,
+            params={
+                "startDate": start_date,
+                "endDate": end_date,
+                "aggregation": "lifetime",
+                "groupByParentActivityType": "True",
+                "metric": metric,
+            },
+        )
+
+    @cached
+    @coalesced
+    async def _year_stats(self, year):
+        """Distance / elevation per sport for one calendar year (finished years are cached forever)."""
+        start_date = f"{year}-01-01"
+        end_date = f"{year}-12-31"
+        summary_dist, summary_elev = await asyncio.gather(
+            self._progress_summary(start_date, end_date, "distance"),
+            self._progress_summary(start_date, end_date, "elevationGain"),
+        )
+        # Wrapped so years without activities (an empty dict) are still cacheable
+        return {"year": year, "stats": _flatten_yearly_progress(summary_dist, summary_elev)}
+
+    async def get_yearly_stats(self, start_year=None):
+        """
+        Fetch yearly activity stats (distance) for running, cycling, swimming, etc.
+        Default: Last 5 years. Years are fetched concurrently; only uncached years hit Garmin.
+        """
+        if not self.client:
+            logger.error("Client not authenticated.")
+            return {}
+
+        try:
+            current_year = date.today().year
+            if not start_year:
+                start_year = current_year - 5
+
+            years = list(range(start_year, current_year + 1))
+            logger.info(f"Fetching yearly stats for {years[0]}-{years[-1]}...")
+            results = await asyncio.gather(*(self._year_stats(year) for year in years), return_exceptions=True)
+
+            yearly_stats = {}
+            for year, result in zip(years, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Failed to fetch stats for {year}: {result}")
+                    yearly_stats[year] = {"error": str(result)}
+                else:
+                    yearly_stats[year] = result["stats"]
+            return yearly_stats
+
+        except Exception as e:
+            logger.error(f"Failed to fetch yearly stats: {e}")
+            return {}
+
+    async def create_workout(self, workout_json: dict) -> dict:
+        """
+        Create a structured workout in Garmin Connect.
+        Returns the created workout JSON (which includes the new workoutId).
+        Retries up to 2 times on connection errors.
+        """
+        if not self.client:
+            logger.error("Client not authenticated.")
+            raise Exception("Client not authenticated.")
+
+        logger.info("Creating workout in Garmin Connect...")
+        logger.info(f"PAYLOAD: {json.dumps(workout_json)}")
+
+        last_error = None
+        for attempt in range(1, 4):  # 3 attempts total
+            try:
+                created_workout = await self.connectapi(
+                    f"{self.client.garmin_workouts}/workout", method="POST", json=workout_json
+                )
+                logger.info(f"✅ Workout created successfully: {created_workout.get('workoutId')} (attempt {attempt})")
+                return created_workout
+            except GarminConnectConnectionError as e:
+                last_error = e
+                # Only retry on connection-level errors, not HTTP status errors
+                if "Connection error" in str(e) and attempt < 3:
+                    wait = attempt * 1.5
+                    logger.warning(f"Connection error on attempt {attempt}, retrying in {wait}s... ({e})")
+                    await asyncio.sleep(wait)
+                    continue
+                logger.error(f"Failed to create workout (attempt {attempt}): {e}")
+                raise
+            except Exception as e:
+                logger.error(f"Failed to create workout (attempt {attempt}): {e}")
+                raise
+
+        logger.error(f"Failed to create workout after 3 attempts: {last_error}")
+        raise last_error
+
+    async def schedule_workout(self, workout_id: int, date_str: str) -> bool:
+        """
+        Schedule a workout on a specific date (YYYY-MM-DD) on the Garmin calendar.
+        Tries the 3 known endpoint patterns, the ones that have been working lately first.
+        Returns True on success, False if all fail (non-fatal).
+        """
+        if not self.client:
+            logger.error("Client not authenticated.")
+            return False
+
+        variants = {
+            # POST /workout-service/schedule with JSON body
+            "v2": lambda: self.connectapi(
+                GarminAPIEndpoints.SCHEDULE_WORKOUT_V2, method="POST",
+                json={"workoutId": workout_id, "calendarDate": date_str},
+            ),
+            # POST /workout-service/workout/{id}/schedule/{date} (REST path)
+            "v3": lambda: self.connectapi(
+                GarminAPIEndpoints.SCHEDULE_WORKOUT_V3.format(workout_id=workout_id, date_str=date_str), method="POST"
+            ),
+            # Legacy calendar-service
+            "legacy": lambda: self.connectapi(
+                GarminAPIEndpoints.SCHEDULE_WORKOUT.format(workout_id=workout_id, date_str=date_str), method="POST"
+            ),
+        }
+        last_error = None
+        for name in ENDPOINT_HEALTH.order("schedule_workout", list(variants)):
+            try:
+                logger.info(f"Scheduling workout {workout_id} for {date_str} ({name})...")
+                await ENDPOINT_HEALTH.track("schedule_workout", name, variants[name]())
+                logger.info(f"✅ Workout {workout_id} scheduled via {name} endpoint for {date_str}")
+                return True
+            except Exception as e:
+                last_error = e
+                logger.warning(f"Schedule attempt {name} failed ({e})")
+
+        logger.warning(f"All schedule attempts failed. Workout saved in Garmin Connect but not on calendar. ({last_error})")
+        return False
+
+    async def send_workout_to_device(self, workout_id: int, device_id: str) -> bool:
+        """
+        Queue a workout to be sent to a specific Garmin device immediately.
+        """
+        if not self.client:
+            logger.error("Client not authenticated.")
+            return False
+
+        try:
+            logger.info(f"Sending workout {workout_id} to device {device_id}...")
+            url = GarminAPIEndpoints.DEVICE_WORKOUTS.format(device_id=device_id)
+            await self.connectapi(url, method="POST", json=[{"workoutId": workout_id}])
+            logger.info("Workout queued for device sync successfully.")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to send workout to device: {e}")
+            return False
@@ -0,0 +1,300 @@
+import os
+import copy
+import json
+import time
+import asyncio
+import logging
+import threading
+import functools
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+FOREVER = None  # TTL for immutable data (past days, finished activities)
+NO_CACHE = 0
+
+
+def _date_arg(args, kwargs, name="date_str"):
+    value = args[0] if args else kwargs.get(name) or kwargs.get("cdate")
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def _daily_ttl(args, kwargs):
+    """Days before yesterday never change. Yesterday can still receive late device uploads."""
+    day = _date_arg(args, kwargs)
+    if day is None or day >= date.today():
+        return 15 * 60
+    if day == date.today() - timedelta(days=1):
+        return 60 * 60
+    return FOREVER
+
+
+def _yearly_ttl(args, kwargs):
+    """Finished years never change; the current year is refreshed hourly."""
+    year = args[0] if args else kwargs.get("year")
+    return FOREVER if year and int(year) < date.today().year else 3600
+
+
+def _fixed(seconds):
+    return lambda args, kwargs: seconds
+
+
+# Per-method TTL policies (seconds, FOREVER or NO_CACHE), keyed by AsyncGarminClient method name
+TTL_POLICIES = {
+    "get_profile": _fixed(24 * 3600),
+    "get_fitness_age": _fixed(6 * 3600),
+    "get_devices": _fixed(3600),
+    "get_activities": _fixed(10 * 60),
+    "_year_stats": _yearly_ttl,
+    "get_user_summary": _daily_ttl,
+    "get_health_stats": _daily_ttl,
+    "get_sleep_data": _daily_ttl,
+    "_stats_day": _daily_ttl,
+    "_sleep_day": _daily_ttl,
+    "sleep_score_day": _daily_ttl,  # Filled per day by AsyncGarminClient.get_sleep_scores range fetches
+    "daily_summary_day": _daily_ttl,  # Filled per day by AsyncGarminClient.get_daily_summaries
+}
+
+
+class GarminResponseCache:
+    """
+    Two-tier cache for Garmin read calls.
+
+    L1 is a bounded in-process LRU (per worker). L2 is the garmin_cache table,
+    shared by every worker and surviving restarts. A miss in L1 falls through to
+    L2 and promotes the entry; a miss in both calls Garmin and fills both tiers.
+    Empty results ({}, [], None) are never cached because the client returns
+    those on errors.
+    """
+
+    def __init__(self, max_entries=2000):
+        self.max_entries = max_entries
+        self._l1 = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"l1_hits": 0, "l2_hits": 0, "misses": 0, "invalidations": 0}
+
+    @staticmethod
+    def make_key(email, method, args, kwargs):
+        return f"{email}|{method}|{json.dumps([list(args), kwargs], sort_keys=True, default=str)}"
+
+    # --- L1 ---------------------------------------------------------------
+
+    def _l1_get(self, key):
+        with self._lock:
+            item = self._l1.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at is not None and expires_at < time.time():
+                del self._l1[key]
+                return None
+            self._l1.move_to_end(key)
+            return value
+
+    def _l1_set(self, key, value, expires_at):
+        with self._lock:
+            self._l1[key] = (expires_at, value)
+            self._l1.move_to_end(key)
+            while len(self._l1) > self.max_entries:
+                self._l1.popitem(last=False)
+
+    # --- L2 ---------------------------------------------------------------
+
+    def _l2_get(self, key):
+        """Return (value, expires_at timestamp) or None."""
+        from backend.database import SessionLocal
+        from backend.models import GarminCacheEntry
+        db = SessionLocal()
+        try:
+            row = db.query(GarminCacheEntry).filter(GarminCacheEntry.cache_key == key).first()
+            if not row:
+                return None
+            if row.expires_at is not None and row.expires_at < datetime.utcnow():
+                return None
+            expires_at = None
+            if row.expires_at is not None:
+                expires_at = time.time() + (row.expires_at - datetime.utcnow()).total_seconds()
+            return row.value, expires_at
+        except Exception as e:
+            logger.warning(f"Garmin cache L2 read failed: {e}")
+            return None
+        finally:
+            db.close()
+
+    def _l2_set(self, key, email, method, value, ttl):
+        from backend.database import SessionLocal
+        from backend.models import GarminCacheEntry
+        db = SessionLocal()
+        try:
+            row = db.query(GarminCacheEntry).filter(GarminCacheEntry.cache_key == key).first()
+            if not row:
+                row = GarminCacheEntry(cache_key=key, garmin_email=email, method=method)
+                db.add(row)
+            row.value = value
+            row.expires_at = None if ttl is FOREVER else datetime.utcnow() + timedelta(seconds=ttl)
+            db.commit()
+        except Exception as e:
+            logger.warning(f"Garmin cache L2 write failed: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    # --- public API -------------------------------------------------------
+
+    async def get_or_fetch(self, email, method, args, kwargs, fetch):
+        policy = TTL_POLICIES.get(method)
+        ttl = policy(args, kwargs) if policy else NO_CACHE
+        if ttl == NO_CACHE:
+            return await fetch()
+
+        key = self.make_key(email, method, args, kwargs)
+        value = self._l1_get(key)
+        if value is not None:
+            self._stats["l1_hits"] += 1
+            return copy.deepcopy(value)
+
+        stored = await asyncio.to_thread(self._l2_get, key)
+        if stored is not None:
+            self._stats["l2_hits"] += 1
+            value, expires_at = stored
+            self._l1_set(key, value, expires_at)
+            return copy.deepcopy(value)
+
+        self._stats["misses"] += 1
+        value = await fetch()
+        if value:
+            expires_at = None if ttl is FOREVER else time.time() + ttl
+            self._l1_set(key, copy.deepcopy(value), expires_at)
+            await asyncio.to_thread(self._l2_set, key, email, method, value, ttl)
+        return value
+
+    async def get_days(self, email, method, days):
+        """Cached per-day values for days (ISO date strings) -> {day: value}. Missing days are omitted."""
+        found, missing = {}, {}
+        for day in days:
+            key = self.make_key(email, method, (day,), {})
+            value = self._l1_get(key)
+            if value is not None:
+                self._stats["l1_hits"] += 1
+                found[day] = copy.deepcopy(value)
+            else:
+                missing[key] = day
+        if missing:
+            for key, (value, expires_at) in (await asyncio.to_thread(self._l2_get_many, list(missing))).items():
+                self._stats["l2_hits"] += 1
+                self._l1_set(key, value, expires_at)
+                found[missing[key]] = copy.deepcopy(value)
+        self._stats["misses"] += len(days) - len(found)
+        return found
+
+    async def set_days(self, email, method, values, ttl=None):
+        """
+        Store per-day values ({day: value}) with the TTL policy of `method` applied to each
+        day; `ttl` caps it (e.g. for partial values). Empty values are never cached.
+        """
+        policy = TTL_POLICIES[method]
+        entries = []
+        for day, value in values.items():
+            if not value:
+                continue
+            day_ttl = policy((day,), {})
+            if ttl is not None and (day_ttl is FOREVER or ttl < day_ttl):
+                day_ttl = ttl
+            key = self.make_key(email, method, (day,), {})
+            self._l1_set(key, copy.deepcopy(value), None if day_ttl is FOREVER else time.time() + day_ttl)
+            entries.append((key, value, day_ttl))
+        if entries:
+            await asyncio.to_thread(self._l2_set_many, email, method, entries)
+
+    def _l2_get_many(self, keys):
+        from backend.database import SessionLocal
+        from backend.models import GarminCacheEntry
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            rows = db.query(GarminCacheEntry).filter(GarminCacheEntry.cache_key.in_(keys)).all()
+            return {
+                row.cache_key: (
+                    row.value,
+                    None if row.expires_at is None else time.time() + (row.expires_at - now).total_seconds(),
+                )
+                for row in rows
+                if row.expires_at is None or row.expires_at > now
+            }
+        except Exception as e:
+            logger.warning(f"Garmin cache L2 read failed: {e}")
+            return {}
+        finally:
+            db.close()
+
+    def _l2_set_many(self, email, method, entries):
+        from backend.database import SessionLocal
+        from backend.models import GarminCacheEntry
+        db = SessionLocal()
+        try:
+            keys = [key for key, _, _ in entries]
+            existing = {
+                row.cache_key: row
+                for row in db.query(GarminCacheEntry).filter(GarminCacheEntry.cache_key.in_(keys)).all()
+            }
+            for key, value, ttl in entries:
+                row = existing.get(key)
+                if not row:
+                    row = GarminCacheEntry(cache_key=key, garmin_email=email, method=method)
+                    db.add(row)
+                row.value = value
+                row.expires_at = None if ttl is FOREVER else datetime.utcnow() + timedelta(seconds=ttl)
+            db.commit()
+        except Exception as e:
+            logger.warning(f"Garmin cache L2 write failed: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def invalidate(self, email, *methods):
+        """Drop cached responses for a Garmin account (all methods, or only those given) from both tiers."""
+        prefixes = [f"{email}|{m}|" for m in methods] or [f"{email}|"]
+        with self._lock:
+            for key in [k for k in self._l1 if k.startswith(tuple(prefixes))]:
+                del self._l1[key]
+        self._stats["invalidations"] += 1
+
+        from backend.database import SessionLocal
+        from backend.models import GarminCacheEntry
+        db = SessionLocal()
+        try:
+            query = db.query(GarminCacheEntry).filter(GarminCacheEntry.garmin_email == email)
+            if methods:
+                query = query.filter(GarminCacheEntry.method.in_(methods))
+            query.delete(synchronize_session=False)
+            db.commit()
+            logger.info(f"Invalidated Garmin cache for {email} ({', '.join(methods) or 'all methods'})")
+        except Exception as e:
+            logger.warning(f"Garmin cache invalidation failed for {email}: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def stats(self):
+        with self._lock:
+            size = len(self._l1)
+        return {**self._stats, "l1_size": size, "l1_max_entries": self.max_entries}
+
+
+GARMIN_CACHE = GarminResponseCache(max_entries=int(os.getenv("GARMIN_CACHE_L1_MAX_ENTRIES", "2000")))
+
+
+def cached(method):
+    """Decorator for AsyncGarminClient read methods: serve from the two-tier cache per TTL_POLICIES."""
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        return await GARMIN_CACHE.get_or_fetch(
+            self.email, method.__name__, args, kwargs, lambda: method(self, *args, **kwargs)
+        )
+    return wrapper
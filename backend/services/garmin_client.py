@@ -1,10 +1,9 @@
 import os
+import asyncio
 import logging
 import threading
 import time
 import json
-import tempfile
-import shutil
 import traceback
 import requests
 from requests.exceptions import ProxyError, ConnectTimeout
@@ -13,7 +12,11 @@ from datetime import date, timedelta
 from garminconnect import Garmin
 from dotenv import load_dotenv
 from sqlalchemy.orm import Session
-from backend.models import UserSetting
+from backend.services.garmin_session_registry import GarminSessionRegistry
+from backend.services.garmin_rate_governor import RATE_GOVERNOR, parse_retry_after
+from backend.services.endpoint_health import ENDPOINT_HEALTH
+from backend.services.garmin_egress import GARMIN_EGRESS
+from backend.services.garmin_token_store import GarminTokenStore, dump_garth_tokens, load_garth_tokens, tokens_fingerprint
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -22,16 +25,18 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
-# Global in-memory store for authenticated clients (Singleton Pattern)
-# Key: email, Value: Garmin client instance
-GLOBAL_CLIENTS = {}
-GLOBAL_CLIENTS_LOCK = threading.RLock()
+# Global in-memory store for authenticated clients, login locks, verification
+# timestamps, SSO cooldowns and pending logins — bounded by count and idle TTL
+SESSION_REGISTRY = GarminSessionRegistry(
+    max_entries=int(os.getenv("GARMIN_SESSION_MAX_ENTRIES", "500")),
+    idle_ttl=int(os.getenv("GARMIN_SESSION_IDLE_TTL", "3600")),
+)
 
-# Tracks last save timestamp per email — prevents redundant DB writes
-SESSION_LAST_VERIFIED = {}
+# Versioned token store shared across uvicorn workers (DB-backed)
+TOKEN_STORE = GarminTokenStore()
 
-# Cooldown cache for failed SSO logins to prevent IP bans
-FAILED_LOGIN_COOLDOWN = {}
+# How often (seconds) a worker compares its cached token version with the shared store
+TOKEN_VERSION_CHECK_INTERVAL = float(os.getenv("GARMIN_TOKEN_VERSION_CHECK_INTERVAL", "5"))
 
 # Garmin API Endpoints Constants
 class GarminAPIEndpoints:
@@ -45,30 +50,202 @@ class GarminAPIEndpoints:
     SOCIAL_PROFILE = "/userprofile-service/socialProfile"
 
 # Locks to prevent concurrent logins for the same email
-CLIENT_LOCKS = {}
-
 def get_client_lock(email: str) -> threading.Lock:
-    if email not in CLIENT_LOCKS:
-        CLIENT_LOCKS[email] = threading.Lock()
-    return CLIENT_LOCKS[email]
+    return SESSION_REGISTRY.get_lock(email)
+
+# How long a login waiting for its MFA code stays resumable
+MFA_CODE_TIMEOUT = 120
+
+
+def _resolve_future(future):
+    if not future.done():
+        future.set_result(None)
 
-# Global in-memory store for pending login sessions
-# Key: email, Value: LoginSession instance
-PENDING_SESSIONS = {}
 
 class LoginSession:
-    def __init__(self):
-        self.status = "INIT"  # INIT, RUNNING, MFA_WAITING, SUCCESS, FAILED
+    """
+    State machine for one in-flight Garmin SSO login:
+    INIT -> RUNNING -> (MFA_WAITING -> VERIFYING ->) SUCCESS | FAILED.
+
+    Every transition wakes whoever is waiting on it — threads blocked in
+    `wait_for()` and coroutines in `wait()` — so nobody polls. Coroutines on the
+    same event loop share one future per transition, so any number of requests
+    attached to the same login cost nothing while they wait.
+    """
+    ACTIVE = ("RUNNING", "MFA_WAITING", "VERIFYING")
+    SETTLED = ("MFA_WAITING", "SUCCESS", "FAILED")
+    DONE = ("SUCCESS", "FAILED")
+
+    def __init__(self, password=None):
+        self.status = "INIT"
         self.error = None
-        self.code_event = threading.Event()
-        self.result_event = threading.Event()
-        self.mfa_code = None
         self.client = None
+        self.client_state = None  # garth SSO state to resume the login with once the MFA code arrives
+        self.password = password  # Kept so the MFA request can store the credentials
         self.thread = None
-
-    def set_code(self, code):
-        self.mfa_code = code
-        self.code_event.set()
+        self.updated_at = time.time()
+        self._cond = threading.Condition()
+        self._futures = {}  # event loop -> future resolved on the next transition
+
+    def transition(self, status, expected=None, error=None, client=None):
+        """Move to `status` (only from `expected`, if given) and wake all waiters. Returns False if not moved."""
+        with self._cond:
+            if expected is not None and self.status != expected:
+                return False
+            self.status = status
+            if error is not None:
+                self.error = error
+            if client is not None:
+                self.client = client
+            self.updated_at = time.time()
+            futures, self._futures = self._futures, {}
+            self._cond.notify_all()
+        for loop, future in futures.items():
+            try:
+                loop.call_soon_threadsafe(_resolve_future, future)
+            except RuntimeError:
+                pass  # Loop already closed; nobody is left waiting on it
+        return True
+
+    def is_active(self, now=None):
+        """In flight and still resumable (an unanswered MFA prompt expires after MFA_CODE_TIMEOUT)."""
+        if self.status not in self.ACTIVE:
+            return False
+        return self.status != "MFA_WAITING" or (now or time.time()) - self.updated_at < MFA_CODE_TIMEOUT
+
+    def wait_for(self, states, timeout=None):
+        """Block until the status is one of `states` or `timeout` passes. Returns the status."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.status in states, timeout)
+            return self.status
+
+    async def wait(self, states, timeout=None):
+        """Await until the status is one of `states` or `timeout` passes, without holding a thread."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout is not None else None
+        while True:
+            with self._cond:
+                if self.status in states:
+                    return self.status
+                future = self._futures.get(loop)
+                if future is None:
+                    future = self._futures[loop] = loop.create_future()
+            remaining = deadline - loop.time() if deadline is not None else None
+            if remaining is not None and remaining <= 0:
+                return self.status
+            try:
+                # Shielded: one caller timing out must not cancel the future the others share
+                await asyncio.wait_for(asyncio.shield(future), remaining)
+            except asyncio.TimeoutError:
+                return self.status
+
+def _vo2_from_training_status(training_status):
+    """Extract VO2 Max / fitness age fields from a get_training_status() payload."""
+    vo2_data = {}
+    if training_status and 'mostRecentVO2Max' in training_status:
+        recent_vo2 = training_status['mostRecentVO2Max']
+        # Check generic and cycling buckets
+        for v_type in ['generic', 'cycling']:
+            if v_type in recent_vo2 and recent_vo2[v_type]:
+                v_data = recent_vo2[v_type]
+                if v_data.get('vo2MaxValue'):
+                    vo2_data['vo2MaxValue'] = v_data['vo2MaxValue']
+                    vo2_data['vo2Max'] = v_data['vo2MaxValue']
+                    logger.info(f"✅ Found {v_type} vo2MaxValue in training status: {v_data['vo2MaxValue']}")
+
+                if v_data.get('vo2MaxPreciseValue'):
+                    vo2_data['vo2MaxPrecise'] = v_data['vo2MaxPreciseValue']
+                    logger.info(f"✅ Found {v_type} vo2MaxPreciseValue in training status: {v_data['vo2MaxPreciseValue']}")
+
+                if v_data.get('fitnessAge'):
+                    vo2_data['fitnessAge'] = v_data['fitnessAge']
+                    logger.info(f"✅ Found fitnessAge in training status: {v_data['fitnessAge']}")
+    return vo2_data
+
+def _vo2_from_max_metrics(max_metrics, date_str, vo2_data):
+    """Merge VO2 Max fields from a get_max_metrics() payload into vo2_data. Returns True once vo2Max is known."""
+    if max_metrics and isinstance(max_metrics, list) and len(max_metrics) > 0:
+        metrics = max_metrics[0]
+
+        for v_type in ['generic', 'cycling']:
+            if v_type in metrics and isinstance(metrics[v_type], dict):
+                m_data = metrics[v_type]
+                if m_data.get('vo2MaxValue'):
+                    vo2_data['vo2MaxValue'] = m_data['vo2MaxValue']
+                    vo2_data['vo2Max'] = m_data['vo2MaxValue']
+                    logger.info(f"✅ Found historical {v_type} vo2MaxValue: {m_data['vo2MaxValue']} on {date_str}")
+
+                if m_data.get('vo2MaxPreciseValue'):
+                    vo2_data['vo2MaxPrecise'] = m_data['vo2MaxPreciseValue']
+
+                if m_data.get('fitnessAge') and 'fitnessAge' not in vo2_data:
+                    vo2_data['fitnessAge'] = m_data['fitnessAge']
+    return 'vo2Max' in vo2_data
+
+def _fitness_age_from_stats(stats_body):
+    """Find fitnessAge in a get_stats_and_body() payload (top level or bodyComposition)."""
+    fitness_age = None
+    if stats_body and isinstance(stats_body, dict):
+        # Check various possible locations
+        if 'fitnessAge' in stats_body and stats_body['fitnessAge']:
+            fitness_age = stats_body['fitnessAge']
+            logger.info(f"✅ Found fitnessAge in stats_body: {stats_body['fitnessAge']}")
+
+        # Also check nested structures
+        if 'bodyComposition' in stats_body and isinstance(stats_body['bodyComposition'], dict):
+            body_comp = stats_body['bodyComposition']
+            if 'fitnessAge' in body_comp and body_comp['fitnessAge']:
+                fitness_age = body_comp['fitnessAge']
+                logger.info(f"✅ Found fitnessAge in bodyComposition: {body_comp['fitnessAge']}")
+    return fitness_age
+
+def _log_missing_vo2():
+    logger.warning("⚠️ No VO2 Max data found in max_metrics for last 30 days")
+    logger.warning("This usually means:")
+    logger.warning("  - User hasn't done qualifying cardio activities (running/cycling with HR monitor)")
+    logger.warning("  - Garmin device doesn't support VO2 Max measurement")
+    logger.warning("  - Not enough activity history for Garmin to calculate VO2 Max")
+
+def _flatten_yearly_progress(summary_dist, summary_elev):
+    """Turn distance / elevation progress summaries for one year into the flat per-sport dict the frontend expects."""
+    stats_for_year = {}
+
+    # Process distance
+    if summary_dist and isinstance(summary_dist, list) and len(summary_dist) > 0:
+        data_item = summary_dist[0]
+        if 'stats' in data_item:
+            stats_obj = data_item['stats']
+            for sport_key, sport_data in stats_obj.items():
+                if 'distance' in sport_data and 'sum' in sport_data['distance']:
+                    # The API returns meters so cm logic is incorrect, convert meters to kilometers
+                    distance_m = sport_data['distance']['sum']
+                    distance_km = round(distance_m / 1000, 2)
+                    if sport_key not in stats_for_year:
+                        stats_for_year[sport_key] = {}
+                    stats_for_year[sport_key]['distance'] = distance_km
+
+    # Process elevation
+    if summary_elev and isinstance(summary_elev, list) and len(summary_elev) > 0:
+        data_item = summary_elev[0]
+        if 'stats' in data_item:
+            stats_obj = data_item['stats']
+            for sport_key, sport_data in stats_obj.items():
+                if 'elevationGain' in sport_data and 'sum' in sport_data['elevationGain']:
+                    elevation_cm = sport_data['elevationGain']['sum']
+                    elevation_m = round(elevation_cm / 100, 2)
+                    if sport_key not in stats_for_year:
+                        stats_for_year[sport_key] = {}
+                    stats_for_year[sport_key]['elevationGain'] = elevation_m
+
+    # Formatting fallback for frontend compat: if distance exists, flatten it
+    # But we want to send structured data if we have both
+    flat_stats_for_year = {}
+    for sport, metrics in stats_for_year.items():
+        if 'distance' in metrics:
+            flat_stats_for_year[sport] = metrics['distance']
+        if 'elevationGain' in metrics:
+            flat_stats_for_year[f"{sport}_elevation"] = metrics['elevationGain']
+    return flat_stats_for_year
 
 class GarminClient:
     def __init__(self, email, password=None, user_id=None):
@@ -76,86 +253,162 @@ class GarminClient:
         self.password = password
         self.client = None
         self.user_id = user_id  # DB user PK — used for scoped session storage
+        self._token_version = 0  # Shared token store version last loaded/saved by this client
+        self._token_fingerprint = None
+        self._stored_display_name = None  # displayName persisted next to the tokens
 
     def _inject_proxy(self, garmin_instance):
-        """Inject proxies into the garth requests.Session to prevent Datacenter IP bans."""
-        proxy_url = os.getenv("GARMIN_PROXY_URL")
-        if proxy_url and garmin_instance and hasattr(garmin_instance, 'garth'):
+        """Share pooled keep-alive connections across users; the proxy itself is picked per request (see _govern_requests)."""
+        if garmin_instance and hasattr(garmin_instance, 'garth'):
             try:
-                # Set a strict timeout to avoid the 30-second Render hang
-                garmin_instance.garth.sess.timeout = 5
-                garmin_instance.garth.sess.proxies.update({
-                    "http": proxy_url,
-                    "https": proxy_url
-                })
-                logger.info(f"🛡️ Active Proxy injected for {self.email} (Timeout set to 5s)")
+                GARMIN_EGRESS.mount(garmin_instance.garth)
             except Exception as e:
-                logger.warning(f"Failed to inject proxy: {e}")
+                logger.warning(f"Failed to mount shared Garmin connection pool: {e}")
 
-    def _get_db_session_key(self):
-        return f"garmin_session_{self.email}"
+    def _govern_requests(self, garmin_instance):
+        """
+        Route every garth HTTP request (SSO login and data calls) through the shared rate
+        governor and the egress proxy pool, which rotates accounts away from failing proxies.
+        """
+        sess = garmin_instance.garth.sess
+        if getattr(sess, "_governed", False):
+            return
+        original_request = sess.request
+        email = self.email
+
+        def governed_request(method, url, *args, **kwargs):
+            proxy_url = GARMIN_EGRESS.pick(email)
+            if proxy_url:
+                kwargs["proxies"] = {"http": proxy_url, "https": proxy_url}
+                # Strict timeout to avoid the 30-second Render hang on a stalled proxy
+                kwargs["timeout"] = GARMIN_EGRESS.timeout
+            RATE_GOVERNOR.acquire_sync(email, proxy_url)
+            start = time.monotonic()
+            try:
+                resp = original_request(method, url, *args, **kwargs)
+            except requests.exceptions.RequestException as e:
+                GARMIN_EGRESS.record(proxy_url, False, error=e)
+                raise
+            retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+            GARMIN_EGRESS.record(proxy_url, True, time.monotonic() - start, resp.status_code, retry_after)
+            RATE_GOVERNOR.report(email, proxy_url, resp.status_code, retry_after)
+            return resp
+
+        sess.request = governed_request
+        sess._governed = True
 
     def load_session_from_db(self, db: Session):
-        """Load session tokens from the database, scoped by user_id when available."""
+        """Load session tokens from the shared token store (legacy per-user record as fallback)."""
         try:
-            key = self._get_db_session_key()
-            from backend.models import UserSetting
-            query = db.query(UserSetting).filter(UserSetting.key == key)
-            if self.user_id:
-                # Prefer user-scoped record
-                setting = query.filter(UserSetting.user_id == self.user_id).first()
-                if not setting:
-                    # Fallback: legacy global record (user_id IS NULL)
-                    setting = query.filter(UserSetting.user_id == None).first()
-            else:
-                setting = query.first()
-            if setting and setting.value:
-                logger.info(f"Found persistent session in DB for {self.email} (user_id={self.user_id})")
-                return setting.value
+            stored = TOKEN_STORE.load(db, self.email, self.user_id)
+            if stored:
+                logger.info(f"Found persistent session in DB for {self.email} (user_id={self.user_id}, v{stored['version']})")
+                self._token_version = stored["version"]
+                self._token_fingerprint = stored["fingerprint"]
+                self._stored_display_name = stored["display_name"]
+                return stored["tokens"]
         except Exception as e:
             logger.error(f"Failed to load session from DB: {e}")
         return None
 
     def save_session_to_db(self, db: Session):
-        """Save the current session tokens to the database, scoped by user_id."""
+        """Save the current session tokens to the shared token store, bumping its version.
+        Skipped when the tokens hash to what this worker last loaded or saved."""
         if not self.client or not self.client.garth:
             return
         
         try:
-            # Use a temporary directory to dump garth tokens
-            with tempfile.TemporaryDirectory() as tmpdirname:
-                self.client.garth.dump(tmpdirname)
-                # Read all files and store them in a dict
-                saved_state = {}
-                for filename in os.listdir(tmpdirname):
-                    file_path = os.path.join(tmpdirname, filename)
-                    if os.path.isfile(file_path):
-                        with open(file_path, 'r') as f:
-                            saved_state[filename] = f.read()
-                
-                # Save 'saved_state' to DB — scoped by user_id
-                key = self._get_db_session_key()
-                from backend.models import UserSetting
-                query = db.query(UserSetting).filter(UserSetting.key == key)
-                if self.user_id:
-                    setting = query.filter(UserSetting.user_id == self.user_id).first()
-                else:
-                    setting = query.filter(UserSetting.user_id == None).first()
-
-                if not setting:
-                    setting = UserSetting(key=key, value=saved_state, user_id=self.user_id)
-                    db.add(setting)
-                else:
-                    setting.value = saved_state
-                db.commit()
-                
-                # Mark as freshly verified when saving
-                SESSION_LAST_VERIFIED[self.email] = time.time()
-                
-                logger.info(f"Saved session to DB for {self.email} (user_id={self.user_id})")
+            saved_state = dump_garth_tokens(self.client.garth)
+            fingerprint = tokens_fingerprint(saved_state)
+            if fingerprint == SESSION_REGISTRY.token_fingerprint(self.email):
+                logger.debug(f"Garmin tokens unchanged for {self.email}, skipping DB write")
+                return
+
+            version = TOKEN_STORE.save(db, self.email, saved_state, self.user_id,
+                                       display_name=self._resolved_display_name())
+            self._token_version = version
+            self._token_fingerprint = fingerprint
+            SESSION_REGISTRY.set_token_version(self.email, version, fingerprint)
+            
+            # Mark as freshly verified when saving
+            SESSION_REGISTRY.mark_verified(self.email)
+            
+            logger.info(f"Saved session to DB for {self.email} (user_id={self.user_id}, v{version})")
                 
         except Exception as e:
             logger.error(f"Failed to save session to DB: {e}")
+            db.rollback()
+
+    def _sync_tokens_from_store(self, db: Session):
+        """Pick up tokens another worker refreshed. Re-reads them only when the stored version changed."""
+        known_version, checked_at = SESSION_REGISTRY.token_version(self.email)
+        if time.time() - checked_at < TOKEN_VERSION_CHECK_INTERVAL:
+            return
+        try:
+            latest_version = TOKEN_STORE.current_version(db, self.email, self.user_id)
+            SESSION_REGISTRY.set_token_version(self.email, known_version)
+            if latest_version > known_version:
+                stored = TOKEN_STORE.load(db, self.email, self.user_id)
+                load_garth_tokens(self.client.garth, stored["tokens"])
+                SESSION_REGISTRY.set_token_version(self.email, stored["version"], stored["fingerprint"])
+                logger.info(f"🔄 Picked up refreshed Garmin tokens v{stored['version']} for {self.email}")
+        except Exception as e:
+            logger.warning(f"Could not check shared token version for {self.email}: {e}")
+
+    def _publish_token_refreshes(self, garmin_instance):
+        """Wrap garth's OAuth2 refresh so refreshed tokens are written to the shared store at once,
+        and so a worker adopts tokens another worker already refreshed instead of calling oauth/exchange."""
+        garth_client = garmin_instance.garth
+        if getattr(garth_client, "_publishes_refreshes", False):
+            return
+        original_refresh = garth_client.refresh_oauth2
+        email, user_id = self.email, self.user_id
+
+        def refresh_and_publish():
+            from backend.database import SessionLocal
+            db = SessionLocal()
+            try:
+                known_version, _ = SESSION_REGISTRY.token_version(email)
+                stored = TOKEN_STORE.load(db, email, user_id)
+                if stored and stored["version"] > known_version:
+                    load_garth_tokens(garth_client, stored["tokens"])
+                    SESSION_REGISTRY.set_token_version(email, stored["version"], stored["fingerprint"])
+                    if not garth_client.oauth2_token.expired:
+                        logger.info(f"🔄 Adopted Garmin tokens v{stored['version']} refreshed by another worker for {email}")
+                        return
+
+                original_refresh()
+                tokens = dump_garth_tokens(garth_client)
+                version = TOKEN_STORE.save(db, email, tokens, user_id)
+                SESSION_REGISTRY.set_token_version(email, version, tokens_fingerprint(tokens))
+                logger.info(f"Published refreshed Garmin tokens v{version} for {email}")
+            finally:
+                db.close()
+
+        garth_client.refresh_oauth2 = refresh_and_publish
+        garth_client._publishes_refreshes = True
+
+    def _resolved_display_name(self):
+        """The client's display name if it is a real Garmin displayName (not the email placeholder)."""
+        name = self.client.display_name if self.client else None
+        if name and '@' not in str(name):
+            return str(name)
+        return None
+
+    def _remember_display_name(self):
+        """Persist a freshly resolved display name so restored sessions never need to look it up again."""
+        name = self._resolved_display_name()
+        if not name:
+            return
+        from backend.database import SessionLocal
+        db = SessionLocal()
+        try:
+            TOKEN_STORE.save_display_name(db, self.email, name, self.user_id)
+        except Exception as e:
+            logger.warning(f"Could not persist Garmin display name for {self.email}: {e}")
+            db.rollback()
+        finally:
+            db.close()
 
     def restore_session_from_data(self, session_data):
         """Restore garth session from DB data. Makes ZERO network calls.
@@ -175,20 +428,20 @@ class GarminClient:
             pwd = self.password if self.password else "session_restore_placeholder"
             self.client = Garmin(self.email, pwd)
             self._inject_proxy(self.client)
+            self._govern_requests(self.client)
 
-            # Load stored garth tokens from temp dir
-            with tempfile.TemporaryDirectory() as tmpdirname:
-                for filename, content in session_data.items():
-                    with open(os.path.join(tmpdirname, filename), 'w') as f:
-                        f.write(content)
-                self.client.garth.load(tmpdirname)
-
-            # Trust the session — no network verification needed
-            self.client.display_name = self.email
-            SESSION_LAST_VERIFIED[self.email] = time.time()
+            # Load stored garth tokens
+            load_garth_tokens(self.client.garth, session_data)
+            self._publish_token_refreshes(self.client)
 
-            with GLOBAL_CLIENTS_LOCK:
-                GLOBAL_CLIENTS[self.email] = self.client
+            # Trust the session — no network verification needed. Use the persisted
+            # displayName when known; the email placeholder is fixed lazily otherwise
+            self.client.display_name = self._stored_display_name or self.email
+            SESSION_REGISTRY.mark_verified(self.email)
+            # Legacy records get no fingerprint so the next save migrates them
+            fingerprint = self._token_fingerprint if self._token_version else None
+            SESSION_REGISTRY.set_token_version(self.email, self._token_version, fingerprint)
+            SESSION_REGISTRY.set_client(self.email, self.client, self.user_id)
 
             logger.info(f"✅ Session restored from DB for {self.email} (no network verify needed)")
             return True
@@ -200,101 +453,95 @@ class GarminClient:
         return False
 
 
-    def login(self, db: Session = None, mfa_code=None):
-        """
-        Authenticate with Garmin Connect using a threaded approach for MFA, with Caching and DB Persistence.
-        Returns: (success: bool, status: str, message: str)
-        status can be: "SUCCESS", "MFA_REQUIRED", "FAILED"
-        """
+    def _garth_dir(self):
+        """Legacy on-disk garth token directory for this account."""
+        safe_email = self.email.replace('@', '_').replace('.', '_') if self.email else "unknown"
+        return os.path.join(os.path.expanduser("~"), f".garth_{safe_email}")
+
+    def _check_credentials(self, db, mfa_code=None):
+        """Error message if a login can't even be attempted, else None."""
         # Password is required for new logins, but not for loading existing sessions from DB
         if not self.email:
-            msg = "Email not provided."
-            logger.error(msg)
-            return False, "FAILED", msg
-        
-        # Check if password is required (not needed if loading from DB/cache)
-        if not self.password and not db and self.email not in GLOBAL_CLIENTS:
-            msg = "Garmin credentials not provided."
-            logger.error(msg)
-            return False, "FAILED", msg
-
-
+            return "Email not provided."
+        # Check if password is required (not needed if loading from DB/cache, or for an MFA code)
+        if not self.password and not db and not mfa_code and not SESSION_REGISTRY.has_client(self.email):
+            return "Garmin credentials not provided."
+        return None
 
+    def _resume_session(self, db: Session = None):
+        """Resume an existing session (memory, DB, then disk). Returns the login() result, or None."""
         # 0. Check In-Memory Cache (Fastest) - Thread Safe
-        if not mfa_code:
-            with GLOBAL_CLIENTS_LOCK:
-                if self.email in GLOBAL_CLIENTS:
-                    try:
-                        cached_client = GLOBAL_CLIENTS[self.email]
-                        if cached_client.display_name:
-                            logger.info(f"✅ Using cached session for {cached_client.display_name}")
-                            self.client = cached_client
-                            return True, "SUCCESS", "Session resumed from memory"
-                    except Exception as e:
-                        logger.warning(f"⚠️ Cached session invalid, clearing: {e}")
-                        del GLOBAL_CLIENTS[self.email]
+        cached_client = SESSION_REGISTRY.get_client(self.email, user_id=self.user_id)
+        if cached_client is not None:
+            try:
+                if cached_client.display_name:
+                    logger.info(f"✅ Using cached session for {cached_client.display_name}")
+                    self.client = cached_client
+                    if db:
+                        self._sync_tokens_from_store(db)
+                    return True, "SUCCESS", "Session resumed from memory"
+            except Exception as e:
+                logger.warning(f"⚠️ Cached session invalid, clearing: {e}")
+                SESSION_REGISTRY.drop_client(self.email)
 
         # 1. Check DB Persistence (If DB session provided)
-        if not mfa_code and db:
+        if db:
             # Prevent multiple simultaneous requests from trying to load from DB and triggering new logins
             lock = get_client_lock(self.email)
             with lock:
                 # Double check memory cache in case another thread just loaded it while we waited
-                with GLOBAL_CLIENTS_LOCK:
-                    if self.email in GLOBAL_CLIENTS:
-                        try:
-                            cached_client = GLOBAL_CLIENTS[self.email]
-                            if cached_client.display_name:
-                                logger.info(f"✅ Using cached session for {cached_client.display_name} (from lock)")
-                                self.client = cached_client
-                                return True, "SUCCESS", "Session resumed from memory (lock)"
-                        except Exception:
-                            pass
+                cached_client = SESSION_REGISTRY.get_client(self.email, record=False, user_id=self.user_id)
+                if cached_client is not None:
+                    try:
+                        if cached_client.display_name:
+                            logger.info(f"✅ Using cached session for {cached_client.display_name} (from lock)")
+                            self.client = cached_client
+                            return True, "SUCCESS", "Session resumed from memory (lock)"
+                    except Exception:
+                        pass
                 
                 logger.info(f"Checking DB for session {self.email}...")
                 session_data = self.load_session_from_db(db)
                 if session_data:
                     if self.restore_session_from_data(session_data):
-                        # Opportunistically save updated tokens (e.g. if refreshed during verification)
-                        if db:
-                            self.save_session_to_db(db)
+                        # No-op unless the record still needs migrating from the legacy store
+                        self.save_session_to_db(db)
                         return True, "SUCCESS", "Session resumed from database"
 
         # 2. Filesystem Fallback (Legacy/Local dev) - Keep attempting just in case
-        home_dir = os.path.expanduser("~")
-        safe_email = self.email.replace('@', '_').replace('.', '_') if self.email else "unknown"
-        garth_dir = os.path.join(home_dir, f".garth_{safe_email}")
-        if not mfa_code and os.path.exists(garth_dir):
+        garth_dir = self._garth_dir()
+        if os.path.exists(garth_dir):
              try:
                 pwd = self.password if self.password else "session_restore_placeholder"
                 self.client = Garmin(self.email, pwd)
+                self._inject_proxy(self.client)
+                self._govern_requests(self.client)
                 self.client.garth.load(garth_dir)
                 # ... (verification logic same as above) ...
                 try:
                     self.client.display_name = None
-                    try:
-                        social_profile = self.client.connectapi("/userprofile-service/socialProfile")
-                        if social_profile: self.client.display_name = social_profile.get('displayName')
-                    except Exception as e:
-                        error_msg = str(e)
-                        if ("429" in error_msg or "Too Many Requests" in error_msg) and "oauth/exchange" not in error_msg:
-                            logger.info("Rate limit hit during FS verification. Assuming valid.")
-                            self.client.display_name = self.email
-                    
-                    if not self.client.display_name:
-                         try:
-                             profile = self.client.get_user_profile()
-                             if 'displayName' in profile: self.client.display_name = profile['displayName']
-                         except Exception as e:
-                             error_msg = str(e)
-                             if ("429" in error_msg or "Too Many Requests" in error_msg) and "oauth/exchange" not in error_msg:
-                                 logger.info("Rate limit hit during FS verification fallback. Assuming valid.")
-                                 self.client.display_name = self.email
+                    # Whichever profile endpoint has been answering lately goes first
+                    verifiers = {
+                        "social_profile": lambda: self.client.connectapi("/userprofile-service/socialProfile"),
+                        "user_profile": self.client.get_user_profile,
+                    }
+                    for name in ENDPOINT_HEALTH.order("session_verify", list(verifiers)):
+                        try:
+                            profile = ENDPOINT_HEALTH.call("session_verify", name, verifiers[name])
+                            if profile and 'displayName' in profile:
+                                self.client.display_name = profile.get('displayName')
+                        except Exception as e:
+                            error_msg = str(e)
+                            if ("429" in error_msg or "Too Many Requests" in error_msg) and "oauth/exchange" not in error_msg:
+                                logger.info(f"Rate limit hit during FS verification ({name}). Assuming valid.")
+                                self.client.display_name = self.email
+                        if self.client.display_name:
+                            break
 
                     if self.client.display_name:
                          logger.info(f"Session resumed from disk")
-                         with GLOBAL_CLIENTS_LOCK:
-                             GLOBAL_CLIENTS[self.email] = self.client
+                         self._publish_token_refreshes(self.client)
+                         SESSION_REGISTRY.set_client(self.email, self.client, self.user_id)
                          # Opportunistically save to DB if we have it
                          if db: self.save_session_to_db(db)
                          return True, "SUCCESS", "Session resumed from disk"
@@ -303,157 +550,213 @@ class GarminClient:
              except:
                 pass
 
+        return None
+
+    def login(self, db: Session = None, mfa_code=None, resume_only=False):
+        """
+        Authenticate with Garmin Connect (cached, DB or disk session first, then SSO with MFA support).
+        With resume_only, only an existing session (memory, DB or disk) is used — never a new SSO login.
+        Blocks the calling thread until the login settles; async callers should use login_async().
+        Returns: (success: bool, status: str, message: str)
+        status can be: "SUCCESS", "MFA_REQUIRED", "FAILED"
+        """
+        error = self._check_credentials(db, mfa_code)
+        if error:
+            logger.error(error)
+            return False, "FAILED", error
 
-        # 3. Handle Active/Pending Login (For MFA flow) or New SSO Login
-        session = PENDING_SESSIONS.get(self.email)
+        if not mfa_code:
+            resumed = self._resume_session(db)
+            if resumed:
+                return resumed
 
-        # Check SSO Cooldown to avoid extending IP bans before a new SSO login
-        cooldown_expiry = FAILED_LOGIN_COOLDOWN.get(self.email, 0)
-        if not mfa_code and not session and time.time() < cooldown_expiry:
-            remaining = int(cooldown_expiry - time.time())
-            msg = f"Garmin servers are currently blocking login attempts due to rate limits. Please try again in {remaining // 60}m {remaining % 60}s."
-            logger.warning(msg)
-            return False, "FAILED", msg
+        if resume_only:
+            return False, "FAILED", "No stored Garmin session to resume"
 
+        # 3. SSO login: start it (or attach to the one in flight) and wait for it to settle
         if mfa_code:
-            # We are verifying - we MUST have a waiting session
-            if not session or session.status != "MFA_WAITING":
-                logger.warning("Received MFA code but no session is waiting for it.")
-                return False, "FAILED", "Session expired or invalid. Please try logging in again."
-            
-            logger.info("Passing MFA code to background thread...")
-            session.set_code(mfa_code)
-            
-            # Wait for final result
-            session.result_event.wait(timeout=30)
-            
-            if session.status == "SUCCESS":
-                self.client = session.client
-                # Save persistent session
-                if db:
-                    self.save_session_to_db(db)
-                else:
-                    try:
-                        self.client.garth.dump(garth_dir)
-                    except: pass
-                
-                with GLOBAL_CLIENTS_LOCK:
-                    GLOBAL_CLIENTS[self.email] = self.client
-                # Cleanup
-                del PENDING_SESSIONS[self.email]
-                return True, "SUCCESS", "Authenticated successfully"
-            else:
-                error = session.error or "Login failed during verification"
-                del PENDING_SESSIONS[self.email]
+            session, error = self._submit_mfa_code(mfa_code)
+            if error:
+                return False, "FAILED", error
+            session.wait_for(LoginSession.DONE, timeout=30)
+        else:
+            session, error = self._attach_login()
+            if error:
+                return False, "FAILED", error
+            session.wait_for(LoginSession.SETTLED, timeout=20)
+        return self._login_outcome(session, db, verifying=bool(mfa_code))
+
+    async def login_async(self, db: Session = None, mfa_code=None):
+        """
+        login() for async callers: waiting on the SSO login or MFA verification
+        awaits the LoginSession instead of holding a thread. Session restores and
+        DB writes still run in worker threads.
+        """
+        error = self._check_credentials(db, mfa_code)
+        if error:
+            logger.error(error)
+            return False, "FAILED", error
+
+        if mfa_code:
+            session, error = await asyncio.to_thread(self._submit_mfa_code, mfa_code)
+            if error:
+                return False, "FAILED", error
+            await session.wait(LoginSession.DONE, timeout=30)
+        else:
+            resumed = await asyncio.to_thread(self._resume_session, db)
+            if resumed:
+                return resumed
+            session, error = await asyncio.to_thread(self._attach_login)
+            if error:
                 return False, "FAILED", error
+            await session.wait(LoginSession.SETTLED, timeout=20)
+        return await asyncio.to_thread(self._login_outcome, session, db, bool(mfa_code))
 
+    def _attach_login(self):
+        """
+        The pending LoginSession for this account, or a new one whose SSO login runs in a
+        background thread. Returns (session, error message); session is None on error.
+        """
+        with get_client_lock(self.email):
+            session = SESSION_REGISTRY.get_pending(self.email)
+            # If a login is already working or waiting for MFA, attach to it instead of killing it
+            if session and session.is_active():
+                logger.info("Login already in progress (another request started it). Attaching...")
+                return session, None
+
+            # Check SSO Cooldown to avoid extending IP bans before a new SSO login
+            cooldown_expiry = SESSION_REGISTRY.cooldown_until(self.email)
+            if time.time() < cooldown_expiry:
+                remaining = int(cooldown_expiry - time.time())
+                msg = f"Garmin servers are currently blocking login attempts due to rate limits. Please try again in {remaining // 60}m {remaining % 60}s."
+                logger.warning(msg)
+                return None, msg
+
+            logger.info("Starting new Garmin login session in thread...")
+            session = LoginSession(self.password)
+            SESSION_REGISTRY.set_pending(self.email, session)
+            session.transition("RUNNING")
+
+        session.thread = threading.Thread(target=self._run_login, args=(session,), daemon=True)
+        session.thread.start()
+        return session, None
+
+    def _submit_mfa_code(self, mfa_code):
+        """
+        Hand an MFA code to the login waiting for it; the first submission resumes the
+        login in a background thread, later ones attach. Returns (session, error message).
+        """
+        session = SESSION_REGISTRY.get_pending(self.email)
+        # We are verifying - we MUST have a session waiting for (or already checking) a code
+        if not session or session.status not in ("MFA_WAITING", "VERIFYING") or not session.is_active():
+            logger.warning("Received MFA code but no session is waiting for it.")
+            if session and session.status == "MFA_WAITING":
+                session.transition("FAILED", expected="MFA_WAITING", error="MFA code timeout")
+                SESSION_REGISTRY.pop_pending(self.email, session)
+            return None, "Session expired or invalid. Please try logging in again."
+
+        if session.transition("VERIFYING", expected="MFA_WAITING"):
+            logger.info("Resuming Garmin login with MFA code...")
+            session.thread = threading.Thread(target=self._run_mfa, args=(session, mfa_code), daemon=True)
+            session.thread.start()
+        else:
+            logger.info("MFA code already being verified. Attaching...")
+        return session, None
+
+    @staticmethod
+    def _load_profile(client):
+        """Set display/full name on a client whose tokens came from an early-returning SSO login."""
+        try:
+            profile = client.garth.profile
+            if isinstance(profile, dict):
+                client.display_name = profile.get("displayName")
+                client.full_name = profile.get("fullName")
+        except Exception as e:
+            logger.warning(f"⚠️ Could not load Garmin profile after login: {e}")
+
+    def _run_login(self, session):
+        """Background SSO login. Stops at the MFA prompt instead of blocking a thread on the code."""
+        try:
+            client = Garmin(self.email, self.password, return_on_mfa=True)
+            self._inject_proxy(client)
+            self._govern_requests(client)
+            result = client.login()
+            if not result:
+                raise Exception("Garmin login failed (invalid credentials or captcha)")
+            if result[0] == "needs_mfa":
+                logger.info("Garmin login needs an MFA code. Waiting for it...")
+                session.client_state = result[1]
+                session.transition("MFA_WAITING", client=client)
+                return
+
+            self._load_profile(client)
+            self._publish_token_refreshes(client)
+            session.transition("SUCCESS", client=client)
+        except Exception as e:
+            self._fail_login(session, e)
+
+    def _run_mfa(self, session, mfa_code):
+        """Background MFA verification: resume the SSO login with the code."""
+        try:
+            client = session.client
+            client.resume_login(session.client_state, mfa_code)
+            if not client.display_name:
+                self._load_profile(client)
+            self._publish_token_refreshes(client)
+            session.client_state = None
+            session.transition("SUCCESS", client=client)
+        except Exception as e:
+            self._fail_login(session, e)
+
+    def _fail_login(self, session, error):
+        if isinstance(error, (ProxyError, MaxRetryError, ConnectTimeout)):
+            error_msg = f"PROXY_FAILURE: Tunnel connection failed (502/504). This usually means the your proxy server is rejecting the connection. Details: {str(error)}"
+            logger.error(error_msg)
         else:
-            # We need to lock around session creation to prevent multiple concurrent logins
+            error_msg = str(error)
+            logger.error(f"Background login failed: {error_msg}")
+            if "429" in error_msg or "Too Many Requests" in error_msg:
+                # Add 15-minute cooldown for SSO rate limits to let the IP recover
+                SESSION_REGISTRY.set_cooldown(self.email, time.time() + 900)
+                logger.warning(f"Applied 15-minute SSO login cooldown for {self.email} due to Garmin Rate Limit!")
+        session.transition("FAILED", error=error_msg)
+
+    def _login_outcome(self, session, db: Session = None, verifying=False):
+        """Turn a settled (or timed out) LoginSession into a login() result, persisting a new session once."""
+        status = session.status
+        if status == "MFA_WAITING" and not verifying:
+            return False, "MFA_REQUIRED", "Please enter the authentication code sent to your email."
+
+        if status == "SUCCESS":
+            self.client = session.client
+            self.password = self.password or session.password
+
+            # Ensure only one request performs the db commit step and cleanup
             with get_client_lock(self.email):
-                # Double check inside the lock
-                session = PENDING_SESSIONS.get(self.email)
-                
-                # If a session is already working or waiting for MFA, attach to it instead of killing it
-                if session and session.status in ("RUNNING", "MFA_WAITING"):
-                    logger.info("Login already in progress (another thread started it). Attaching...")
-                    new_session_created = False
-                else:
-                    logger.info("Starting new Garmin login session in thread...")
-                    if session:
-                        try: del PENDING_SESSIONS[self.email]
+                if SESSION_REGISTRY.get_pending(self.email) is session:
+                    if db:
+                        self.save_session_to_db(db)
+                    else:
+                        try: self.client.garth.dump(self._garth_dir())
                         except: pass
-                    
-                    session = LoginSession()
-                    PENDING_SESSIONS[self.email] = session
-                    session.status = "RUNNING"
-                    new_session_created = True
 
-            if new_session_created:
-                def login_thread():
-                    try:
-                        def mfa_callback():
-                            logger.info("Background thread hit MFA requirement. Waiting for code...")
-                            session.status = "MFA_WAITING"
-                            # Wait for code
-                            if not session.code_event.wait(timeout=120):
-                                 raise ValueError("MFA code timeout")
-                            logger.info("Background thread received code. Resuming...")
-                            return session.mfa_code
-
-                        # Init client
-                        client = Garmin(self.email, self.password, prompt_mfa=mfa_callback)
-                        self._inject_proxy(client)
-                        if not client.login():
-                            raise Exception("Garmin login failed (invalid credentials or captcha)")
-                        
-                        try:
-                            client.get_user_profile()
-                        except: pass
+                    # Thread-safe cache update
+                    SESSION_REGISTRY.set_client(self.email, self.client, self.user_id)
 
-                        session.client = client
-                        session.status = "SUCCESS"
-                    except (ProxyError, MaxRetryError, ConnectTimeout) as pe:
-                        error_msg = f"PROXY_FAILURE: Tunnel connection failed (502/504). This usually means the your proxy server is rejecting the connection. Details: {str(pe)}"
-                        logger.error(error_msg)
-                        session.error = error_msg
-                        session.status = "FAILED"
-                    except Exception as e:
-                        error_msg = str(e)
-                        logger.error(f"Background login failed: {error_msg}")
-                        session.error = error_msg
-                        session.status = "FAILED"
-                        
-                        if "429" in error_msg or "Too Many Requests" in error_msg:
-                            # Add 15-minute cooldown for SSO rate limits to let the IP recover
-                            FAILED_LOGIN_COOLDOWN[self.email] = time.time() + 900
-                            logger.warning(f"Applied 15-minute SSO login cooldown for {self.email} due to Garmin Rate Limit!")
-                    finally:
-                        session.result_event.set()
-
-                session.thread = threading.Thread(target=login_thread)
-                session.thread.daemon = True
-                session.thread.start()
-            
-            # Poll for status change
-            start_poll = time.time()
-            while time.time() - start_poll < 20:
-                if session.status == "MFA_WAITING":
-                    return False, "MFA_REQUIRED", "Please enter the authentication code sent to your email."
-                if session.status == "SUCCESS":
-                    self.client = session.client
-                    
-                    # Ensure only one thread performs the db commit step and cleanup
-                    with get_client_lock(self.email):
-                        if self.email in PENDING_SESSIONS and PENDING_SESSIONS[self.email] == session:
-                            if db:
-                                self.save_session_to_db(db)
-                            else:
-                                try: self.client.garth.dump(garth_dir)
-                                except: pass
-                            
-                            # Thread-safe cache update
-                            with GLOBAL_CLIENTS_LOCK:
-                                GLOBAL_CLIENTS[self.email] = self.client
-                            
-                            # Mark as verified now
-                            SESSION_LAST_VERIFIED[self.email] = time.time()
-                            
-                            del PENDING_SESSIONS[self.email]
-                            
-                    return True, "SUCCESS", "Authenticated successfully"
-                if session.status == "FAILED":
-                    err = session.error
-                    with get_client_lock(self.email):
-                        if self.email in PENDING_SESSIONS and PENDING_SESSIONS[self.email] == session:
-                            del PENDING_SESSIONS[self.email]
-                    return False, "FAILED", f"Login failed: {err}"
-                time.sleep(0.5)
-            
-            # Timeout occurred
-            with get_client_lock(self.email):
-                if self.email in PENDING_SESSIONS and PENDING_SESSIONS[self.email] == session:
-                    del PENDING_SESSIONS[self.email]
-            return False, "FAILED", "Login timed out connecting to Garmin."
+                    # Mark as verified now
+                    SESSION_REGISTRY.mark_verified(self.email)
+
+                    SESSION_REGISTRY.pop_pending(self.email, session)
+
+            return True, "SUCCESS", "Authenticated successfully"
+
+        with get_client_lock(self.email):
+            SESSION_REGISTRY.pop_pending(self.email, session)
+        if status == "FAILED":
+            return False, "FAILED", f"Login failed: {session.error}"
+        if verifying:
+            return False, "FAILED", "Login failed during verification"
+        return False, "FAILED", "Login timed out connecting to Garmin."
 
     def _ensure_valid_display_name(self):
         """Garmin endpoints fail with 403 if display_name is an email address. Fix it lazily."""
@@ -468,6 +771,7 @@ class GarminClient:
                         if name and '@' not in str(name):
                             self.client.display_name = str(name)
                             logger.info(f"Fixed display_name from local garth profile: {self.client.display_name}")
+                            self._remember_display_name()
                             return
             except Exception as e:
                 pass
@@ -478,6 +782,7 @@ class GarminClient:
                 if prof and 'displayName' in prof:
                     self.client.display_name = prof['displayName']
                     logger.info(f"Fixed display_name from API sync: {self.client.display_name}")
+                    self._remember_display_name()
             except Exception as e:
                 logger.warning(f"Could not fix display_name; some Garmin endpoints may 403: {e}")
 
@@ -616,25 +921,7 @@ class GarminClient:
                 try:
                     logger.info("Fetching VO2 Max from get_training_status()...")
                     training_status = self.client.get_training_status(today.isoformat())
-                    
-                    if training_status and 'mostRecentVO2Max' in training_status:
-                        recent_vo2 = training_status['mostRecentVO2Max']
-                        # Check generic and cycling buckets
-                        for v_type in ['generic', 'cycling']:
-                            if v_type in recent_vo2 and recent_vo2[v_type]:
-                                v_data = recent_vo2[v_type]
-                                if v_data.get('vo2MaxValue'):
-                                    vo2_data['vo2MaxValue'] = v_data['vo2MaxValue']
-                                    vo2_data['vo2Max'] = v_data['vo2MaxValue']
-                                    logger.info(f"✅ Found {v_type} vo2MaxValue in training status: {v_data['vo2MaxValue']}")
-                                
-                                if v_data.get('vo2MaxPreciseValue'):
-                                    vo2_data['vo2MaxPrecise'] = v_data['vo2MaxPreciseValue']
-                                    logger.info(f"✅ Found {v_type} vo2MaxPreciseValue in training status: {v_data['vo2MaxPreciseValue']}")
-                                    
-                                if v_data.get('fitnessAge'):
-                                    vo2_data['fitnessAge'] = v_data['fitnessAge']
-                                    logger.info(f"✅ Found fitnessAge in training status: {v_data['fitnessAge']}")
+                    vo2_data.update(_vo2_from_training_status(training_status))
                 except Exception as ts_error:
                     logger.warning(f"Could not get VO2 Max from training status: {ts_error}")
 
@@ -648,25 +935,8 @@ class GarminClient:
                     for date_str in dates_to_check:
                         try:
                             max_metrics = self.client.get_max_metrics(date_str)
-                            if max_metrics and isinstance(max_metrics, list) and len(max_metrics) > 0:
-                                metrics = max_metrics[0]
-                                
-                                for v_type in ['generic', 'cycling']:
-                                    if v_type in metrics and isinstance(metrics[v_type], dict):
-                                        m_data = metrics[v_type]
-                                        if m_data.get('vo2MaxValue'):
-                                            vo2_data['vo2MaxValue'] = m_data['vo2MaxValue']
-                                            vo2_data['vo2Max'] = m_data['vo2MaxValue']
-                                            logger.info(f"✅ Found historical {v_type} vo2MaxValue: {m_data['vo2MaxValue']} on {date_str}")
-                                        
-                                        if m_data.get('vo2MaxPreciseValue'):
-                                            vo2_data['vo2MaxPrecise'] = m_data['vo2MaxPreciseValue']
-                                            
-                                        if m_data.get('fitnessAge') and 'fitnessAge' not in vo2_data:
-                                            vo2_data['fitnessAge'] = m_data['fitnessAge']
-                                
-                                if 'vo2Max' in vo2_data:
-                                    break
+                            if _vo2_from_max_metrics(max_metrics, date_str, vo2_data):
+                                break
                         except Exception:
                             continue
                             
@@ -681,18 +951,9 @@ class GarminClient:
                     stats_body = self.client.get_stats_and_body(today.isoformat())
                     logger.info(f"Stats and body response: {stats_body}")
                     
-                    if stats_body and isinstance(stats_body, dict):
-                        # Check various possible locations
-                        if 'fitnessAge' in stats_body and stats_body['fitnessAge']:
-                            vo2_data['fitnessAge'] = stats_body['fitnessAge']
-                            logger.info(f"✅ Found fitnessAge in stats_body: {stats_body['fitnessAge']}")
-                        
-                        # Also check nested structures
-                        if 'bodyComposition' in stats_body and isinstance(stats_body['bodyComposition'], dict):
-                            body_comp = stats_body['bodyComposition']
-                            if 'fitnessAge' in body_comp and body_comp['fitnessAge']:
-                                vo2_data['fitnessAge'] = body_comp['fitnessAge']
-                                logger.info(f"✅ Found fitnessAge in bodyComposition: {body_comp['fitnessAge']}")
+                    fitness_age = _fitness_age_from_stats(stats_body)
+                    if fitness_age:
+                        vo2_data['fitnessAge'] = fitness_age
                 
                 except Exception as e:
                     logger.warning(f"Could not get fitness age from stats_and_body: {e}")
@@ -725,11 +986,7 @@ class GarminClient:
                 logger.info(f"✅ VO2 Max data retrieved: {vo2_data}")
                 return vo2_data
             else:
-                logger.warning("⚠️ No VO2 Max data found in max_metrics for last 30 days")
-                logger.warning("This usually means:")
-                logger.warning("  - User hasn't done qualifying cardio activities (running/cycling with HR monitor)")
-                logger.warning("  - Garmin device doesn't support VO2 Max measurement")
-                logger.warning("  - Not enough activity history for Garmin to calculate VO2 Max")
+                _log_missing_vo2()
                 return None
                 
         except Exception as e:
@@ -810,46 +1067,8 @@ class GarminClient:
                         start_date, end_date, metric="elevationGain"
                     )
                     
-                    logger.info(f"Raw dist summary for {year}: {json.dumps(summary_dist, default=str)}")
-                    logger.info(f"Raw elev summary for {year}: {json.dumps(summary_elev, default=str)}")
                     
-                    stats_for_year = {}
-                    
-                    # Process distance
-                    if summary_dist and isinstance(summary_dist, list) and len(summary_dist) > 0:
-                        data_item = summary_dist[0]
-                        if 'stats' in data_item:
-                            stats_obj = data_item['stats']
-                            for sport_key, sport_data in stats_obj.items():
-                                if 'distance' in sport_data and 'sum' in sport_data['distance']:
-                                    # The API returns meters so cm logic is incorrect, convert meters to kilometers
-                                    distance_m = sport_data['distance']['sum']
-                                    distance_km = round(distance_m / 1000, 2)
-                                    if sport_key not in stats_for_year:
-                                        stats_for_year[sport_key] = {}
-                                    stats_for_year[sport_key]['distance'] = distance_km
-                    
-                    # Process elevation
-                    if summary_elev and isinstance(summary_elev, list) and len(summary_elev) > 0:
-                        data_item = summary_elev[0]
-                        if 'stats' in data_item:
-                            stats_obj = data_item['stats']
-                            for sport_key, sport_data in stats_obj.items():
-                                if 'elevationGain' in sport_data and 'sum' in sport_data['elevationGain']:
-                                    elevation_cm = sport_data['elevationGain']['sum']
-                                    elevation_m = round(elevation_cm / 100, 2)
-                                    if sport_key not in stats_for_year:
-                                        stats_for_year[sport_key] = {}
-                                    stats_for_year[sport_key]['elevationGain'] = elevation_m
-
-                    # Formatting fallback for frontend compat: if distance exists, flatten it
-                    # But we want to send structured data if we have both
-                    flat_stats_for_year = {}
-                    for sport, metrics in stats_for_year.items():
-                        if 'distance' in metrics:
-                            flat_stats_for_year[sport] = metrics['distance']
-                        if 'elevationGain' in metrics:
-                            flat_stats_for_year[f"{sport}_elevation"] = metrics['elevationGain']
+                    flat_stats_for_year = _flatten_yearly_progress(summary_dist, summary_elev)
 
                     yearly_stats[year] = flat_stats_for_year
                     
@@ -905,42 +1124,42 @@ class GarminClient:
     def schedule_workout(self, workout_id: int, date_str: str) -> bool:
         """
         Schedule a workout on a specific date (YYYY-MM-DD) on the Garmin calendar.
-        Tries 3 known endpoint patterns. Returns True on success, False if all fail (non-fatal).
+        Tries the 3 known endpoint patterns, the ones that have been working lately first.
+        Returns True on success, False if all fail (non-fatal).
         """
         if not self.client:
             logger.error("Client not authenticated.")
             return False
         
-        # --- Attempt 1: POST /workout-service/schedule with JSON body ---
-        try:
-            logger.info(f"Scheduling workout {workout_id} for {date_str} (v2 JSON body)...")
-            url = GarminAPIEndpoints.SCHEDULE_WORKOUT_V2
-            payload = {"workoutId": workout_id, "calendarDate": date_str}
-            self.client.garth.post("connectapi", url, json=payload, api=True)
-            logger.info(f"✅ Workout {workout_id} scheduled via workout-service for {date_str}")
-            return True
-        except Exception as e1:
-            logger.warning(f"Attempt 1 failed ({e1})")
-        
-        # --- Attempt 2: POST /workout-service/workout/{id}/schedule/{date} (REST path) ---
-        try:
-            logger.info(f"Scheduling workout {workout_id} for {date_str} (v3 REST path)...")
-            url = GarminAPIEndpoints.SCHEDULE_WORKOUT_V3.format(workout_id=workout_id, date_str=date_str)
-            self.client.garth.post("connectapi", url, api=True)
-            logger.info(f"✅ Workout {workout_id} scheduled via workout-service REST path")
-            return True
-        except Exception as e2:
-            logger.warning(f"Attempt 2 failed ({e2})")
+        garth = self.client.garth
+        variants = {
+            # POST /workout-service/schedule with JSON body
+            "v2": lambda: garth.post(
+                "connectapi", GarminAPIEndpoints.SCHEDULE_WORKOUT_V2,
+                json={"workoutId": workout_id, "calendarDate": date_str}, api=True,
+            ),
+            # POST /workout-service/workout/{id}/schedule/{date} (REST path)
+            "v3": lambda: garth.post(
+                "connectapi", GarminAPIEndpoints.SCHEDULE_WORKOUT_V3.format(workout_id=workout_id, date_str=date_str), api=True
+            ),
+            # Legacy calendar-service
+            "legacy": lambda: garth.post(
+                "connectapi", GarminAPIEndpoints.SCHEDULE_WORKOUT.format(workout_id=workout_id, date_str=date_str), api=True
+            ),
+        }
+        last_error = None
+        for name in ENDPOINT_HEALTH.order("schedule_workout", list(variants)):
+            try:
+                logger.info(f"Scheduling workout {workout_id} for {date_str} ({name})...")
+                ENDPOINT_HEALTH.call("schedule_workout", name, variants[name])
+                logger.info(f"✅ Workout {workout_id} scheduled via {name} endpoint for {date_str}")
+                return True
+            except Exception as e:
+                last_error = e
+                logger.warning(f"Schedule attempt {name} failed ({e})")
         
-        # --- Attempt 3: legacy calendar-service ---
-        try:
-            url = GarminAPIEndpoints.SCHEDULE_WORKOUT.format(workout_id=workout_id, date_str=date_str)
-            self.client.garth.post("connectapi", url, api=True)
-            logger.info(f"✅ Workout {workout_id} scheduled via legacy calendar-service")
-            return True
-        except Exception as e3:
-            logger.warning(f"All schedule attempts failed. Workout saved in Garmin Connect but not on calendar. ({e3})")
-            return False
+        logger.warning(f"All schedule attempts failed. Workout saved in Garmin Connect but not on calendar. ({last_error})")
+        return False
 
     def send_workout_to_device(self, workout_id: int, device_id: str) -> bool:
         """
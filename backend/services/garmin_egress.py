@@ -0,0 +1,280 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+import itertools
+from collections import OrderedDict
+from urllib.parse import urlparse
+import httpx
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from garth.http import USER_AGENT
+from backend.services.garmin_rate_governor import parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+
+def proxy_label(url):
+    """host:port of a proxy URL — proxy URLs carry credentials, so never log or report them whole."""
+    if not url:
+        return "direct"
+    parsed = urlparse(url)
+    return f"{parsed.hostname}:{parsed.port}" if parsed.port else (parsed.hostname or "proxy")
+
+
+class _Proxy:
+    __slots__ = ("url", "label", "requests", "errors", "rate_limited", "consecutive_failures",
+                 "latency_ms", "down_until", "limited_until", "last_error")
+
+    def __init__(self, url):
+        self.url = url
+        self.label = proxy_label(url)
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.consecutive_failures = 0
+        self.latency_ms = None  # Moving average of successful requests
+        self.down_until = 0.0  # Taken out after repeated connection failures
+        self.limited_until = 0.0  # Taken out after a 429 (Retry-After, or the cooldown)
+        self.last_error = None
+
+    def healthy(self, now):
+        return self.down_until <= now and self.limited_until <= now
+
+
+class _SharedAdapter(HTTPAdapter):
+    """requests adapter mounted on every garth session. Closing one session must not drop everyone's connections."""
+
+    def close(self):
+        pass
+
+    def close_pools(self):
+        super().close()
+
+
+class GarminEgress:
+    """
+    The shared way out to Garmin for every client on this worker.
+
+    Proxies come from GARMIN_PROXY_URLS (comma separated; GARMIN_PROXY_URL still
+    works as a pool of one); without any, requests go direct. Each account sticks
+    to one proxy — SSO cookies and the rate governor's per-proxy budget assume a
+    stable egress IP — until that proxy turns unhealthy: `fail_after` connection
+    failures in a row take it out for `cooldown` seconds, a 429 for its
+    Retry-After. The account then rotates to the next healthy proxy. A background
+    check probes every proxy each `health_interval` seconds, so stalled ones are
+    noticed (and recovered ones brought back) without a user request paying for it.
+
+    Connections are pooled per proxy and shared by all users: one requests adapter
+    for every garth session, one httpx.AsyncClient per (event loop, proxy).
+    """
+
+    def __init__(self, proxies=None, timeout=5, fail_after=3, cooldown=60, health_interval=60,
+                 probe_url="https://connect.garmin.com/", max_assignments=10000):
+        self.proxies = [_Proxy(url) for url in dict.fromkeys(proxies or [])]
+        self.timeout = timeout
+        self.fail_after = fail_after
+        self.cooldown = cooldown
+        self.health_interval = health_interval
+        self.probe_url = probe_url
+        self.max_assignments = max_assignments
+        self._by_url = {proxy.url: proxy for proxy in self.proxies}
+        self._assigned = OrderedDict()  # email -> proxy url
+        self._rotation = itertools.count()
+        self._lock = threading.Lock()
+        self._adapter = None
+        self._http = {}  # (event loop id, proxy url) -> httpx.AsyncClient
+        self._task = None
+
+    # --- selection --------------------------------------------------------
+
+    def pick(self, email=None, avoid=None):
+        """
+        Proxy URL for `email`'s next request (None = go direct). `avoid` moves the
+        account off a proxy that just failed, if any other proxy is healthy.
+        """
+        if not self.proxies:
+            return None
+        now = time.time()
+        with self._lock:
+            current = self._assigned.get(email)
+            if current and current != avoid and self._by_url[current].healthy(now):
+                self._assigned.move_to_end(email)
+                return current
+            healthy = [proxy for proxy in self.proxies if proxy.healthy(now) and proxy.url != avoid]
+            if healthy:
+                proxy = healthy[next(self._rotation) % len(healthy)]
+            elif current and self._by_url[current].healthy(now):
+                proxy = self._by_url[current]  # Nowhere better to go
+            else:
+                # Everything is out: use whichever comes back first rather than failing outright
+                proxy = min(self.proxies, key=lambda p: max(p.down_until, p.limited_until))
+            if email:
+                if current and current != proxy.url:
+                    logger.info(f"🛡️ Moving {email} from proxy {self._by_url[current].label} to {proxy.label}")
+                self._assigned[email] = proxy.url
+                self._assigned.move_to_end(email)
+                while len(self._assigned) > self.max_assignments:
+                    self._assigned.popitem(last=False)
+            return proxy.url
+
+    # --- reporting --------------------------------------------------------
+
+    def record(self, url, ok, latency=None, status=None, retry_after=None, error=None):
+        """
+        Outcome of one request through `url`. `ok` means the proxy delivered a response
+        (any status); transport errors and timeouts are failures. A 429 rests the proxy.
+        """
+        proxy = self._by_url.get(url)
+        if proxy is None:
+            return
+        now = time.time()
+        with self._lock:
+            proxy.requests += 1
+            if status == 429:
+                proxy.rate_limited += 1
+                proxy.limited_until = max(proxy.limited_until, now + (retry_after or self.cooldown))
+                logger.warning(f"⚠️ Proxy {proxy.label} is rate limited by Garmin; rotating accounts away from it")
+            if ok:
+                proxy.consecutive_failures = 0
+                if proxy.down_until:
+                    logger.info(f"✅ Proxy {proxy.label} recovered")
+                proxy.down_until = 0.0
+                if latency is not None:
+                    ms = latency * 1000
+                    proxy.latency_ms = ms if proxy.latency_ms is None else 0.8 * proxy.latency_ms + 0.2 * ms
+            else:
+                proxy.errors += 1
+                proxy.consecutive_failures += 1
+                proxy.last_error = str(error)[:200] if error else None
+                if proxy.consecutive_failures >= self.fail_after and proxy.down_until <= now:
+                    proxy.down_until = now + self.cooldown
+                    logger.warning(f"⚠️ Proxy {proxy.label} failed {proxy.consecutive_failures}x in a row; out of rotation for {self.cooldown}s")
+
+    # --- connection pools -------------------------------------------------
+
+    @staticmethod
+    def _retry_policy(template):
+        """
+        `template`'s retry policy without 429s: a rate-limited response must reach the
+        rate governor (AIMD backoff) and the proxy health tracker as a status code,
+        not be retried (and slept on for its Retry-After) inside the adapter.
+        """
+        retries = template.max_retries if isinstance(template, HTTPAdapter) else None
+        if not isinstance(retries, Retry):
+            return Retry(0, read=False)
+        statuses = tuple(code for code in (retries.status_forcelist or ()) if code != 429)
+        return retries.new(status_forcelist=statuses, respect_retry_after_header=False)
+
+    def adapter(self, template=None):
+        """The requests adapter shared by all garth sessions (retry policy from `template`, minus 429s)."""
+        with self._lock:
+            if self._adapter is None:
+                self._adapter = _SharedAdapter(
+                    max_retries=self._retry_policy(template),
+                    pool_connections=10,
+                    pool_maxsize=50,
+                )
+            return self._adapter
+
+    def mount(self, garth_client):
+        """Send a garth session's HTTPS requests through the shared connection pool."""
+        sess = garth_client.sess
+        sess.mount("https://", self.adapter(sess.get_adapter("https://")))
+
+    def http_client(self, proxy_url=None) -> httpx.AsyncClient:
+        """Pooled keep-alive httpx client for `proxy_url` on the running event loop."""
+        key = (id(asyncio.get_running_loop()), proxy_url)
+        http = self._http.get(key)
+        if http is None or http.is_closed:
+            http = httpx.AsyncClient(
+                proxy=proxy_url,
+                # Strict timeout through a proxy so a stalled one fails fast, garth's default otherwise
+                timeout=self.timeout if proxy_url else 10,
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+                headers=USER_AGENT,
+            )
+            self._http[key] = http
+        return http
+
+    async def close(self):
+        """Close all pooled connections (app shutdown)."""
+        clients = list(self._http.values())
+        self._http.clear()
+        for http in clients:
+            try:
+                await http.aclose()
+            except Exception as e:
+                logger.debug(f"Error closing Garmin HTTP client: {e}")
+        if self._adapter is not None:
+            self._adapter.close_pools()
+
+    # --- health checks ----------------------------------------------------
+
+    async def _probe(self, proxy):
+        start = time.monotonic()
+        try:
+            resp = await self.http_client(proxy.url).head(self.probe_url)
+        except httpx.HTTPError as e:
+            self.record(proxy.url, False, error=e)
+            return False
+        self.record(proxy.url, True, time.monotonic() - start, resp.status_code,
+                    parse_retry_after(resp.headers.get("Retry-After")))
+        return resp.status_code != 429
+
+    async def check(self):
+        """Probe every proxy once. Returns {label: reachable}."""
+        results = await asyncio.gather(*(self._probe(proxy) for proxy in self.proxies))
+        return {proxy.label: ok for proxy, ok in zip(self.proxies, results)}
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.check()
+            except Exception as e:
+                logger.warning(f"⚠️ Proxy health check failed: {e}")
+
+    def start(self):
+        if self.proxies and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            users = {}
+            for url in self._assigned.values():
+                users[url] = users.get(url, 0) + 1
+            return {
+                proxy.label: {
+                    "healthy": proxy.healthy(now),
+                    "requests": proxy.requests,
+                    "error_rate": round(proxy.errors / proxy.requests, 3) if proxy.requests else None,
+                    "rate_limited": proxy.rate_limited,
+                    "latency_ms": round(proxy.latency_ms, 1) if proxy.latency_ms is not None else None,
+                    "down_for": round(max(0.0, proxy.down_until - now)),
+                    "limited_for": round(max(0.0, proxy.limited_until - now)),
+                    "accounts": users.get(proxy.url, 0),
+                    "last_error": proxy.last_error,
+                }
+                for proxy in self.proxies
+            }
+
+
+GARMIN_EGRESS = GarminEgress(
+    proxies=[url.strip() for url in (os.getenv("GARMIN_PROXY_URLS") or os.getenv("GARMIN_PROXY_URL") or "").split(",") if url.strip()],
+    timeout=float(os.getenv("GARMIN_PROXY_TIMEOUT", "5")),
+    fail_after=int(os.getenv("GARMIN_PROXY_FAIL_AFTER", "3")),
+    cooldown=float(os.getenv("GARMIN_PROXY_COOLDOWN", "60")),
+    health_interval=float(os.getenv("GARMIN_PROXY_HEALTH_INTERVAL", "60")),
+)
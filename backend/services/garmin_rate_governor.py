@@ -0,0 +1,236 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from garminconnect import GarminConnectTooManyRequestsError
+
+logger = logging.getLogger(__name__)
+
+
+def parse_retry_after(value):
+    """Retry-After header (delta-seconds or HTTP-date) -> seconds, or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Reservation-based token bucket with AIMD rate adaptation.
+
+    `reserve()` always takes a token and returns how long the caller must wait
+    for it, so callers queue fairly without a background refiller. A 429 halves
+    the rate (and honours Retry-After by blocking the bucket); every successful
+    call restores 5% of the configured rate.
+    """
+
+    def __init__(self, rate, capacity, min_rate=None):
+        self.base_rate = float(rate)
+        self.rate = float(rate)
+        self.min_rate = min_rate or self.base_rate / 10
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.throttled = 0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, now):
+        self._refill(now)
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate, self.blocked_until - now)
+
+    def refund(self):
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def penalize(self, now, retry_after=None):
+        self.throttled += 1
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = min(self.tokens, 0.0)  # No more bursting until the bucket recovers
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+
+    def reward(self):
+        if self.rate < self.base_rate:
+            self.rate = min(self.base_rate, self.rate + self.base_rate * 0.05)
+
+    def is_idle(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity and self.blocked_until <= now and self.rate >= self.base_rate
+
+
+class GarminRateGovernor:
+    """
+    Central pacing for every Garmin request, shared by GarminClient (garth
+    requests.Session) and AsyncGarminClient (httpx).
+
+    Each call draws from three token buckets — global, per egress proxy, and
+    per Garmin account — and waits for the slowest. Observed 429s slow down the
+    proxy and account buckets; calls that would have to wait longer than
+    `max_wait` fail immediately with GarminConnectTooManyRequestsError instead
+    of tying up a request.
+    """
+
+    def __init__(self, global_rate=20, global_burst=40, proxy_rate=10, proxy_burst=20,
+                 user_rate=4, user_burst=20, max_wait=30):
+        self.max_wait = max_wait
+        self._config = {
+            "global": (global_rate, global_burst),
+            "proxy": (proxy_rate, proxy_burst),
+            "user": (user_rate, user_burst),
+        }
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._stats = {"acquired": 0, "delayed": 0, "rejected": 0, "throttled_429": 0,
+                       "total_wait": 0.0, "max_wait": 0.0}
+        self._last_prune = time.monotonic()
+
+    @staticmethod
+    def _keys(email, proxy):
+        # Proxy URLs carry credentials; budget (and report) by host:port only
+        proxy_label = "direct"
+        if proxy:
+            parsed = urlparse(proxy)
+            proxy_label = f"{parsed.hostname}:{parsed.port}" if parsed.port else (parsed.hostname or "proxy")
+        return [("global", ""), ("proxy", proxy_label), ("user", email or "anonymous")]
+
+    def _bucket(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            rate, burst = self._config[key[0]]
+            bucket = self._buckets[key] = TokenBucket(rate, burst)
+        return bucket
+
+    def _prune_locked(self, now):
+        """Forget per-account buckets that are full and unthrottled (they'd be recreated identically)."""
+        if now - self._last_prune < 300:
+            return
+        self._last_prune = now
+        for key in [k for k, b in self._buckets.items() if k[0] == "user" and b.is_idle(now)]:
+            del self._buckets[key]
+
+    def _reserve(self, email, proxy):
+        now = time.monotonic()
+        with self._lock:
+            self._prune_locked(now)
+            buckets = [self._bucket(k) for k in self._keys(email, proxy)]
+            wait = max(bucket.reserve(now) for bucket in buckets)
+            if wait > self.max_wait:
+                for bucket in buckets:
+                    bucket.refund()
+                self._stats["rejected"] += 1
+                raise GarminConnectTooManyRequestsError(
+                    f"Rate limit exceeded: Garmin request budget for {email} exhausted (retry in {wait:.0f}s)"
+                )
+            self._stats["acquired"] += 1
+            if wait > 0:
+                self._stats["delayed"] += 1
+                self._stats["total_wait"] += wait
+                self._stats["max_wait"] = max(self._stats["max_wait"], wait)
+                self._waiting += 1
+            return wait
+
+    def _done_waiting(self):
+        with self._lock:
+            self._waiting -= 1
+
+    async def acquire(self, email, proxy=None):
+        wait = self._reserve(email, proxy)
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._done_waiting()
+
+    def acquire_sync(self, email, proxy=None):
+        wait = self._reserve(email, proxy)
+        if wait > 0:
+            try:
+                time.sleep(wait)
+            finally:
+                self._done_waiting()
+
+    def headroom(self, email, proxy=None):
+        """
+        Requests `email` could make right now without waiting (tightest bucket), reserving
+        nothing. Buckets still recovering from a 429 report no headroom.
+        """
+        now = time.monotonic()
+        with self._lock:
+            available = []
+            for key in self._keys(email, proxy):
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    available.append(self._config[key[0]][1])
+                    continue
+                bucket._refill(now)
+                throttled = bucket.blocked_until > now or bucket.rate < bucket.base_rate
+                available.append(0.0 if throttled else max(0.0, bucket.tokens))
+            return min(available)
+
+    def report(self, email, proxy, status, retry_after=None):
+        """Feed a response status back so the buckets adapt to what Garmin tolerates."""
+        now = time.monotonic()
+        with self._lock:
+            if status == 429:
+                self._stats["throttled_429"] += 1
+                keys = self._keys(email, proxy)
+                for key in keys[1:]:
+                    self._bucket(key).penalize(now, retry_after)
+                logger.warning(
+                    f"⚠️ Garmin 429 for {email} via {keys[1][1]}"
+                    f"{f' (Retry-After {retry_after:.0f}s)' if retry_after else ''}; slowing down"
+                )
+            elif status < 400:
+                for key in self._keys(email, proxy):
+                    bucket = self._buckets.get(key)
+                    if bucket:
+                        bucket.reward()
+
+    def stats(self):
+        with self._lock:
+            delayed = self._stats["delayed"]
+            buckets = {
+                f"{kind}:{name}" if name else kind: {
+                    "rate": round(bucket.rate, 3),
+                    "base_rate": bucket.base_rate,
+                    "tokens": round(bucket.tokens, 2),
+                    "blocked_for": round(max(0.0, bucket.blocked_until - time.monotonic()), 1),
+                    "throttled": bucket.throttled,
+                }
+                for (kind, name), bucket in self._buckets.items() if kind != "user"
+            }
+            return {
+                **self._stats,
+                "total_wait": round(self._stats["total_wait"], 3),
+                "max_wait": round(self._stats["max_wait"], 3),
+                "avg_wait": round(self._stats["total_wait"] / delayed, 3) if delayed else 0.0,
+                "queue_depth": self._waiting,
+                "user_buckets": sum(1 for kind, _ in self._buckets if kind == "user"),
+                "buckets": buckets,
+            }
+
+
+RATE_GOVERNOR = GarminRateGovernor(
+    global_rate=float(os.getenv("GARMIN_RATE_GLOBAL", "20")),
+    global_burst=float(os.getenv("GARMIN_BURST_GLOBAL", "40")),
+    proxy_rate=float(os.getenv("GARMIN_RATE_PER_PROXY", "10")),
+    proxy_burst=float(os.getenv("GARMIN_BURST_PER_PROXY", "20")),
+    user_rate=float(os.getenv("GARMIN_RATE_PER_USER", "4")),
+    user_burst=float(os.getenv("GARMIN_BURST_PER_USER", "20")),
+    max_wait=float(os.getenv("GARMIN_RATE_MAX_WAIT", "30")),
+)
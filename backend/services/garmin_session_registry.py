@@ -0,0 +1,238 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    __slots__ = ("client", "owners", "lock", "last_verified", "cooldown_until", "pending",
+                 "token_version", "token_fingerprint", "version_checked_at", "last_access")
+
+    def __init__(self):
+        self.client = None            # Authenticated garminconnect.Garmin instance
+        self.owners = set()           # App user ids that logged in to (or restored their own) session
+        self.lock = threading.Lock()  # Serializes logins / DB restores for this email
+        self.last_verified = 0.0      # Last time the session tokens were saved or restored
+        self.cooldown_until = 0.0     # SSO login blocked until this timestamp (429 protection)
+        self.pending = None           # LoginSession for an in-progress (possibly MFA) login
+        self.token_version = 0        # Version of the shared token store the cached client holds
+        self.token_fingerprint = None # Content hash of those tokens (skips unchanged writes)
+        self.version_checked_at = 0.0 # Last time that version was compared with the store
+        self.last_access = time.time()
+
+    def is_protected(self, now):
+        """Entries that must survive eviction: login in flight, lock held, or SSO cooldown active."""
+        if self.pending is not None and self.pending.is_active(now):
+            return True
+        if self.lock.locked():
+            return True
+        return self.cooldown_until > now
+
+
+class GarminSessionRegistry:
+    """
+    Bounded, TTL-evicting per-email store for Garmin sessions, login locks,
+    verification timestamps, SSO cooldowns and pending logins.
+
+    Entries are kept in LRU order. An entry is evicted once it has been idle for
+    longer than `idle_ttl` seconds, or when the registry holds more than
+    `max_entries` emails (least recently used first). Evicting a cached client
+    closes its requests.Session; the HTTPS connection pools are shared by every
+    session (GARMIN_EGRESS) and stay open.
+    """
+
+    def __init__(self, max_entries=500, idle_ttl=3600):
+        self.max_entries = max_entries
+        self.idle_ttl = idle_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    # --- internal helpers -------------------------------------------------
+
+    def _entry(self, email, create=True):
+        """Return the entry for email (touching it), creating it if requested. Caller holds self._lock."""
+        entry = self._entries.get(email)
+        if entry is None and create:
+            entry = _Entry()
+            self._entries[email] = entry
+        if entry is not None:
+            entry.last_access = time.time()
+            self._entries.move_to_end(email)
+        return entry
+
+    def _evict_locked(self):
+        """Drop idle and over-capacity entries. Caller holds self._lock. Returns clients to close."""
+        now = time.time()
+        evicted = []
+        for email, entry in list(self._entries.items()):
+            if now - entry.last_access <= self.idle_ttl:
+                break  # LRU order: everything after this is fresher
+            if entry.is_protected(now):
+                continue
+            del self._entries[email]
+            evicted.append((email, entry.client))
+
+        if len(self._entries) > self.max_entries:
+            for email, entry in list(self._entries.items()):
+                if len(self._entries) <= self.max_entries:
+                    break
+                if entry.is_protected(now):
+                    continue
+                del self._entries[email]
+                evicted.append((email, entry.client))
+
+        self._evictions += len(evicted)
+        return evicted
+
+    @staticmethod
+    def _close_clients(evicted):
+        for email, client in evicted:
+            if client is None:
+                continue
+            try:
+                client.garth.sess.close()
+                logger.info(f"Evicted cached Garmin session for {email} (shared connection pools stay open)")
+            except Exception as e:
+                logger.debug(f"Failed to close evicted Garmin session for {email}: {e}")
+
+    # --- clients ----------------------------------------------------------
+
+    def get_client(self, email, record=True, user_id=None):
+        """Return the cached Garmin client for email, or None. With a user_id, only a client that user
+        logged in to or restored is returned. Counts towards the hit rate when record=True."""
+        with self._lock:
+            entry = self._entry(email, create=False)
+            client = entry.client if entry else None
+            if client is not None and user_id and user_id not in entry.owners:
+                client = None
+            if record:
+                if client is not None:
+                    self._hits += 1
+                else:
+                    self._misses += 1
+            evicted = self._evict_locked()
+        self._close_clients(evicted)
+        return client
+
+    def has_client(self, email):
+        with self._lock:
+            entry = self._entries.get(email)
+            return entry is not None and entry.client is not None
+
+    def set_client(self, email, client, user_id=None):
+        with self._lock:
+            entry = self._entry(email)
+            previous = entry.client
+            if previous is not client:
+                entry.owners = set()
+            entry.client = client
+            if user_id:
+                entry.owners.add(user_id)
+            evicted = self._evict_locked()
+        if previous is not None and previous is not client:
+            evicted.append((email, previous))
+        self._close_clients(evicted)
+
+    def drop_client(self, email):
+        with self._lock:
+            entry = self._entries.get(email)
+            client = entry.client if entry else None
+            if entry:
+                entry.client = None
+                entry.owners = set()
+        self._close_clients([(email, client)])
+
+    # --- locks, verification, cooldown ------------------------------------
+
+    def get_lock(self, email) -> threading.Lock:
+        """Atomically get-or-create the per-email login lock."""
+        with self._lock:
+            return self._entry(email).lock
+
+    def mark_verified(self, email, timestamp=None):
+        with self._lock:
+            self._entry(email).last_verified = timestamp or time.time()
+
+    def last_verified(self, email):
+        with self._lock:
+            entry = self._entries.get(email)
+            return entry.last_verified if entry else 0.0
+
+    def set_cooldown(self, email, until):
+        with self._lock:
+            self._entry(email).cooldown_until = until
+
+    def cooldown_until(self, email):
+        with self._lock:
+            entry = self._entries.get(email)
+            return entry.cooldown_until if entry else 0.0
+
+    def token_version(self, email):
+        """Return (token version held by this worker, time it was last checked against the store)."""
+        with self._lock:
+            entry = self._entries.get(email)
+            return (entry.token_version, entry.version_checked_at) if entry else (0, 0.0)
+
+    def set_token_version(self, email, version, fingerprint=None):
+        with self._lock:
+            entry = self._entry(email)
+            entry.token_version = version
+            entry.version_checked_at = time.time()
+            if fingerprint is not None:
+                entry.token_fingerprint = fingerprint
+
+    def token_fingerprint(self, email):
+        with self._lock:
+            entry = self._entries.get(email)
+            return entry.token_fingerprint if entry else None
+
+    # --- pending logins ---------------------------------------------------
+
+    def get_pending(self, email):
+        with self._lock:
+            entry = self._entry(email, create=False)
+            return entry.pending if entry else None
+
+    def set_pending(self, email, session):
+        with self._lock:
+            self._entry(email).pending = session
+
+    def pop_pending(self, email, session=None):
+        """Remove the pending login for email. If session is given, only remove it if it is still current."""
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None or entry.pending is None:
+                return False
+            if session is not None and entry.pending is not session:
+                return False
+            entry.pending = None
+            return True
+
+    # --- housekeeping -----------------------------------------------------
+
+    def purge(self):
+        """Run an eviction sweep now. Returns the number of evicted entries."""
+        with self._lock:
+            evicted = self._evict_locked()
+        self._close_clients(evicted)
+        return len(evicted)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "clients": sum(1 for e in self._entries.values() if e.client is not None),
+                "pending_logins": sum(1 for e in self._entries.values() if e.pending is not None),
+                "max_entries": self.max_entries,
+                "idle_ttl": self.idle_ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+                "evictions": self._evictions,
+            }
@@ -0,0 +1,64 @@
+import copy
+import asyncio
+import logging
+import functools
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent Garmin fetches.
+
+    The first caller for a key starts the upstream request; callers arriving
+    while it is still in flight await the same task instead of issuing their
+    own. Followers receive a deep copy of the result so routers can post-process
+    it without affecting each other. Nothing is cached once the call finishes.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self._calls = 0
+        self._executed = 0
+        self._coalesced = 0
+
+    async def do(self, key, fn):
+        """Run fn() for key, or join the call already in flight for it."""
+        # Tasks are bound to their event loop, so in-flight calls are never shared across loops
+        key = (id(asyncio.get_running_loop()), key)
+        self._calls += 1
+        task = self._inflight.get(key)
+        if task is not None:
+            self._coalesced += 1
+            logger.debug(f"Coalesced Garmin fetch {key[1][1]} for {key[1][0]}")
+            # shield: a cancelled follower must not cancel the leader's request
+            result = await asyncio.shield(task)
+            return copy.deepcopy(result)
+
+        self._executed += 1
+        task = asyncio.ensure_future(fn())
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._inflight.pop(key, None) if self._inflight.get(key) is t else None)
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {
+            "calls": self._calls,
+            "executed": self._executed,
+            "coalesced": self._coalesced,
+            "in_flight": len(self._inflight),
+            "coalesce_rate": round(self._coalesced / self._calls, 3) if self._calls else 0.0,
+        }
+
+
+# One per worker process
+SINGLE_FLIGHT = SingleFlight()
+
+
+def coalesced(method):
+    """Decorator for AsyncGarminClient read methods: key on (Garmin account, method, args)."""
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        key = (self.email, method.__name__, args, tuple(sorted(kwargs.items())))
+        return await SINGLE_FLIGHT.do(key, lambda: method(self, *args, **kwargs))
+    return wrapper
@@ -0,0 +1,147 @@
+import json
+import hashlib
+import logging
+from dataclasses import asdict
+from garth.auth_tokens import OAuth1Token, OAuth2Token
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from backend.models import GarminSession, UserSetting
+
+logger = logging.getLogger(__name__)
+
+
+OAUTH1_FILE = "oauth1_token.json"
+OAUTH2_FILE = "oauth2_token.json"
+
+
+def dump_garth_tokens(garth_client) -> dict:
+    """Serialize garth OAuth tokens to {filename: content}, the same layout garth.dump() writes to disk."""
+    tokens = {}
+    if garth_client.oauth1_token:
+        tokens[OAUTH1_FILE] = json.dumps(asdict(garth_client.oauth1_token), indent=4, default=str)
+    if garth_client.oauth2_token:
+        tokens[OAUTH2_FILE] = json.dumps(asdict(garth_client.oauth2_token), indent=4)
+    return tokens
+
+
+def load_garth_tokens(garth_client, tokens: dict):
+    """Load {filename: content} tokens into an existing garth client (in place)."""
+    oauth1 = OAuth1Token(**json.loads(tokens[OAUTH1_FILE]))
+    oauth2 = OAuth2Token(**json.loads(tokens[OAUTH2_FILE]))
+    garth_client.configure(oauth1_token=oauth1, oauth2_token=oauth2, domain=oauth1.domain)
+
+
+def tokens_fingerprint(tokens: dict) -> str:
+    """Content hash of a token dict, used to skip writes when nothing changed."""
+    return hashlib.sha256(json.dumps(tokens, sort_keys=True).encode()).hexdigest()
+
+
+class GarminTokenStore:
+    """
+    Versioned garth token store shared by every worker through the database.
+
+    Tokens are stored per (app user, Garmin email): knowing a Garmin email is
+    not enough to resume someone else's session, the user has to have logged
+    in to it. Rows without a user (written before sessions were user-scoped)
+    are still read as a fallback but never written to.
+
+    Each write bumps the row's version, so a worker that already holds a
+    session only needs a single-column version probe to know whether another
+    process has refreshed the tokens since it last read them. Writes whose
+    content hash matches the stored tokens are skipped and keep the version.
+    """
+
+    @staticmethod
+    def _legacy_key(email):
+        return f"garmin_session_{email}"
+
+    @staticmethod
+    def _scoped(query, email, user_id):
+        """Filter a GarminSession query to one user's row for email (the legacy NULL-user row without a user)."""
+        query = query.filter(GarminSession.garmin_email == email)
+        if user_id:
+            return query.filter(GarminSession.user_id == user_id)
+        return query.filter(GarminSession.user_id == None)
+
+    def load(self, db: Session, email, user_id=None):
+        """Return {"version": int, "tokens": dict, "fingerprint": str, "display_name": str|None} or None.
+        Version 0 means the tokens came from a legacy unversioned UserSetting row."""
+        row = self._scoped(db.query(GarminSession), email, user_id).first()
+        if not row and user_id:
+            # Legacy row written before sessions were scoped by user (read-only)
+            row = self._scoped(db.query(GarminSession), email, None).first()
+        if row and row.tokens:
+            return {
+                "version": row.version,
+                "tokens": row.tokens,
+                "fingerprint": row.tokens_hash or tokens_fingerprint(row.tokens),
+                "display_name": row.display_name,
+            }
+
+        # Legacy per-user UserSetting record (pre token store)
+        query = db.query(UserSetting).filter(UserSetting.key == self._legacy_key(email))
+        if user_id:
+            setting = query.filter(UserSetting.user_id == user_id).first()
+            if not setting:
+                setting = query.filter(UserSetting.user_id == None).first()
+        else:
+            setting = query.filter(UserSetting.user_id == None).first()
+        if setting and setting.value:
+            return {
+                "version": 0,
+                "tokens": setting.value,
+                "fingerprint": tokens_fingerprint(setting.value),
+                "display_name": None,
+            }
+        return None
+
+    def current_version(self, db: Session, email, user_id=None) -> int:
+        """Cheap probe: the stored token version for the user's email (0 if none)."""
+        version = self._scoped(db.query(GarminSession.version), email, user_id).scalar()
+        if version is None and user_id:
+            version = self._scoped(db.query(GarminSession.version), email, None).scalar()
+        return version or 0
+
+    def save(self, db: Session, email, tokens: dict, user_id=None, display_name=None) -> int:
+        """Write the user's tokens and return the new version (monotonically increasing per user and email).
+        Unchanged tokens (same content hash and display name) are not rewritten."""
+        if not user_id:
+            raise ValueError(f"Refusing to store Garmin tokens for {email} without a user")
+        fingerprint = tokens_fingerprint(tokens)
+        for attempt in range(2):
+            try:
+                row = self._scoped(db.query(GarminSession), email, user_id).with_for_update().first()
+                if row:
+                    if row.tokens_hash == fingerprint and (not display_name or display_name == row.display_name):
+                        version = row.version
+                        db.rollback()  # Release the row lock
+                        return version
+                    row.version = (row.version or 0) + 1
+                    row.tokens = tokens
+                    row.tokens_hash = fingerprint
+                    if display_name:
+                        row.display_name = display_name
+                else:
+                    # Continue from a legacy row's version so workers holding it still see a newer one
+                    row = GarminSession(garmin_email=email, user_id=user_id, tokens=tokens, tokens_hash=fingerprint,
+                                        display_name=display_name, version=self.current_version(db, email, None) + 1)
+                    db.add(row)
+                db.commit()
+                return row.version
+            except IntegrityError:
+                # Another worker inserted the row first — retry as an update
+                db.rollback()
+                if attempt:
+                    raise
+        return 0
+
+    def save_display_name(self, db: Session, email, display_name, user_id=None):
+        """Persist the resolved Garmin display name next to the user's tokens (does not bump the version)."""
+        if not user_id:
+            return False
+        updated = (
+            self._scoped(db.query(GarminSession), email, user_id)
+            .update({GarminSession.display_name: display_name}, synchronize_session=False)
+        )
+        db.commit()
+        return bool(updated)
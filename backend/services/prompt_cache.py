@@ -0,0 +1,232 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+from backend.services.prompt_context import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# A prompt split by how often its parts change: `system` is the same for every user (persona,
+# formatting rules), `context` is one athlete's data, `contents` is this request.
+PromptParts = namedtuple("PromptParts", "system context contents")
+
+
+class GeminiPrefixBackend:
+    """Explicit Gemini context caching: stores a system instruction + context server-side for reuse."""
+
+    def __init__(self, client, model):
+        self.client = client
+        self.model = model
+
+    def create(self, system, context, ttl):
+        from google.genai import types
+        cache = self.client.caches.create(
+            model=self.model,
+            config=types.CreateCachedContentConfig(
+                system_instruction=system,
+                contents=[context] if context else None,
+                ttl=f"{int(ttl)}s",
+                display_name="coach-prompt-prefix",
+            ),
+        )
+        return cache.name
+
+    def delete(self, name):
+        self.client.caches.delete(name=name)
+
+    @staticmethod
+    def is_rejection(error):
+        """True when Gemini refused a request because of its cached_content (unknown or expired cache)."""
+        code = getattr(error, "code", None)
+        return code in (400, 403, 404) and "cache" in str(error).lower()
+
+    @staticmethod
+    def is_unsupported(error):
+        """True when context caching is unavailable altogether (model or project without cache support)."""
+        message = str(error).lower()
+        return getattr(error, "code", None) == 403 or any(
+            phrase in message for phrase in ("not supported", "does not support", "unsupported"))
+
+    @staticmethod
+    def is_too_small(error):
+        """True when Gemini refused to cache a prefix below its minimum token count."""
+        message = str(error).lower()
+        return "too small" in message or "min_total_token_count" in message
+
+
+class PromptPrefixCache:
+    """
+    Reuse of the parts of CoachBrain prompts that repeat between calls.
+
+    Two local layers memoize prompt building: static instructions are built
+    once per process and key, and each user's rendered athlete context is kept
+    until its raw input (the version) changes. On top of that, when a backend is
+    configured, system + context prefixes of at least `min_tokens` are stored in
+    the model's context cache and later calls only send the new contents, which
+    cuts time-to-first-token for follow-up messages. Only a backend without
+    cache support disables remote caching (for `retry_after` seconds); a prefix
+    the backend finds too small is never offered again, and any other failure
+    (quota, 5xx, ...) only holds back that prefix for `failure_backoff` seconds.
+    Prompts are sent inline meanwhile, as they are while another call is still
+    creating the same prefix. When a user's context changes, the backend cache
+    holding their previous prefix is deleted rather than left to expire.
+    """
+
+    def __init__(self, backend=None, min_tokens=1024, ttl=3600, retry_after=3600, failure_backoff=60, max_entries=1000):
+        self.backend = backend
+        self.min_tokens = min_tokens
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self.failure_backoff = failure_backoff
+        self.max_entries = max_entries
+        self._static = {}
+        self._contexts = OrderedDict()  # user key -> (version, rendered context)
+        self._remote = OrderedDict()  # sha256 of system + context -> (cache name, expires_at)
+        self._user_remote = {}  # user key -> sha256 of that user's latest remote prefix
+        self._held_back = OrderedDict()  # sha256 -> time until which creating that prefix is not retried
+        self._creating = set()  # sha256 of prefixes being created right now
+        self._disabled_until = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"static_builds": 0, "static_hits": 0, "context_builds": 0, "context_hits": 0,
+                       "remote_created": 0, "remote_hits": 0, "remote_failures": 0, "remote_deleted": 0,
+                       "remote_rejected": 0, "remote_too_small": 0}
+
+    @staticmethod
+    def _digest(*parts):
+        return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+    def static(self, key, build):
+        """Static instructions for `key` (e.g. ("chat", "English")), built once per process."""
+        text = self._static.get(key)
+        if text is None:
+            text = self._static[key] = build()
+            self._stats["static_builds"] += 1
+        else:
+            self._stats["static_hits"] += 1
+        return text
+
+    def context(self, user_key, raw, build):
+        """`build(raw)` for a user, rebuilt only when `raw` changes. Without a user key nothing is kept."""
+        if user_key is None or not raw:
+            return build(raw)
+        version = self._digest(json.dumps(raw, sort_keys=True, default=str))
+        with self._lock:
+            entry = self._contexts.get(user_key)
+            if entry and entry[0] == version:
+                self._contexts.move_to_end(user_key)
+                self._stats["context_hits"] += 1
+                return entry[1]
+        text = build(raw)
+        with self._lock:
+            self._contexts[user_key] = (version, text)
+            self._contexts.move_to_end(user_key)
+            while len(self._contexts) > self.max_entries:
+                self._contexts.popitem(last=False)
+            self._stats["context_builds"] += 1
+        return text
+
+    def cached_content(self, parts, user_key=None):
+        """Name of a backend cache holding `parts.system` + `parts.context`, or None to send them inline."""
+        if self.backend is None or not parts.system:
+            return None
+        now = time.time()
+        if now < self._disabled_until:
+            return None
+        if estimate_tokens(parts.system) + estimate_tokens(parts.context) < self.min_tokens:
+            return None  # Below the backend's minimum cacheable size
+        key = self._digest(parts.system, parts.context or "")
+        with self._lock:
+            entry = self._remote.get(key)
+            if entry and entry[1] - 60 > now:  # Leave a margin so a call never races the expiry
+                self._remote.move_to_end(key)
+                self._stats["remote_hits"] += 1
+                return entry[0]
+            if key in self._creating or self._held_back.get(key, 0) > now:
+                return None  # Being created by another call, or recently refused
+            self._creating.add(key)
+        try:
+            name = self.backend.create(parts.system, parts.context, self.ttl)
+        except Exception as e:
+            self._create_failed(key, now, e)
+            return None
+        finally:
+            with self._lock:
+                self._creating.discard(key)
+        superseded = None
+        with self._lock:
+            self._held_back.pop(key, None)
+            self._remote[key] = (name, now + self.ttl)
+            while len(self._remote) > self.max_entries:
+                self._remote.popitem(last=False)
+            self._stats["remote_created"] += 1
+            if user_key is not None and parts.context:
+                previous = self._user_remote.get(user_key)
+                self._user_remote[user_key] = key
+                if previous and previous != key:
+                    superseded = self._remote.pop(previous, None)
+                if len(self._user_remote) > self.max_entries:
+                    self._user_remote.pop(next(iter(self._user_remote)))
+        if superseded:
+            self._delete(superseded[0])
+        return name
+
+    def _create_failed(self, key, now, error):
+        """Back off after a failed create: globally if caching is unsupported, else for this prefix only."""
+        with self._lock:
+            self._stats["remote_failures"] += 1
+            if self.backend.is_unsupported(error):
+                self._disabled_until = now + self.retry_after
+            else:
+                too_small = self.backend.is_too_small(error)
+                self._stats["remote_too_small"] += too_small
+                self._held_back[key] = float("inf") if too_small else now + self.failure_backoff
+                self._held_back.move_to_end(key)
+                while len(self._held_back) > self.max_entries:
+                    self._held_back.popitem(last=False)
+        if now < self._disabled_until:
+            logger.warning(f"⚠️ Prompt prefix caching unavailable, sending prompts inline for {self.retry_after}s: {error}")
+        else:
+            logger.info(f"Prompt prefix not cached, sending it inline: {error}")
+
+    def _delete(self, name):
+        """Delete a backend cache nobody uses any more (it would otherwise be billed until its TTL)."""
+        try:
+            self.backend.delete(name)
+            self._stats["remote_deleted"] += 1
+        except Exception as e:
+            logger.debug(f"Could not delete superseded prompt prefix cache {name}: {e}")
+
+    def is_rejection(self, error):
+        """True when `error` is the backend refusing a cached_content it no longer has."""
+        return self.backend is not None and self.backend.is_rejection(error)
+
+    def discard(self, name):
+        """Forget a backend cache the model rejected (e.g. expired early); the next call recreates it."""
+        if not name:
+            return
+        with self._lock:
+            for key in [k for k, (n, _) in self._remote.items() if n == name]:
+                del self._remote[key]
+            self._stats["remote_rejected"] += 1
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "users": len(self._contexts), "remote_entries": len(self._remote),
+                    "remote_enabled": self.backend is not None and time.time() >= self._disabled_until}
+
+
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "1") != "0"
+GEMINI_CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("GEMINI_CONTEXT_CACHE_MIN_TOKENS", "1024"))
+GEMINI_CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))
+
+
+def prefix_cache_for(client, model):
+    """PromptPrefixCache for a Gemini client (GEMINI_CONTEXT_CACHE=0 keeps only the local layers)."""
+    return PromptPrefixCache(
+        backend=GeminiPrefixBackend(client, model) if GEMINI_CONTEXT_CACHE else None,
+        min_tokens=GEMINI_CONTEXT_CACHE_MIN_TOKENS,
+        ttl=GEMINI_CONTEXT_CACHE_TTL,
+    )
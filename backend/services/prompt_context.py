@@ -0,0 +1,223 @@
+import os
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Context budget (estimated tokens) per prompt kind; the fixed instructions come on top
+PROMPT_BUDGETS = {
+    "advice": int(os.getenv("PROMPT_BUDGET_ADVICE", "1500")),
+    "chat": int(os.getenv("PROMPT_BUDGET_CHAT", "1500")),  # Chat history
+    "chat_context": int(os.getenv("PROMPT_BUDGET_CHAT_CONTEXT", "2000")),  # Athlete context (settings, plan, briefing)
+    "plan": int(os.getenv("PROMPT_BUDGET_PLAN", "1200")),
+    "analysis": int(os.getenv("PROMPT_BUDGET_ANALYSIS", "800")),
+}
+
+_DAY_ABBR = {"monday": "Mon", "tuesday": "Tue", "wednesday": "Wed", "thursday": "Thu",
+             "friday": "Fri", "saturday": "Sat", "sunday": "Sun"}
+
+
+def estimate_tokens(text):
+    """
+    Token estimate without a tokenizer round trip: ~4 bytes of UTF-8 per token,
+    which tracks Gemini's count closely for English and errs high for other scripts.
+    """
+    if not text:
+        return 0
+    return (len(text.encode("utf-8")) + 3) // 4
+
+
+def _compact(value):
+    """Drop None/empty members so they cost no tokens."""
+    if isinstance(value, dict):
+        items = ((k, _compact(v)) for k, v in value.items())
+        return {k: v for k, v in items if v not in (None, "", [], {})}
+    if isinstance(value, (list, tuple)):
+        return [_compact(v) for v in value]
+    if isinstance(value, float):
+        return round(value, 2)
+    return value
+
+
+def render_value(value):
+    """Dense, deterministic text for arbitrary data: strings as-is, everything else compact sorted JSON."""
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value.strip()
+    if hasattr(value, "to_dict"):
+        value = value.to_dict()
+    return json.dumps(_compact(value), sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def render_weekly_summary(summary, max_weeks=4):
+    """
+    DataProcessor.calculate_weekly_summary() output ({metric: {week: value}}) as one
+    line per week, newest first: "2026-03-30: 42.1 km, 5.2 h, TSS 310, 5 sessions".
+    """
+    if hasattr(summary, "to_dict"):
+        summary = summary.to_dict()
+    if not summary:
+        return "No training recorded in recent weeks."
+    if not isinstance(summary, dict) or not all(isinstance(v, dict) for v in summary.values()):
+        return render_value(summary)
+    weeks = sorted({str(week) for metric in summary.values() for week in metric}, reverse=True)[:max_weeks]
+    lines = []
+    for week in weeks:
+        def metric(name):
+            return next((v for k, v in summary.get(name, {}).items() if str(k) == week), None)
+        parts = []
+        if metric("distance"):
+            parts.append(f"{float(metric('distance')) / 1000:.1f} km")
+        if metric("duration"):
+            parts.append(f"{float(metric('duration')) / 3600:.1f} h")
+        if metric("tss"):
+            parts.append(f"TSS {float(metric('tss')):.0f}")
+        if metric("count"):
+            parts.append(f"{int(metric('count'))} sessions")
+        lines.append(f"- {week.split('/')[0]}: {', '.join(parts) or 'rest'}")
+    return "\n".join(lines)
+
+
+def render_settings(settings):
+    """Athlete settings as `key: value` lines, skipping defaults left empty."""
+    if not isinstance(settings, dict):
+        return render_value(settings)
+    settings = _compact(settings)
+    return "\n".join(f"- {key}: {render_value(settings[key])}" for key in sorted(settings))
+
+
+def render_plan(plan):
+    """A generated training plan as one line per day; the per-step structure is left out."""
+    if not isinstance(plan, dict) or "weeks" not in plan:
+        return render_value(plan)
+    lines = [f"{plan.get('title', 'Training plan')}: {plan.get('summary', '')}".rstrip(": ")]
+    for week in plan.get("weeks") or []:
+        header = ", ".join(str(v) for v in (week.get("focus"), week.get("total_distance"), week.get("total_tss")) if v)
+        lines.append(f"Week {week.get('week_number', '?')}: {header}")
+        for day in week.get("days") or []:
+            name = str(day.get("day_name", ""))
+            details = ", ".join(str(v) for v in (day.get("total_duration"), day.get("tss_estimate") and f"TSS {day['tss_estimate']}") if v)
+            lines.append(f"- {_DAY_ABBR.get(name.lower(), name)} {day.get('activity_type', '')}: "
+                         f"{day.get('workout_title', '')}{f' ({details})' if details else ''}")
+    return "\n".join(lines)
+
+
+def render_briefing(briefing):
+    """The cached daily briefing ({advice, workout}) as the advice text plus a one-line workout."""
+    if not isinstance(briefing, dict):
+        return render_value(briefing)
+    lines = [render_value(briefing.get("advice"))]
+    workout = briefing.get("workout")
+    if isinstance(workout, dict):
+        lines.append(f"Workout: {workout.get('workoutName', 'Workout')} - {workout.get('description', '')}".rstrip(" -"))
+    return "\n".join(line for line in lines if line)
+
+
+def truncate_to_tokens(text, max_tokens, keep="head"):
+    """Cut `text` to about `max_tokens` on line boundaries, keeping its head (or tail) and noting what was left out."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    lines = text.split("\n")
+    if keep == "tail":
+        lines.reverse()
+    kept, used = [], 0
+    for line in lines:
+        cost = estimate_tokens(line) + 1
+        if used + cost > max_tokens:
+            if not kept:
+                # A single line over budget: cut it by characters
+                kept.append(line[:max_tokens * 4] if keep == "head" else line[-max_tokens * 4:])
+            break
+        kept.append(line)
+        used += cost
+    omitted = len(lines) - len(kept)
+    if omitted:
+        kept.append(f"[... {omitted} more lines omitted]" if keep == "head" else f"[... {omitted} earlier lines omitted]")
+    if keep == "tail":
+        kept.reverse()
+    return "\n".join(kept)
+
+
+class _Section:
+    __slots__ = ("name", "text", "priority", "keep")
+
+    def __init__(self, name, text, priority, keep):
+        self.name = name
+        self.text = text
+        self.priority = priority
+        self.keep = keep
+
+
+class PromptContext:
+    """
+    The variable (athlete data) part of one prompt, fitted to a token budget.
+
+    Sections are added with a priority (0 = never cut); when their estimated total
+    exceeds the budget, the lowest-priority sections are truncated first (dropped
+    entirely if need be). finish() records the final prompt size in PROMPT_STATS.
+    """
+
+    def __init__(self, kind, budget=None):
+        self.kind = kind
+        self.budget = PROMPT_BUDGETS.get(kind, 1500) if budget is None else budget
+        self._sections = []
+        self.truncated = []
+
+    def add(self, name, text, priority=1, keep="head"):
+        self._sections.append(_Section(name, text or "", priority, keep))
+        return self
+
+    def fit(self):
+        """Section texts ({name: text}) after prioritized truncation to the budget."""
+        total = sum(estimate_tokens(s.text) for s in self._sections)
+        # Lowest priority first; among equals, the section added last is cut first
+        for section in sorted(reversed(self._sections), key=lambda s: -s.priority):
+            excess = total - self.budget
+            if excess <= 0:
+                break
+            if section.priority == 0:
+                continue
+            before = estimate_tokens(section.text)
+            section.text = truncate_to_tokens(section.text, max(0, before - excess), section.keep)
+            total -= before - estimate_tokens(section.text)
+            self.truncated.append(section.name)
+        return {s.name: s.text for s in self._sections}
+
+    def finish(self, prompt):
+        """Record and log the size of the assembled prompt (a string or its parts); returns it unchanged."""
+        tokens = estimate_tokens(prompt if isinstance(prompt, str) else "".join(part for part in prompt if part))
+        PROMPT_STATS.record(self.kind, tokens, bool(self.truncated))
+        logger.info(f"📏 {self.kind} prompt: ~{tokens} tokens"
+                    + (f" (truncated: {', '.join(self.truncated)})" if self.truncated else ""))
+        return prompt
+
+
+class PromptStats:
+    """Per-worker prompt size counters per prompt kind, for /garmin/fetch-stats."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._kinds = {}
+
+    def record(self, kind, tokens, truncated=False):
+        with self._lock:
+            stats = self._kinds.setdefault(kind, {"calls": 0, "total_tokens": 0, "max_tokens": 0, "truncated": 0})
+            stats["calls"] += 1
+            stats["total_tokens"] += tokens
+            stats["max_tokens"] = max(stats["max_tokens"], tokens)
+            stats["truncated"] += int(truncated)
+            stats["last_tokens"] = tokens
+
+    def stats(self):
+        with self._lock:
+            return {
+                kind: {**s, "avg_tokens": round(s["total_tokens"] / s["calls"])}
+                for kind, s in self._kinds.items()
+            }
+
+
+PROMPT_STATS = PromptStats()
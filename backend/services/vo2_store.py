@@ -0,0 +1,90 @@
+import logging
+from datetime import datetime
+from sqlalchemy import or_
+from backend.models import GarminVo2Max
+
+logger = logging.getLogger(__name__)
+
+
+class Vo2MaxStore:
+    """
+    Persisted VO2 max / fitness age per Garmin account.
+
+    Garmin recalculates VO2 max at most once a day, so a stored value is
+    served as-is and only re-resolved (in the background) once it was resolved
+    before today. All dates are UTC; the daily refresh attempt is claimed in the
+    row itself so it holds across workers and restarts.
+    """
+
+    @staticmethod
+    def _session():
+        from backend.database import SessionLocal
+        return SessionLocal()
+
+    def load(self, email):
+        """Return {"data", "vo2_source", "vo2_date", "fitness_age_source", "resolved_at"} or None."""
+        db = self._session()
+        try:
+            row = db.query(GarminVo2Max).filter(GarminVo2Max.garmin_email == email).first()
+            if not row or not row.data:
+                return None
+            return {
+                "data": row.data,
+                "vo2_source": row.vo2_source,
+                "vo2_date": row.vo2_date,
+                "fitness_age_source": row.fitness_age_source,
+                "resolved_at": row.resolved_at,
+            }
+        except Exception as e:
+            logger.warning(f"Could not load stored VO2 max for {email}: {e}")
+            return None
+        finally:
+            db.close()
+
+    def save(self, email, data, vo2_source=None, vo2_date=None, fitness_age_source=None):
+        db = self._session()
+        try:
+            row = db.query(GarminVo2Max).filter(GarminVo2Max.garmin_email == email).first()
+            if not row:
+                row = GarminVo2Max(garmin_email=email)
+                db.add(row)
+            row.data = data
+            row.vo2_source = vo2_source
+            row.vo2_date = vo2_date
+            row.fitness_age_source = fitness_age_source
+            row.resolved_at = datetime.utcnow()
+            db.commit()
+        except Exception as e:
+            logger.warning(f"Could not persist VO2 max for {email}: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def claim_refresh(self, email):
+        """
+        Atomically mark today's background refresh as attempted. True for exactly one
+        caller per account per (UTC) day; False if already claimed or on error.
+        """
+        now = datetime.utcnow()
+        today = datetime(now.year, now.month, now.day)
+        db = self._session()
+        try:
+            claimed = db.query(GarminVo2Max).filter(
+                GarminVo2Max.garmin_email == email,
+                or_(GarminVo2Max.refresh_attempted_at.is_(None), GarminVo2Max.refresh_attempted_at < today),
+            ).update({GarminVo2Max.refresh_attempted_at: now}, synchronize_session=False)
+            db.commit()
+            return claimed == 1
+        except Exception as e:
+            logger.warning(f"Could not claim VO2 max refresh for {email}: {e}")
+            db.rollback()
+            return False
+        finally:
+            db.close()
+
+    @staticmethod
+    def is_fresh(stored):
+        return stored["resolved_at"].date() >= datetime.utcnow().date()
+
+
+VO2_STORE = Vo2MaxStore()
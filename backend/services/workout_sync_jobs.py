@@ -0,0 +1,220 @@
+import os
+import json
+import uuid
+import asyncio
+import hashlib
+import logging
+from datetime import date, datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from backend.models import WorkoutSyncJob
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class WorkoutSyncJobs:
+    """
+    Runs "send workout to watch" as a background job instead of inside the request.
+
+    A submission returns a job ID right away; the steps (create, schedule, send to
+    device, save for the watch app) run in a task on this worker and write their
+    progress to the workout_sync_jobs table, so any worker can answer polls.
+    Submitting the same workout for the same device on the same day again returns
+    the existing job — unless it failed, or succeeded more than `resend_after`
+    seconds ago (a deliberate resend), in which case that job is re-run. Queued
+    and running jobs are heartbeated, so a job whose worker died (no update for
+    `stale_after`) is re-run too. Jobs older than `retention` are deleted.
+    """
+
+    def __init__(self, concurrency=4, stale_after=300, resend_after=120, retention=7 * 86400):
+        self.stale_after = timedelta(seconds=stale_after)
+        self.heartbeat = stale_after / 3
+        self.resend_after = timedelta(seconds=resend_after)
+        self.retention = timedelta(seconds=retention)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tasks = set()
+
+    @staticmethod
+    def _session():
+        from backend.database import SessionLocal
+        return SessionLocal()
+
+    @staticmethod
+    def dedupe_key(user_id, workout, device_id, day=None):
+        raw = json.dumps([user_id, workout, str(device_id or ""), (day or date.today()).isoformat()], sort_keys=True)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    @staticmethod
+    def _as_dict(job):
+        return {
+            "jobId": job.id,
+            "status": job.status,
+            "step": job.step,
+            "progress": job.progress,
+            "result": job.result,
+            "error": job.error,
+            "createdAt": job.created_at.isoformat() if job.created_at else None,
+            "updatedAt": job.updated_at.isoformat() if job.updated_at else None,
+        }
+
+    # --- DB helpers (run in a worker thread) ------------------------------
+
+    def _claim(self, user_id, key):
+        """Return (job dict, should_run): the job for `key`, created or reset to queued when it must (re)run."""
+        db = self._session()
+        try:
+            self._forget_old(db)
+            for attempt in range(2):
+                job = db.query(WorkoutSyncJob).filter(WorkoutSyncJob.dedupe_key == key).first()
+                if job:
+                    age = datetime.utcnow() - job.updated_at
+                    stale = job.status in ACTIVE_STATUSES and age > self.stale_after
+                    resend = job.status == "succeeded" and age > self.resend_after
+                    if job.status != "failed" and not stale and not resend:
+                        return self._as_dict(job), False
+                    job.status, job.step, job.progress, job.error, job.result = "queued", None, 0, None, None
+                else:
+                    job = WorkoutSyncJob(id=uuid.uuid4().hex, user_id=user_id, dedupe_key=key, status="queued", progress=0)
+                    db.add(job)
+                try:
+                    db.commit()
+                    return self._as_dict(job), True
+                except IntegrityError:
+                    # Same submission raced us on another worker — attach to its job
+                    db.rollback()
+                    if attempt:
+                        raise
+        finally:
+            db.close()
+
+    def _forget_old(self, db):
+        """Delete jobs created more than `retention` ago."""
+        try:
+            db.query(WorkoutSyncJob).filter(
+                WorkoutSyncJob.created_at < datetime.utcnow() - self.retention
+            ).delete(synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            logger.warning(f"Could not clean up old workout sync jobs: {e}")
+            db.rollback()
+
+    def _update(self, job_id, **fields):
+        db = self._session()
+        try:
+            db.query(WorkoutSyncJob).filter(WorkoutSyncJob.id == job_id).update(
+                {**fields, "updated_at": datetime.utcnow()}, synchronize_session=False
+            )
+            db.commit()
+        except Exception as e:
+            logger.error(f"Could not update workout sync job {job_id}: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def _load(self, user_id, job_id):
+        db = self._session()
+        try:
+            job = db.query(WorkoutSyncJob).filter(
+                WorkoutSyncJob.id == job_id, WorkoutSyncJob.user_id == user_id
+            ).first()
+            return self._as_dict(job) if job else None
+        finally:
+            db.close()
+
+    def _save_for_watch_app(self, workout):
+        from backend.models import UserSetting
+        db = self._session()
+        try:
+            setting = db.query(UserSetting).filter(UserSetting.key == "last_synced_workout").first()
+            if not setting:
+                setting = UserSetting(key="last_synced_workout", value=workout)
+                db.add(setting)
+            else:
+                setting.value = workout
+            db.commit()
+        except Exception as db_err:
+            logger.error(f"Could not save workout to DB: {db_err}")
+            db.rollback()
+        finally:
+            db.close()
+
+    # --- pipeline ---------------------------------------------------------
+
+    async def _step(self, job_id, step, progress):
+        await asyncio.to_thread(self._update, job_id, status="running", step=step, progress=progress)
+
+    async def _heartbeat(self, job_id):
+        """Keep a queued or running job's updated_at fresh so other workers don't take it for dead."""
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            await asyncio.to_thread(self._update, job_id)
+
+    async def _run(self, job_id, client, workout, device_id):
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            await self._pipeline(job_id, client, workout, device_id)
+        finally:
+            heartbeat.cancel()
+
+    async def _pipeline(self, job_id, client, workout, device_id):
+        async with self._semaphore:
+            try:
+                # 1. Create Workout in Garmin Connect
+                await self._step(job_id, "creating", 10)
+                created_workout = await client.create_workout(workout)
+                workout_id = (created_workout or {}).get("workoutId")
+                if not workout_id:
+                    raise Exception("Failed to retrieve workout ID after creation")
+
+                # 2. Schedule Workout for Today (non-fatal - workout is already saved if this fails)
+                await self._step(job_id, "scheduling", 40)
+                scheduled = False
+                try:
+                    scheduled = await client.schedule_workout(workout_id, date.today().isoformat())
+                except Exception as sched_err:
+                    logger.warning(f"Could not schedule workout on calendar (non-fatal): {sched_err}")
+
+                # 3. Queue for specific device (if provided, non-fatal)
+                sent = False
+                if device_id:
+                    await self._step(job_id, "sending", 70)
+                    try:
+                        sent = await client.send_workout_to_device(workout_id, device_id)
+                    except Exception as dev_err:
+                        logger.warning(f"Could not send workout to device (non-fatal): {dev_err}")
+
+                # 4. Save to DB for our custom Garmin Watch App
+                await self._step(job_id, "saving", 90)
+                await asyncio.to_thread(self._save_for_watch_app, workout)
+
+                msg = "Workout saved and scheduled for today." if scheduled else "Workout saved to Garmin Connect. Calendar scheduling unavailable - open the Garmin Connect app to see it."
+                await asyncio.to_thread(
+                    self._update, job_id, status="succeeded", step="done", progress=100,
+                    result={"workoutId": workout_id, "scheduled": scheduled, "sentToDevice": sent, "message": msg},
+                )
+                logger.info(f"✅ Workout sync job {job_id} finished (workout {workout_id})")
+            except Exception as e:
+                logger.error(f"Workout sync job {job_id} failed: {e}")
+                await asyncio.to_thread(self._update, job_id, status="failed", error=f"Failed to save workout to Garmin Connect: {e}")
+
+    # --- public API -------------------------------------------------------
+
+    async def submit(self, user_id, client, workout, device_id=None):
+        """Enqueue a sync (or attach to the identical one). Returns (job dict, deduplicated)."""
+        key = self.dedupe_key(user_id, workout, device_id)
+        job, should_run = await asyncio.to_thread(self._claim, user_id, key)
+        if should_run:
+            task = asyncio.create_task(self._run(job["jobId"], client, workout, device_id))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return job, not should_run
+
+    async def get(self, user_id, job_id):
+        return await asyncio.to_thread(self._load, user_id, job_id)
+
+
+WORKOUT_SYNC_JOBS = WorkoutSyncJobs(
+    concurrency=int(os.getenv("WORKOUT_SYNC_CONCURRENCY", "4")),
+    resend_after=int(os.getenv("WORKOUT_SYNC_RESEND_AFTER", "120")),
+)
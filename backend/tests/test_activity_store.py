@@ -0,0 +1,79 @@
+import asyncio
+from unittest.mock import patch
+
+from backend.services.activity_store import ActivityStore
+from backend.services.activity_details_store import ActivityDetailsStore
+
+
+def activity(activity_id, start):
+    return {"activityId": activity_id, "startTimeGMT": start, "activityName": f"Run {activity_id}"}
+
+
+class FakeClient:
+    email = "runner@example.com"
+
+    def __init__(self, activities):
+        self.activities = activities  # newest first, like Garmin
+        self.requests = []
+
+    async def get_activities_page(self, start=0, limit=20):
+        self.requests.append((start, limit))
+        return self.activities[start:start + limit]
+
+
+def test_sync_only_fetches_activities_newer_than_watermark(db_session):
+    # Share the test session's in-memory engine with the store
+    session_factory = lambda: type(db_session)(bind=db_session.get_bind())
+    store = ActivityStore(page_size=2, initial_limit=3, min_sync_interval=0, late_upload_window=0)
+    client = FakeClient([activity(i, f"2026-03-{i:02d} 07:00:00") for i in range(5, 0, -1)])
+
+    with patch.object(ActivityStore, "_session", staticmethod(session_factory)):
+        seeded = asyncio.run(store.get_recent(client, limit=3))
+        assert [a["activityId"] for a in seeded] == [5, 4, 3]
+
+        client.activities = [activity(7, "2026-03-07 07:00:00"), activity(6, "2026-03-06 07:00:00")] + client.activities
+        client.requests.clear()
+        recent = asyncio.run(store.get_recent(client, limit=4))
+
+    assert [a["activityId"] for a in recent] == [7, 6, 5, 4]
+    # Two new activities fill the first page; the second page reaches the stored activity 5
+    assert client.requests == [(0, 2), (2, 2)]
+
+
+def test_sync_keeps_activities_uploaded_late(db_session):
+    session_factory = lambda: type(db_session)(bind=db_session.get_bind())
+    store = ActivityStore(page_size=3, initial_limit=2, min_sync_interval=0, late_upload_window=2 * 86400)
+    client = FakeClient([activity(i, f"2026-03-{i:02d} 07:00:00") for i in (10, 8, 4, 3)])
+
+    with patch.object(ActivityStore, "_session", staticmethod(session_factory)):
+        asyncio.run(store.get_recent(client, limit=2))  # Stores 10 and 8
+
+        # A watch activity from the 9th shows up after the phone activity from the 10th was synced
+        client.activities.insert(1, activity(9, "2026-03-09 07:00:00"))
+        client.requests.clear()
+        recent = asyncio.run(store.get_recent(client, limit=3))
+
+    assert [a["activityId"] for a in recent] == [10, 9, 8]
+    # Stored activity 10 is within the window and skipped; stored activity 8 (at its edge) ends the sync
+    assert client.requests == [(0, 3)]
+
+
+def test_sync_drops_details_of_edited_and_deleted_activities(db_session):
+    session_factory = lambda: type(db_session)(bind=db_session.get_bind())
+    store = ActivityStore(page_size=5, initial_limit=4, min_sync_interval=0, late_upload_window=0)
+    client = FakeClient([activity(i, f"2026-03-{i:02d} 07:00:00") for i in (4, 3, 2, 1)])
+
+    with patch.object(ActivityStore, "_session", staticmethod(session_factory)), \
+            patch.object(ActivityDetailsStore, "_session", staticmethod(session_factory)):
+        asyncio.run(store.get_recent(client, limit=4))
+        details = ActivityDetailsStore()
+        for activity_id in (4, 3, 2):
+            details.save(client.email, activity_id, {"summary": {"activityId": activity_id}})
+
+        client.activities[0] = dict(client.activities[0], activityName="Tempo run")  # Renamed on Garmin
+        del client.activities[1]  # Activity 3 deleted on Garmin
+        recent = asyncio.run(store.get_recent(client, limit=4))
+        kept = {i: details.load(client.email, i, ("summary",)) for i in (4, 3, 2)}
+
+    assert [(a["activityId"], a["activityName"]) for a in recent] == [(4, "Tempo run"), (2, "Run 2"), (1, "Run 1")]
+    assert kept == {4: {}, 3: {}, 2: {"summary": {"activityId": 2}}}
@@ -0,0 +1,54 @@
+import math
+from backend.services.activity_streams import downsample_streams, lttb, min_max
+
+
+def make_high_res(n=5000, spike_at=1234):
+    descriptors = [
+        {"metricsIndex": 0, "key": "sumDuration", "unit": {"key": "second"}},
+        {"metricsIndex": 1, "key": "directHeartRate", "unit": {"key": "bpm"}},
+        {"metricsIndex": 2, "key": "directSpeed", "unit": {"key": "mps"}},
+        {"metricsIndex": 3, "key": "sumDistance", "unit": {"key": "meter"}},
+    ]
+    rows = [
+        {"metrics": [float(i), 140 + 10 * math.sin(i / 200) + (50 if i == spike_at else 0), 3.0 if i % 10 else 0.0, i * 3.0]}
+        for i in range(n)
+    ]
+    return {"metricDescriptors": descriptors, "activityDetailMetrics": rows}
+
+
+def test_lttb_keeps_endpoints_and_peaks():
+    ys = [0.0] * 1000
+    ys[500] = 100.0
+    picked = lttb(list(range(1000)), ys, 50)
+    assert len(picked) == 50
+    assert picked[0] == 0 and picked[-1] == 999
+    assert 500 in picked
+
+
+def test_min_max_keeps_extremes():
+    ys = [math.sin(i / 10) for i in range(1000)]
+    ys[321] = -5.0
+    picked = min_max(ys, 100)
+    assert len(picked) <= 100
+    assert 321 in picked
+    assert picked == sorted(picked)
+
+
+def test_downsample_streams_returns_compact_parallel_arrays():
+    streams = downsample_streams(make_high_res(), points=200, channels=["heart_rate", "pace", "power"])
+
+    assert streams["source_points"] == 5000
+    assert set(streams["channels"]) == {"heart_rate", "pace"}  # No power descriptor
+    hr = streams["channels"]["heart_rate"]
+    assert hr["unit"] == "bpm"
+    assert len(hr["time"]) == len(hr["distance"]) == len(hr["value"]) == 200
+    assert max(hr["value"]) > 185  # The spike survives decimation
+    pace = streams["channels"]["pace"]
+    assert pace["unit"] == "min/km"
+    assert None not in pace["value"]  # Standing-still samples are dropped, not charted as gaps
+    assert pace["value"][0] == round(1000 / 3.0 / 60, 2)
+
+
+def test_raw_method_keeps_every_sample():
+    streams = downsample_streams(make_high_res(n=300), points=50, method="raw", channels=["heart_rate"])
+    assert len(streams["channels"]["heart_rate"]["value"]) == 300
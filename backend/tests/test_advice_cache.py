@@ -0,0 +1,102 @@
+import asyncio
+from unittest.mock import patch, MagicMock, AsyncMock
+
+from backend.models import User
+from backend.services.advice_cache import ADVICE_CACHE, AdviceCache
+from backend.services.ai_rate_limiter import AI_RATE_LIMITER
+from backend.services.coach_brain import CoachBrain
+
+
+def advice_args(client_local_time="2026-03-10T07:05:00Z", **overrides):
+    args = {
+        "user_profile": {"fullName": "Runner", "vo2MaxRunning": 52.0},
+        "activities_summary": {"week_1": {"running": 30.5}},
+        "health_stats": {"restingHeartRate": 48},
+        "sleep_data": {},
+        "user_settings": {"language": "en", "primary_sport": "running"},
+        "todays_activities": [],
+        "recent_activities": [],
+        "client_local_time": client_local_time,
+    }
+    args.update(overrides)
+    return tuple(args.values())
+
+
+def test_fingerprint_ignores_key_order_and_minutes_but_not_inputs():
+    cache = AdviceCache()
+    base = cache.fingerprint(1, "m", advice_args())
+    reordered = advice_args(user_profile={"vo2MaxRunning": 52.0, "fullName": "Runner", "fitnessAge": None})
+
+    assert cache.fingerprint(1, "m", reordered) == base
+    assert cache.fingerprint(1, "m", advice_args("2026-03-10T07:55:00Z")) == base
+    assert cache.fingerprint(1, "m", advice_args("2026-03-10T08:05:00Z")) != base
+    assert cache.fingerprint(2, "m", advice_args()) != base
+    assert cache.fingerprint(1, "m", advice_args(todays_activities=[{"activityId": 1}])) != base
+
+
+def test_repeat_advice_is_served_from_cache_until_invalidated(db_session):
+    session_factory = lambda: type(db_session)(bind=db_session.get_bind())
+    user = User(email="cache@example.com", garmin_email="garmin@example.com")
+    db_session.add(user)
+    db_session.commit()
+
+    with patch("google.genai.Client"):
+        brain = CoachBrain()
+    response = MagicMock(text='{"advice_text": "Easy run", "workout": null}')
+
+    with patch.object(AdviceCache, "_session", staticmethod(session_factory)), \
+            patch.object(CoachBrain, "_call_gemini_with_retry", return_value=response) as call:
+        first = brain.generate_daily_advice(*advice_args(), user_key=user.id)
+        again = asyncio.run(brain.generate_daily_advice_async(*advice_args(), user_key=user.id))
+        assert first == again and call.call_count == 1
+
+        ADVICE_CACHE.invalidate_account("garmin@example.com")  # A new activity was synced
+        brain.generate_daily_advice(*advice_args(), user_key=user.id)
+        assert call.call_count == 2
+
+        ADVICE_CACHE.invalidate(user.id)  # Settings saved
+        brain.generate_daily_advice(*advice_args(), user_key=user.id)
+        assert call.call_count == 3
+
+
+def test_fallback_advice_is_not_cached(db_session):
+    session_factory = lambda: type(db_session)(bind=db_session.get_bind())
+    user = User(email="fallback@example.com")
+    db_session.add(user)
+    db_session.commit()
+
+    with patch("google.genai.Client"):
+        brain = CoachBrain()
+    with patch.object(AdviceCache, "_session", staticmethod(session_factory)), \
+            patch.object(CoachBrain, "_call_gemini_with_retry", side_effect=RuntimeError("down")) as call:
+        assert brain.generate_daily_advice(*advice_args(), user_key=user.id) == CoachBrain.ADVICE_TASK.fallback
+        brain.generate_daily_advice(*advice_args(), user_key=user.id)
+    assert call.call_count == 2
+
+
+def test_unparseable_and_streamed_fallbacks_are_not_cached(db_session):
+    session_factory = lambda: type(db_session)(bind=db_session.get_bind())
+    user = User(email="garbled@example.com")
+    db_session.add(user)
+    db_session.commit()
+
+    with patch("google.genai.Client"):
+        brain = CoachBrain()
+
+    async def garbled_stream(*args, **kwargs):
+        yield "not json at all"
+
+    with patch.object(AdviceCache, "_session", staticmethod(session_factory)), \
+            patch.object(CoachBrain, "_call_gemini_with_retry", return_value=MagicMock(text="not json")) as call, \
+            patch.object(CoachBrain, "_stream_gemini", garbled_stream), \
+            patch.object(AI_RATE_LIMITER, "acquire", new_callable=AsyncMock), \
+            patch.object(AI_RATE_LIMITER, "acquire_sync"):
+        assert brain.generate_daily_advice(*advice_args(), user_key=user.id) == CoachBrain.JSON_FORMAT_FALLBACK
+        brain.generate_daily_advice(*advice_args(), user_key=user.id)
+        assert call.call_count == 2
+
+        async def stream():
+            return [event async for event in brain.stream_daily_advice(*advice_args(), user_key=user.id)]
+        assert asyncio.run(stream())[-1] == ("done", CoachBrain.JSON_FORMAT_FALLBACK)
+        fingerprint = ADVICE_CACHE.fingerprint(user.id, brain.model_name, advice_args())
+        assert ADVICE_CACHE.get(fingerprint) is None
@@ -0,0 +1,74 @@
+import asyncio
+import threading
+import time
+import pytest
+
+from backend.services.ai_rate_limiter import (
+    AIRateLimiter,
+    AIRateLimitExceeded,
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_PREMIUM,
+    request_priority,
+)
+
+
+def test_request_priority():
+    assert request_priority(premium=True) == PRIORITY_PREMIUM
+    assert request_priority() == PRIORITY_INTERACTIVE
+    assert request_priority(premium=True, interactive=False) == PRIORITY_BACKGROUND
+
+
+def test_burst_is_immediate_then_heavy_user_waits_alone():
+    limiter = AIRateLimiter(global_rate=100, global_burst=100, user_rate=0.01, user_burst=2, max_wait=0.1)
+
+    async def go():
+        await limiter.acquire("heavy")
+        await limiter.acquire("heavy")
+        heavy = asyncio.create_task(limiter.acquire("heavy"))
+        await asyncio.sleep(0)
+        started = time.monotonic()
+        await limiter.acquire("light")  # Not held up by the heavy user's queued request
+        light_wait = time.monotonic() - started
+        with pytest.raises(AIRateLimitExceeded):
+            await heavy
+        return light_wait
+
+    assert asyncio.run(go()) < 0.05
+    stats = limiter.stats()
+    assert stats["immediate"] == 2 and stats["rejected"] == 1
+
+
+def test_queued_requests_are_served_by_priority():
+    limiter = AIRateLimiter(global_rate=20, global_burst=1, user_rate=100, user_burst=100, max_wait=2)
+    order = []
+
+    async def request(name, priority):
+        await limiter.acquire(name, priority)
+        order.append(name)
+
+    async def go():
+        await limiter.acquire("first")  # Drains the global bucket
+        tasks = [asyncio.create_task(request("background", PRIORITY_BACKGROUND))]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(request("interactive", PRIORITY_INTERACTIVE)))
+        tasks.append(asyncio.create_task(request("premium", PRIORITY_PREMIUM)))
+        await asyncio.gather(*tasks)
+
+    asyncio.run(go())
+    assert order == ["premium", "interactive", "background"]
+    waits = limiter.stats()["wait_seconds"]
+    assert waits["background"]["max"] >= waits["premium"]["max"] > 0
+
+
+def test_sync_waiters_do_not_block_other_users():
+    limiter = AIRateLimiter(global_rate=100, global_burst=100, user_rate=5, user_burst=1, max_wait=2)
+    limiter.acquire_sync("a")
+    done = []
+    worker = threading.Thread(target=lambda: (limiter.acquire_sync("a"), done.append("a")))
+    worker.start()
+    time.sleep(0.02)
+    limiter.acquire_sync("b")  # Returns at once while "a" is still waiting for its own bucket
+    done.append("b")
+    worker.join(2)
+    assert done == ["b", "a"]
@@ -1,5 +1,6 @@
 import pytest
-from unittest.mock import patch, MagicMock
+import asyncio
+from unittest.mock import patch, MagicMock, AsyncMock
 import json
 
 from backend.services.coach_brain import CoachBrain
@@ -11,6 +12,7 @@ def mock_brain():
         # We can also mock genai.Client inside __init__ to prevent actual initialization issues
         with patch("google.genai.Client"):
             brain = CoachBrain()
+            brain.prompt_cache.backend = None  # Prompts go inline; prefix caching is covered in test_prompt_cache
             return brain
 
 def test_coach_brain_initialization_no_key():
@@ -98,5 +100,88 @@ def test_generate_structured_plan(mock_call, mock_brain):
     prompt_sent = mock_call.call_args[0][0]
     assert "John Doe" in prompt_sent
     assert "50 ml/kg/min" in prompt_sent
-    # Turkish check: language TR requested
-    assert "TURKISH" in prompt_sent.upper()
+    # Turkish check: language TR requested, in the static plan instructions
+    system = mock_call.call_args[1]["generation_config"]["system_instruction"]
+    assert "TURKISH" in system.upper()
+    assert "John Doe" not in system
+
+@patch.object(CoachBrain, '_call_gemini_with_retry')
+def test_analysis_instructions_are_shared_across_workouts(mock_call, mock_brain):
+    mock_call.return_value = MagicMock(text="📊 PERFORMANCE SUMMARY ...")
+    for name in ("Tempo run", "Long run"):
+        mock_brain.analyze_activity({"activityName": name, "distance": 10000}, {"primary_sport": "Running", "language": "en"})
+
+    first, second = mock_call.call_args_list
+    assert first[1]["generation_config"]["system_instruction"] == second[1]["generation_config"]["system_instruction"]
+    assert "Tempo run" in first[0][0] and "Long run" in second[0][0]
+    assert mock_brain.prompt_cache.stats()["static_hits"] >= 1
+
+@patch.object(CoachBrain, '_call_gemini_with_retry_async', new_callable=AsyncMock)
+def test_async_variants_await_gemini(mock_call, mock_brain):
+    mock_response = MagicMock()
+    mock_response.text = '```json\n{"title": "Async Plan"}\n```'
+    mock_call.return_value = mock_response
+
+    result_str = asyncio.run(mock_brain.generate_structured_plan_async(
+        duration_str="1 Week",
+        user_profile={"fullName": "Jane Doe"},
+        activities_summary="",
+        health_stats={},
+    ))
+
+    assert json.loads(result_str) == {"title": "Async Plan"}
+    assert "Jane Doe" in mock_call.call_args[0][0]
+    assert mock_call.call_args[1]["generation_config"]["response_mime_type"] == "application/json"
+
+@patch.object(CoachBrain, '_call_gemini_with_retry_async', new_callable=AsyncMock)
+def test_async_variant_falls_back_on_error(mock_call, mock_brain):
+    mock_call.side_effect = RuntimeError("Gemini down")
+    reply = asyncio.run(mock_brain.generate_chat_response_async([{"role": "user", "content": "Hi"}]))
+    assert reply == CoachBrain.CHAT_TASK.fallback
+
+def _fake_stream(*chunks, error=None):
+    async def stream(self, prompt, generation_config=None):
+        for chunk in chunks:
+            yield chunk
+        if error:
+            raise error
+    return stream
+
+def _collect(agen):
+    async def go():
+        return [event async for event in agen]
+    return asyncio.run(go())
+
+def test_json_string_field_decodes_across_chunk_boundaries():
+    from backend.services.coach_brain import _JsonStringField
+    field = _JsonStringField("advice_text")
+    raw = json.dumps({"advice_text": 'Line 1\n"Zone 2" 🏃 done', "workout": None})
+    decoded = "".join(field.feed(char) for char in raw)  # Worst case: one character per chunk
+    assert decoded == 'Line 1\n"Zone 2" 🏃 done'
+    assert field.done
+
+def test_stream_daily_advice_forwards_text_then_full_json(mock_brain):
+    chunks = ('{"advice_text": "Easy ', 'run today.", "wor', 'kout": {"workoutName": "Z2"}}')
+    with patch.object(CoachBrain, "_stream_gemini", _fake_stream(*chunks)):
+        events = _collect(mock_brain.stream_daily_advice({}, {}, {}, {}, {"language": "en"}))
+
+    assert [data for event, data in events if event == "delta"] == ["Easy ", "run today."]
+    assert events[-1][0] == "done"
+    assert json.loads(events[-1][1]) == {"advice_text": "Easy run today.", "workout": {"workoutName": "Z2"}}
+
+def test_stream_chat_ends_with_error_event_on_failure(mock_brain):
+    with patch.object(CoachBrain, "_stream_gemini", _fake_stream("Hel", error=RuntimeError("reset"))):
+        events = _collect(mock_brain.stream_chat_response([{"role": "user", "content": "Hi"}]))
+    assert events == [("delta", "Hel"), ("error", CoachBrain.CHAT_TASK.fallback)]
+
+def test_chat_stream_endpoint_sends_sse_frames(client, test_user_token):
+    payload = {"messages": [{"role": "user", "content": "Hi"}]}
+    assert client.post("/api/chat/stream", json=payload).status_code == 401
+    with patch.object(CoachBrain, "_stream_gemini", _fake_stream("Hi ", "there")):
+        response = client.post("/api/chat/stream", json=payload, headers={"Authorization": f"Bearer {test_user_token}"})
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text == (
+        'event: delta\ndata: {"text": "Hi "}\n\n'
+        'event: delta\ndata: {"text": "there"}\n\n'
+        'event: done\ndata: {"response": "Hi there"}\n\n'
+    )
@@ -0,0 +1,74 @@
+import asyncio
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from backend.models import User
+from backend.services.daily_metrics import DailyMetricsPrewarmer
+
+
+def make_user(db_session):
+    user = User(email="early@example.com", garmin_email="early.runner@example.com")
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+def test_first_access_per_day_is_learned(db_session):
+    user = make_user(db_session)
+    prewarmer = DailyMetricsPrewarmer(min_samples=3)
+    for day, hour in ((1, 7), (2, 6), (3, 7)):
+        prewarmer.record_access(db_session, user.id, now=datetime(2026, 3, day, hour, 30))
+        # Later opens the same day don't move the first-access time
+        prewarmer.record_access(db_session, user.id, now=datetime(2026, 3, day, 21, 0))
+
+    from backend.models import UserSetting
+    history = db_session.query(UserSetting).filter(UserSetting.key == "daily_metrics_access").one().value
+    assert history == {"2026-03-01": 450, "2026-03-02": 390, "2026-03-03": 450}
+    assert prewarmer.typical_first_access(history) == 450
+    assert prewarmer.typical_first_access({"2026-03-01": 450}) is None
+
+    from backend.models import DailyMetricsSchedule
+    schedule = db_session.query(DailyMetricsSchedule).filter(DailyMetricsSchedule.user_id == user.id).one()
+    assert (schedule.typical_minute, schedule.last_access_day) == (450, "2026-03-03")
+
+
+def test_users_are_scheduled_shortly_before_their_usual_time(db_session):
+    user = make_user(db_session)
+    prewarmer = DailyMetricsPrewarmer(lead_minutes=10, jitter_minutes=5, interval=60, min_samples=3)
+    for day in (1, 2, 3):
+        prewarmer.record_access(db_session, user.id, now=datetime(2026, 3, day, 7, 30))
+
+    session_factory = lambda: type(db_session)(bind=db_session.get_bind())
+    with patch.object(DailyMetricsPrewarmer, "_session", staticmethod(session_factory)):
+        assert prewarmer._due_users(datetime(2026, 3, 4, 6, 0)) == []
+        due = prewarmer._due_users(datetime(2026, 3, 4, 7, 19, 30))
+        # Already opened today: nothing to warm
+        assert prewarmer._due_users(datetime(2026, 3, 3, 7, 19, 30)) == []
+
+    assert len(due) == 1
+    user_id, garmin_email, warm_at = due[0]
+    assert (user_id, garmin_email) == (user.id, "early.runner@example.com")
+    assert datetime(2026, 3, 4, 7, 20) <= warm_at <= datetime(2026, 3, 4, 7, 25)
+
+
+def test_only_one_worker_claims_a_warm_up(db_session):
+    user = make_user(db_session)
+    workers = [DailyMetricsPrewarmer(min_samples=3) for _ in range(2)]
+    for day in (1, 2, 3):
+        workers[0].record_access(db_session, user.id, now=datetime(2026, 3, day, 7, 30))
+
+    session_factory = lambda: type(db_session)(bind=db_session.get_bind())
+    now = datetime(2026, 3, 4, 7, 19, 30)
+    with patch.object(DailyMetricsPrewarmer, "_session", staticmethod(session_factory)):
+        assert len(workers[0]._due_users(now)) == 1
+        assert workers[1]._due_users(now) == []
+        assert workers[0]._due_users(now) == []
+
+
+def test_warm_skipped_without_rate_headroom():
+    prewarmer = DailyMetricsPrewarmer(calls_per_warm=8)
+    with patch("backend.services.daily_metrics.RATE_GOVERNOR.headroom", return_value=2), \
+            patch("backend.services.daily_metrics.GarminClient") as garmin_client:
+        assert asyncio.run(prewarmer.warm(1, "busy@example.com")) is False
+    garmin_client.assert_not_called()
+    assert prewarmer.stats()["skipped"] == 1
@@ -0,0 +1,75 @@
+import asyncio
+import time
+import pytest
+from unittest.mock import patch
+from garminconnect import GarminConnectTooManyRequestsError
+
+from backend.services.endpoint_health import EndpointHealthRegistry
+
+
+def make_registry(**kwargs):
+    registry = EndpointHealthRegistry(flush_interval=3600, **kwargs)
+    registry._loaded = True  # Start empty, no DB
+    return registry
+
+
+def fail():
+    raise Exception("404 Not Found")
+
+
+def test_working_variant_moves_ahead_of_failing_ones():
+    registry = make_registry()
+    assert registry.order("schedule_workout", ["v2", "v3", "legacy"]) == ["v2", "v3", "legacy"]
+
+    with pytest.raises(Exception):
+        registry.call("schedule_workout", "v2", fail)
+    registry.call("schedule_workout", "v3", lambda: {"ok": True})
+
+    assert registry.order("schedule_workout", ["v2", "v3", "legacy"]) == ["v3", "legacy", "v2"]
+
+
+def test_dead_variant_is_skipped_until_probe_recovers_it():
+    registry = make_registry(dead_after=2, probe_interval=60)
+    for _ in range(2):
+        with pytest.raises(Exception):
+            registry.call("schedule_workout", "v2", fail)
+    assert registry.order("schedule_workout", ["v2", "v3"]) == ["v3"]
+
+    with patch("backend.services.endpoint_health.time.time", return_value=time.time() + 61):
+        # Probe due: the dead variant goes first for exactly one caller
+        assert registry.order("schedule_workout", ["v2", "v3"]) == ["v2", "v3"]
+        assert registry.order("schedule_workout", ["v2", "v3"]) == ["v3"]
+        registry.call("schedule_workout", "v2", lambda: True)
+        assert "v2" in registry.order("schedule_workout", ["v2", "v3"])
+
+
+def test_all_dead_tries_everything_and_rate_limits_are_not_failures():
+    registry = make_registry(dead_after=1)
+    for variant in ("v2", "v3"):
+        with pytest.raises(Exception):
+            registry.call("schedule_workout", variant, fail)
+    assert registry.order("schedule_workout", ["v2", "v3"]) == ["v2", "v3"]
+
+    async def throttled():
+        raise GarminConnectTooManyRequestsError("Too Many Requests")
+
+    with pytest.raises(GarminConnectTooManyRequestsError):
+        asyncio.run(registry.track("vo2_max", "training_status", throttled()))
+    assert registry.usable("vo2_max", "training_status")
+    assert registry.stats()["vo2_max/training_status"]["attempts"] == 0
+
+
+def test_health_survives_restart(db_session):
+    session_factory = lambda: type(db_session)(bind=db_session.get_bind())
+    with patch.object(EndpointHealthRegistry, "_session", staticmethod(session_factory)):
+        registry = make_registry(dead_after=1)
+        with pytest.raises(Exception):
+            registry.call("schedule_workout", "v2", fail)
+        registry.call("schedule_workout", "v3", lambda: True)
+        registry.flush()
+
+        restarted = EndpointHealthRegistry()
+        restarted.load()
+
+    assert restarted.order("schedule_workout", ["v2", "v3"]) == ["v3"]
+    assert restarted.stats()["schedule_workout/v3"]["success_rate"] == 1.0
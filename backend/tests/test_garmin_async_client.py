@@ -0,0 +1,339 @@
+import time
+import asyncio
+import pytest
+import httpx
+from unittest.mock import MagicMock, patch
+from garth.auth_tokens import OAuth2Token
+from garminconnect import GarminConnectTooManyRequestsError
+
+from backend.services.garmin_client import GarminClient
+from backend.services.garmin_async_client import AsyncGarminClient, _LAST_POPULATED
+from backend.services.garmin_cache import GARMIN_CACHE, TTL_POLICIES, FOREVER
+
+
+def make_client(handler):
+    """AsyncGarminClient over a fake authenticated Garmin object and a mocked HTTP transport."""
+    garmin = MagicMock()
+    garmin.display_name = "runner_42"
+    garmin.garth.domain = "garmin.com"
+    garmin.garth.oauth2_token = OAuth2Token(
+        scope="s", jti="j", token_type="bearer", access_token="tok",
+        refresh_token="r", expires_in=3600, expires_at=int(time.time()) + 3600,
+        refresh_token_expires_in=7200, refresh_token_expires_at=int(time.time()) + 7200,
+    )
+    garmin.garmin_connect_activities = "/activitylist-service/activities/search/activities"
+    garmin.garmin_connect_daily_sleep_url = "/wellness-service/wellness/dailySleepData"
+
+    sync_client = GarminClient("runner@example.com", "pw", user_id=1)
+    sync_client.client = garmin
+    http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    GARMIN_CACHE.invalidate("runner@example.com")
+    _LAST_POPULATED.clear()
+    return AsyncGarminClient(sync_client), http
+
+
+def test_get_activities_uses_garth_token():
+    seen = {}
+
+    def handler(request):
+        seen["auth"] = request.headers["Authorization"]
+        seen["url"] = str(request.url)
+        return httpx.Response(200, json=[{"activityId": 1}])
+
+    client, http = make_client(handler)
+    with patch("backend.services.garmin_async_client._get_http_client", return_value=http):
+        activities = asyncio.run(client.get_activities(5))
+
+    assert activities == [{"activityId": 1}]
+    assert seen["auth"] == "Bearer tok"
+    assert seen["url"].startswith("https://connectapi.garmin.com/activitylist-service/activities/search/activities")
+    assert "limit=5" in seen["url"]
+
+
+def test_connectapi_maps_rate_limit():
+    client, http = make_client(lambda request: httpx.Response(429))
+    with patch("backend.services.garmin_async_client._get_http_client", return_value=http):
+        with pytest.raises(GarminConnectTooManyRequestsError):
+            asyncio.run(client.connectapi("/userprofile-service/socialProfile"))
+
+
+def test_sleep_lookback_returns_first_populated_day():
+    def handler(request):
+        if request.url.params["date"] == "2026-03-01":
+            return httpx.Response(200, json={"dailySleepDTO": {"sleepScore": 80}})
+        return httpx.Response(200, json={"dailySleepDTO": None})
+
+    client, http = make_client(handler)
+    with patch("backend.services.garmin_async_client._get_http_client", return_value=http):
+        sleep = asyncio.run(client.get_sleep_data("2026-03-03"))
+
+    assert sleep["dailySleepDTO"]["sleepScore"] == 80
+
+
+def test_sleep_lookback_skips_days_before_last_populated():
+    probed = []
+
+    def handler(request):
+        probed.append(request.url.params["date"])
+        if request.url.params["date"] == "2026-03-02":
+            return httpx.Response(200, json={"dailySleepDTO": {"sleepScore": 75}})
+        return httpx.Response(200, json={"dailySleepDTO": None})
+
+    client, http = make_client(handler)
+    with patch("backend.services.garmin_async_client._get_http_client", return_value=http):
+        asyncio.run(client.get_sleep_data("2026-03-02"))
+        probed.clear()
+        sleep = asyncio.run(client.get_sleep_data("2026-03-04"))
+
+    assert sleep["dailySleepDTO"]["sleepScore"] == 75
+    # 03-02 is cached from the first call; 03-01 is older than the last populated day
+    assert sorted(probed) == ["2026-03-03", "2026-03-04"]
+
+
+def test_concurrent_identical_fetches_are_coalesced():
+    calls = []
+
+    async def handler(request):
+        calls.append(str(request.url))
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json=[{"activityId": 1}])
+
+    client, http = make_client(handler)
+
+    async def dashboard_burst():
+        return await asyncio.gather(*(client.get_activities(5) for _ in range(4)))
+
+    with patch("backend.services.garmin_async_client._get_http_client", return_value=http):
+        results = asyncio.run(dashboard_burst())
+
+    assert len(calls) == 1
+    assert all(r == [{"activityId": 1}] for r in results)
+    results[1][0]["activityId"] = 2
+    assert results[0][0]["activityId"] == 1
+
+
+def test_repeat_reads_are_served_from_cache():
+    calls = []
+
+    def handler(request):
+        calls.append(str(request.url))
+        return httpx.Response(200, json=[{"deviceId": 7}])
+
+    client, http = make_client(handler)
+
+    async def two_reads():
+        first = await client.get_devices()
+        second = await client.get_devices()
+        await client.invalidate_cache("get_devices")
+        third = await client.get_devices()
+        return first, second, third
+
+    with patch("backend.services.garmin_async_client._get_http_client", return_value=http):
+        first, second, third = asyncio.run(two_reads())
+
+    assert first == second == third == [{"deviceId": 7}]
+    assert len(calls) == 2
+
+
+def test_past_days_are_cached_forever():
+    assert TTL_POLICIES["get_sleep_data"](("2020-01-01",), {}) is FOREVER
+    assert TTL_POLICIES["get_sleep_data"]((), {}) == 15 * 60
+
+
+def test_vo2_max_resolved_concurrently_then_served_from_storage(db_session):
+    from backend.services.vo2_store import Vo2MaxStore
+    requests = []
+
+    def handler(request):
+        requests.append(request.url.path)
+        if "trainingstatus" in request.url.path:
+            return httpx.Response(200, json={"mostRecentVO2Max": {"generic": {"vo2MaxValue": 52, "fitnessAge": 30}}})
+        return httpx.Response(200, json={})
+
+    client, http = make_client(handler)
+    client.client.garmin_connect_training_status_url = "/metrics-service/metrics/trainingstatus/aggregated"
+    client.client.garmin_connect_metrics_url = "/metrics-service/metrics/maxmet/daily"
+    client.client.garmin_connect_user_settings_url = "/userprofile-service/userprofile/user-settings"
+    client.client.garmin_connect_fitnessage = "/fitnessage-service/fitnessage"
+    client.client.garmin_connect_daily_summary_url = "/usersummary-service/usersummary/daily"
+    client.client.garmin_connect_weight_url = "/weight-service"
+
+    session_factory = lambda: type(db_session)(bind=db_session.get_bind())
+    with patch("backend.services.garmin_async_client._get_http_client", return_value=http), \
+            patch.object(Vo2MaxStore, "_session", staticmethod(session_factory)):
+        first = asyncio.run(client.get_vo2_max())
+        requests.clear()
+        second = asyncio.run(client.get_vo2_max())
+        stored = Vo2MaxStore().load("runner@example.com")
+
+    assert first == second == {"vo2MaxValue": 52, "vo2Max": 52, "fitnessAge": 30}
+    assert requests == []
+    assert stored["vo2_source"] == "training_status"
+    assert stored["fitness_age_source"] == "training_status"
+
+
+def test_sleep_scores_fetched_as_range_and_cached_per_day():
+    from datetime import date
+    paths = []
+
+    def handler(request):
+        paths.append(request.url.path)
+        return httpx.Response(200, json=[{"calendarDate": "2026-01-02", "value": 81}])
+
+    client, http = make_client(handler)
+    with patch("backend.services.garmin_async_client._get_http_client", return_value=http):
+        first = asyncio.run(client.get_sleep_scores(date(2026, 1, 1), date(2026, 1, 30)))
+        second = asyncio.run(client.get_sleep_scores(date(2026, 1, 1), date(2026, 1, 30)))
+
+    assert first == second
+    assert first["2026-01-02"] == 81 and first["2026-01-01"] is None and len(first) == 30
+    # 30 days = two 28-day pages, then everything is served from the cache
+    assert sorted(paths) == [
+        "/wellness-service/stats/daily/sleep/score/2026-01-01/2026-01-28",
+        "/wellness-service/stats/daily/sleep/score/2026-01-29/2026-01-30",
+    ]
+
+
+def daily_summary_handler(paths, per_day=lambda day: {"restingHeartRate": 50, "maxHeartRate": 170}):
+    from datetime import date, timedelta
+
+    def span(a, b):
+        first, last = date.fromisoformat(a), date.fromisoformat(b)
+        return [(first + timedelta(days=i)).isoformat() for i in range((last - first).days + 1) if
+                (first + timedelta(days=i)).isoformat() != "2026-01-15"]  # Watch not worn that day
+
+    def handler(request):
+        path, params = request.url.path, request.url.params
+        paths.append(path)
+        if path.startswith("/userstats-service/wellness/daily/"):
+            return httpx.Response(200, json={"allMetrics": {"metricsMap": {"WELLNESS_RESTING_HEART_RATE": [
+                {"calendarDate": d, "value": 48} for d in span(params["fromDate"], params["untilDate"])]}}})
+        if path.startswith("/usersummary-service/stats/stress/daily/"):
+            a, b = path.split("/")[-2:]
+            return httpx.Response(200, json=[{"calendarDate": d, "values": {"overallStressLevel": 30}} for d in span(a, b)]
+                                  + [{"calendarDate": "2026-01-15", "values": {"overallStressLevel": None}}])
+        if path == "/wellness-service/wellness/bodyBattery/reports/daily":
+            return httpx.Response(200, json=[{"date": d, "bodyBatteryValuesArray": [[1, 40], [2, 85]]}
+                                             for d in span(params["startDate"], params["endDate"])])
+        if path.startswith("/sleep-service/stats/sleep/daily/"):
+            a, b = path.split("/")[-2:]
+            return httpx.Response(200, json={"individualStats": [
+                {"calendarDate": d, "values": {"totalSleepTimeInSeconds": 27000}} for d in span(a, b)]})
+        summary = per_day(params.get("calendarDate"))  # Per-day summary
+        return httpx.Response(200, json=summary) if summary is not None else httpx.Response(500)
+
+    return handler
+
+
+def test_daily_summaries_use_range_endpoints_and_per_day_for_max_hr():
+    from datetime import date
+    paths = []
+    client, http = make_client(daily_summary_handler(paths))
+    client.client.garmin_connect_daily_summary_url = "/usersummary-service/usersummary/daily"
+    with patch("backend.services.garmin_async_client._get_http_client", return_value=http):
+        first = asyncio.run(client.get_daily_summaries(date(2026, 1, 1), date(2026, 1, 30)))
+        calls = len(paths)
+        second = asyncio.run(client.get_daily_summaries(date(2026, 1, 1), date(2026, 1, 30)))
+
+    assert first == second and len(first) == 30
+    assert first["2026-01-02"] == {"restingHeartRate": 48, "maxHeartRate": 170, "averageStressLevel": 30,
+                                   "bodyBatteryHighestValue": 85, "sleepingSeconds": 27000}
+    assert first["2026-01-15"] == {"restingHeartRate": 50, "maxHeartRate": 170}
+    # Four range endpoints x two 28-day pages, plus a per-day call for max HR (no range source)
+    assert calls == 8 + 30 and paths.count("/usersummary-service/usersummary/daily/runner_42") == 30
+    assert len(paths) == calls  # Second load served from the cache
+
+
+def test_daily_summaries_without_per_day_data_are_not_cached_forever():
+    from datetime import date
+    from backend.services.garmin_async_client import PARTIAL_SUMMARY_TTL
+    paths = []
+    client, http = make_client(daily_summary_handler(paths, per_day=lambda day: None))
+    client.client.garmin_connect_daily_summary_url = "/usersummary-service/usersummary/daily"
+    with patch("backend.services.garmin_async_client._get_http_client", return_value=http), \
+            patch.object(GARMIN_CACHE, "_l2_set_many") as l2_set:
+        summaries = asyncio.run(client.get_daily_summaries(date(2026, 1, 14), date(2026, 1, 15)))
+
+    assert summaries["2026-01-14"]["restingHeartRate"] == 48 and "maxHeartRate" not in summaries["2026-01-14"]
+    assert summaries["2026-01-15"] is None
+    stored = [entry for call in l2_set.call_args_list for entry in call.args[2]]
+    assert [ttl for _, _, ttl in stored] == [PARTIAL_SUMMARY_TTL]  # Partial day briefly, empty day never
+
+
+def test_activity_details_components_are_stored_and_fetched_once(db_session):
+    from backend.services.activity_details_store import ActivityDetailsStore
+    paths = []
+
+    def handler(request):
+        paths.append(request.url.path)
+        if request.url.path.endswith("/details"):
+            return httpx.Response(200, json={"metricDescriptors": [], "activityDetailMetrics": [{"metrics": [1.0]}]})
+        if request.url.path.endswith("/splits"):
+            return httpx.Response(200, json={"lapDTOs": [{"distance": 1000.0}]})
+        return httpx.Response(200, json={"activityId": 7, "activityName": "Easy run", "summaryDTO": {"duration": 1800.0}})
+
+    client, http = make_client(handler)
+    client.client.garmin_connect_activity = "/activity-service/activity"
+
+    session_factory = lambda: type(db_session)(bind=db_session.get_bind())
+    with patch("backend.services.garmin_async_client._get_http_client", return_value=http), \
+            patch.object(ActivityDetailsStore, "_session", staticmethod(session_factory)):
+        summary_only = asyncio.run(client.get_activity_details(7, components=("summary",)))
+        assert paths == ["/activity-service/activity/7"]
+
+        paths.clear()
+        full = asyncio.run(client.get_activity_details(7))
+        assert sorted(paths) == ["/activity-service/activity/7/details", "/activity-service/activity/7/splits"]
+
+        paths.clear()
+        again = asyncio.run(client.get_activity_details(7))
+
+    assert paths == []
+    assert summary_only == {"activityId": 7, "activityName": "Easy run", "summaryDTO": {"duration": 1800.0}}
+    assert again == full
+    assert full["splits"] == {"lapDTOs": [{"distance": 1000.0}]}
+    assert full["high_res"]["activityDetailMetrics"] == [{"metrics": [1.0]}]
+
+
+def test_details_of_unfinished_activities_expire(db_session):
+    from backend.models import GarminActivityDetail
+    from backend.services.activity_details_store import ActivityDetailsStore
+
+    def handler(request):
+        if request.url.path.endswith("/splits"):
+            return httpx.Response(200, json={"lapDTOs": []})
+        # Just uploaded: Garmin has not computed the summary yet
+        return httpx.Response(200, json={"activityId": 8, "summaryDTO": {"duration": None}})
+
+    client, http = make_client(handler)
+    client.client.garmin_connect_activity = "/activity-service/activity"
+
+    session_factory = lambda: type(db_session)(bind=db_session.get_bind())
+    with patch("backend.services.garmin_async_client._get_http_client", return_value=http), \
+            patch.object(ActivityDetailsStore, "_session", staticmethod(session_factory)):
+        asyncio.run(client.get_activity_details(8, components=("summary", "splits")))
+
+    rows = db_session.query(GarminActivityDetail).filter_by(activity_id=8).all()
+    assert sorted(row.component for row in rows) == ["splits", "summary"]
+    assert all(row.expires_at is not None for row in rows)
+
+
+def test_stale_vo2_max_refresh_is_claimed_once_per_day(db_session):
+    from datetime import datetime, timedelta
+    from backend.models import GarminVo2Max
+    from backend.services.vo2_store import Vo2MaxStore
+
+    session_factory = lambda: type(db_session)(bind=db_session.get_bind())
+    with patch.object(Vo2MaxStore, "_session", staticmethod(session_factory)):
+        store = Vo2MaxStore()
+        store.save("runner@example.com", {"vo2MaxValue": 50})
+        db = session_factory()
+        row = db.query(GarminVo2Max).filter_by(garmin_email="runner@example.com").one()
+        row.resolved_at = row.refresh_attempted_at = datetime.utcnow() - timedelta(days=1)
+        db.commit()
+        db.close()
+
+        assert not store.is_fresh(store.load("runner@example.com"))
+        assert store.claim_refresh("runner@example.com") is True
+        assert store.claim_refresh("runner@example.com") is False
+        assert store.claim_refresh("unknown@example.com") is False
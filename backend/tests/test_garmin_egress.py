@@ -0,0 +1,88 @@
+import asyncio
+import httpx
+from unittest.mock import patch
+
+from backend.services.garmin_egress import GarminEgress, proxy_label
+
+PROXIES = ["http://user:pw@p1.example:8080", "http://user:pw@p2.example:8080"]
+
+
+def test_direct_without_proxies():
+    egress = GarminEgress()
+    assert egress.pick("a@x.com") is None
+    egress.record(None, False)  # No-op
+    assert egress.stats() == {}
+
+
+def test_accounts_stick_to_a_proxy_and_spread_across_the_pool():
+    egress = GarminEgress(PROXIES)
+    first, second = egress.pick("a@x.com"), egress.pick("b@x.com")
+    assert {first, second} == set(PROXIES)
+    assert egress.pick("a@x.com") == first
+    assert proxy_label(first) in egress.stats()
+    assert "pw" not in str(egress.stats())
+
+
+def test_failing_proxy_is_rotated_out_and_recovers():
+    egress = GarminEgress(PROXIES, fail_after=2, cooldown=60)
+    bad = egress.pick("a@x.com")
+    for _ in range(2):
+        egress.record(bad, False, error="timed out")
+
+    assert egress.pick("a@x.com") != bad
+    stats = egress.stats()[proxy_label(bad)]
+    assert stats["healthy"] is False and stats["error_rate"] == 1.0 and stats["down_for"] > 0
+
+    egress.record(bad, True, latency=0.1, status=200)  # e.g. a health probe got through
+    assert egress.stats()[proxy_label(bad)]["healthy"] is True
+
+
+def test_rate_limited_proxy_rests_for_retry_after():
+    egress = GarminEgress(PROXIES)
+    limited = egress.pick("a@x.com")
+    egress.record(limited, True, latency=0.2, status=429, retry_after=120)
+
+    assert egress.pick("a@x.com") != limited
+    assert egress.pick("b@x.com") != limited
+    assert egress.stats()[proxy_label(limited)]["limited_for"] > 100
+
+
+def test_avoid_moves_off_a_failed_proxy_only_if_another_is_healthy():
+    egress = GarminEgress(PROXIES[:1])
+    only = egress.pick("a@x.com")
+    assert egress.pick("a@x.com", avoid=only) == only
+
+    egress = GarminEgress(PROXIES)
+    current = egress.pick("a@x.com")
+    assert egress.pick("a@x.com", avoid=current) != current
+
+
+def test_health_check_probes_each_proxy():
+    egress = GarminEgress(PROXIES)
+
+    def refuse(request):
+        raise httpx.ConnectError("refused")
+
+    async def go():
+        clients = {
+            PROXIES[0]: httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200))),
+            PROXIES[1]: httpx.AsyncClient(transport=httpx.MockTransport(refuse)),
+        }
+        with patch.object(egress, "http_client", side_effect=clients.get):
+            return await egress.check()
+
+    result = asyncio.run(go())
+    assert result == {proxy_label(PROXIES[0]): True, proxy_label(PROXIES[1]): False}
+    assert egress.stats()[proxy_label(PROXIES[1])]["last_error"] == "refused"
+
+
+def test_shared_adapter_leaves_429_to_the_governor():
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    template = HTTPAdapter(max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=(408, 429, 500, 503)))
+    retries = GarminEgress().adapter(template).max_retries
+    assert retries.total == 3
+    assert 429 not in retries.status_forcelist
+    assert 503 in retries.status_forcelist
+    assert retries.respect_retry_after_header is False
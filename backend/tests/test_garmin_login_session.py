@@ -0,0 +1,74 @@
+import asyncio
+import threading
+from unittest.mock import MagicMock, patch
+
+from backend.services.garmin_client import GarminClient, LoginSession, SESSION_REGISTRY
+
+
+def test_async_waiters_share_one_future_and_wake_on_transition():
+    session = LoginSession()
+    session.transition("RUNNING")
+
+    async def go():
+        waiters = [asyncio.create_task(session.wait(LoginSession.SETTLED, timeout=5)) for _ in range(5)]
+        await asyncio.sleep(0)
+        assert len(session._futures) == 1  # One future for every waiter on this loop
+        threading.Timer(0.05, session.transition, args=("MFA_WAITING",)).start()
+        return await asyncio.gather(*waiters)
+
+    assert asyncio.run(go()) == ["MFA_WAITING"] * 5
+
+
+def test_wait_returns_current_status_at_deadline():
+    session = LoginSession()
+    session.transition("RUNNING")
+
+    assert asyncio.run(session.wait(LoginSession.SETTLED, timeout=0.05)) == "RUNNING"
+    assert session.wait_for(LoginSession.SETTLED, timeout=0.05) == "RUNNING"
+    assert not session.transition("VERIFYING", expected="MFA_WAITING")
+
+
+def test_mfa_login_runs_once_and_keeps_password():
+    email = "mfa@example.com"
+    started = []
+
+    class FakeGarmin:
+        def __init__(self, email, password, return_on_mfa=False):
+            started.append(password)
+            self.garth = MagicMock()
+            self.display_name = None
+
+        def login(self):
+            return "needs_mfa", {"signin_params": {}}
+
+        def resume_login(self, client_state, mfa_code):
+            assert mfa_code == "123456"
+            self.display_name = "runner"
+            return "oauth1", "oauth2"
+
+    async def go():
+        attempts = [GarminClient(email, "secret", user_id=1).login_async() for _ in range(3)]
+        first = await asyncio.gather(*attempts)
+        verifier = GarminClient(email, user_id=1)
+        second = await verifier.login_async(mfa_code="123456")
+        return first, second, verifier
+
+    with patch("backend.services.garmin_client.Garmin", FakeGarmin), \
+            patch.object(GarminClient, "_resume_session", return_value=None), \
+            patch.object(GarminClient, "_publish_token_refreshes"):
+        first, second, verifier = asyncio.run(go())
+
+    try:
+        assert started == ["secret"]  # Concurrent attempts attached to one SSO login
+        assert [status for _, status, _ in first] == ["MFA_REQUIRED"] * 3
+        assert second[:2] == (True, "SUCCESS")
+        assert verifier.password == "secret"
+        assert verifier.client.display_name == "runner"
+        assert SESSION_REGISTRY.get_pending(email) is None
+    finally:
+        SESSION_REGISTRY.drop_client(email)
+
+
+def test_mfa_code_without_pending_login_fails():
+    result = asyncio.run(GarminClient("nobody@example.com", user_id=1).login_async(mfa_code="000000"))
+    assert result[:2] == (False, "FAILED")
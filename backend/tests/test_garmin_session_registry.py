@@ -0,0 +1,58 @@
+import time
+from unittest.mock import MagicMock
+
+from backend.services.garmin_session_registry import GarminSessionRegistry
+
+
+def test_lock_is_shared_per_email():
+    registry = GarminSessionRegistry()
+    assert registry.get_lock("a@x.com") is registry.get_lock("a@x.com")
+    assert registry.get_lock("a@x.com") is not registry.get_lock("b@x.com")
+
+
+def test_capacity_evicts_lru_and_closes_pool():
+    registry = GarminSessionRegistry(max_entries=2, idle_ttl=3600)
+    clients = {email: MagicMock() for email in ("a", "b", "c")}
+    registry.set_client("a", clients["a"])
+    registry.set_client("b", clients["b"])
+    registry.get_client("a")  # "b" is now least recently used
+    registry.set_client("c", clients["c"])
+
+    assert registry.has_client("a") and registry.has_client("c")
+    assert not registry.has_client("b")
+    clients["b"].garth.sess.close.assert_called_once()
+    assert registry.stats()["evictions"] == 1
+
+
+def test_idle_ttl_keeps_active_cooldown():
+    registry = GarminSessionRegistry(idle_ttl=60)
+    registry.set_client("idle", MagicMock())
+    registry.set_cooldown("blocked", time.time() + 900)
+    for email in ("idle", "blocked"):
+        registry._entries[email].last_access -= 120
+
+    assert registry.purge() == 1
+    assert not registry.has_client("idle")
+    assert registry.cooldown_until("blocked") > time.time()
+
+
+def test_hit_rate():
+    registry = GarminSessionRegistry()
+    registry.get_client("a")
+    registry.set_client("a", MagicMock())
+    registry.get_client("a")
+    registry.get_client("a", record=False)
+
+    stats = registry.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+
+
+def test_cached_client_is_only_handed_to_users_who_logged_in():
+    registry = GarminSessionRegistry()
+    client = MagicMock()
+    registry.set_client("a@x.com", client, user_id=1)
+
+    assert registry.get_client("a@x.com", user_id=1) is client
+    assert registry.get_client("a@x.com", user_id=2) is None
+    registry.set_client("a@x.com", client, user_id=2)  # User 2 logged in to the same account
+    assert registry.get_client("a@x.com", user_id=2) is client
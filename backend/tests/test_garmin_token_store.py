@@ -0,0 +1,76 @@
+from backend.models import GarminSession, User, UserSetting
+from backend.services.garmin_token_store import GarminTokenStore
+
+
+def test_save_bumps_version(db_session, test_user):
+    store = GarminTokenStore()
+    assert store.current_version(db_session, "runner@example.com", test_user.id) == 0
+
+    assert store.save(db_session, "runner@example.com", {"oauth2_token.json": "{}"}, test_user.id) == 1
+    assert store.save(db_session, "runner@example.com", {"oauth2_token.json": "{\"a\": 1}"}, test_user.id) == 2
+
+    stored = store.load(db_session, "runner@example.com", test_user.id)
+    assert stored["version"] == 2
+    assert stored["tokens"] == {"oauth2_token.json": "{\"a\": 1}"}
+    assert store.current_version(db_session, "runner@example.com", test_user.id) == 2
+
+
+def test_sessions_are_scoped_to_the_user_who_logged_in(db_session, test_user):
+    other = User(email="other@example.com")
+    db_session.add(other)
+    db_session.commit()
+    store = GarminTokenStore()
+    store.save(db_session, "runner@example.com", {"oauth2_token.json": "{}"}, test_user.id)
+
+    # Knowing the Garmin email is not enough to resume the session
+    assert store.load(db_session, "runner@example.com", other.id) is None
+    assert store.current_version(db_session, "runner@example.com", other.id) == 0
+
+
+def test_legacy_unscoped_row_is_read_but_never_written(db_session, test_user):
+    db_session.add(GarminSession(garmin_email="runner@example.com", tokens={"oauth1_token.json": "{}"}, version=3))
+    db_session.commit()
+    store = GarminTokenStore()
+    assert store.load(db_session, "runner@example.com", test_user.id)["version"] == 3
+
+    assert store.save(db_session, "runner@example.com", {"oauth1_token.json": "{\"a\": 1}"}, test_user.id) == 4
+    legacy = db_session.query(GarminSession).filter(GarminSession.user_id == None).one()
+    assert legacy.tokens == {"oauth1_token.json": "{}"} and legacy.version == 3
+
+
+def test_load_falls_back_to_legacy_setting(db_session, test_user):
+    db_session.add(UserSetting(user_id=test_user.id, key="garmin_session_runner@example.com",
+                               value={"oauth1_token.json": "{}"}))
+    db_session.commit()
+
+    stored = GarminTokenStore().load(db_session, "runner@example.com", test_user.id)
+    assert stored["version"] == 0
+    assert stored["tokens"] == {"oauth1_token.json": "{}"}
+
+
+def test_unchanged_tokens_keep_version(db_session, test_user):
+    store = GarminTokenStore()
+    tokens = {"oauth1_token.json": "{}", "oauth2_token.json": "{}"}
+    assert store.save(db_session, "runner@example.com", tokens, test_user.id) == 1
+    assert store.save(db_session, "runner@example.com", dict(tokens), test_user.id) == 1
+    assert store.save(db_session, "runner@example.com", tokens, test_user.id, display_name="runner_42") == 2
+    assert store.load(db_session, "runner@example.com", test_user.id)["display_name"] == "runner_42"
+
+
+def test_garth_tokens_round_trip_in_memory():
+    from garth.http import Client
+    from garth.auth_tokens import OAuth1Token, OAuth2Token
+    from backend.services.garmin_token_store import dump_garth_tokens, load_garth_tokens
+
+    source = Client()
+    source.configure(
+        oauth1_token=OAuth1Token(oauth_token="t", oauth_token_secret="s", domain="garmin.com"),
+        oauth2_token=OAuth2Token(scope="s", jti="j", token_type="bearer", access_token="a",
+                                 refresh_token="r", expires_in=3600, expires_at=1,
+                                 refresh_token_expires_in=7200, refresh_token_expires_at=2),
+    )
+    target = Client()
+    load_garth_tokens(target, dump_garth_tokens(source))
+    assert target.oauth1_token == source.oauth1_token
+    assert target.oauth2_token == source.oauth2_token
+    assert target.domain == "garmin.com"
@@ -0,0 +1,198 @@
+import asyncio
+import threading
+from unittest.mock import patch, MagicMock, AsyncMock
+
+from backend.services.ai_rate_limiter import AI_RATE_LIMITER, AIRateLimitExceeded
+from backend.services.coach_brain import CoachBrain
+from backend.services.prompt_cache import PromptParts, PromptPrefixCache, GeminiPrefixBackend
+
+
+class LocalPrefixBackend:
+    """Stand-in for Gemini context caching: remembers what was cached under which name."""
+
+    def __init__(self, fail=False, error=None):
+        self.fail = fail
+        self.error = error  # Raised by create() instead of caching
+        self.caches = {}
+        self.created = 0
+        self.attempts = 0
+
+    def create(self, system, context, ttl):
+        self.attempts += 1
+        if self.fail:
+            raise RuntimeError("CachedContent not supported for this model")
+        if self.error:
+            raise self.error
+        self.created += 1
+        name = f"cachedContents/{self.created}"
+        self.caches[name] = (system, context)
+        return name
+
+    def delete(self, name):
+        del self.caches[name]
+
+    is_rejection = staticmethod(GeminiPrefixBackend.is_rejection)
+    is_unsupported = staticmethod(GeminiPrefixBackend.is_unsupported)
+    is_too_small = staticmethod(GeminiPrefixBackend.is_too_small)
+
+
+class GeminiError(Exception):
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+def make_brain(backend, min_tokens=10):
+    with patch("google.genai.Client"):
+        brain = CoachBrain()
+    brain.prompt_cache = PromptPrefixCache(backend=backend, min_tokens=min_tokens)
+    return brain
+
+
+TELEGRAM_CONTEXT = {
+    "source": "telegram",
+    "athlete_name": "runner",
+    "settings": {"primary_sport": "running", "language": "en"},
+    "latest_training_plan": {"title": "Base", "weeks": [{"week_number": 1, "days": [
+        {"day_name": "Monday", "activity_type": "Run", "workout_title": "Easy 40'"}]}]},
+}
+
+
+def chat(brain, text, user_context=TELEGRAM_CONTEXT):
+    response = MagicMock(text="Sure.")
+    with patch.object(CoachBrain, "_call_gemini_with_retry_async", new_callable=AsyncMock, return_value=response) as call:
+        asyncio.run(brain.generate_chat_response_async([{"role": "user", "content": text}], user_context, user_key=7))
+    return call.call_args
+
+
+def test_follow_up_messages_reuse_the_cached_prefix():
+    backend = LocalPrefixBackend()
+    brain = make_brain(backend)
+
+    first, second = chat(brain, "How was my week?"), chat(brain, "And tomorrow?")
+
+    assert len(backend.caches) == 1
+    system, context = backend.caches["cachedContents/1"]
+    assert "elite, empathetic" in system and "Easy 40'" in context
+    for call in (first, second):
+        contents, config = call[0][0], call[1]["generation_config"]
+        assert config == {"cached_content": "cachedContents/1"}
+        assert "elite, empathetic" not in contents and "Easy 40'" not in contents
+    assert "And tomorrow?" in second[0][0]
+    stats = brain.prompt_cache.stats()
+    assert stats["static_builds"] == 1 and stats["context_hits"] == 1 and stats["remote_hits"] == 1
+
+
+def test_changed_context_builds_a_new_prefix():
+    backend = LocalPrefixBackend()
+    brain = make_brain(backend)
+    chat(brain, "Hi")
+    chat(brain, "Hi", dict(TELEGRAM_CONTEXT, settings={"primary_sport": "cycling"}))
+
+    # The user's previous prefix is deleted instead of being billed until it expires
+    assert list(backend.caches) == ["cachedContents/2"]
+    assert brain.prompt_cache.stats()["context_builds"] == 2
+
+
+def test_prompt_is_sent_inline_when_the_backend_cannot_cache():
+    brain = make_brain(LocalPrefixBackend(fail=True))
+    call = chat(brain, "Hi")
+    config = call[1]["generation_config"]
+    assert "cached_content" not in config
+    assert "elite, empathetic" in config["system_instruction"] and "Easy 40'" in config["system_instruction"]
+    assert brain.prompt_cache.stats()["remote_enabled"] is False
+
+    # Local memoization still applies while remote caching is off
+    chat(brain, "Again")
+    assert brain.prompt_cache.stats()["context_hits"] == 1
+
+
+def test_small_prefixes_are_not_sent_to_the_backend():
+    backend = LocalPrefixBackend()
+    cache = PromptPrefixCache(backend=backend, min_tokens=4096)
+    assert cache.cached_content(PromptParts("Be brief.", "", "Hi")) is None
+    assert backend.caches == {}
+
+
+def test_rate_limited_request_creates_no_remote_cache():
+    backend = LocalPrefixBackend()
+    brain = make_brain(backend)
+    with patch.object(AI_RATE_LIMITER, "acquire", new_callable=AsyncMock, side_effect=AIRateLimitExceeded()):
+        chat(brain, "Hi")
+    assert backend.caches == {}
+
+
+def test_only_a_rejected_cache_is_discarded():
+    backend = LocalPrefixBackend()
+    brain = make_brain(backend)
+    messages = [{"role": "user", "content": "Hi"}]
+
+    def ask(error):
+        responses = [error, MagicMock(text="Sure.")]
+        with patch.object(CoachBrain, "_call_gemini_with_retry_async", new_callable=AsyncMock, side_effect=responses) as call, \
+                patch.object(AI_RATE_LIMITER, "acquire", new_callable=AsyncMock):
+            reply = asyncio.run(brain.generate_chat_response_async(messages, TELEGRAM_CONTEXT, user_key=7))
+        return reply, call
+
+    # A timeout or 5xx keeps the (still valid) cache for the next call
+    reply, _ = ask(GeminiError(503, "UNAVAILABLE"))
+    assert reply == CoachBrain.CHAT_TASK.fallback
+    assert brain.prompt_cache.stats()["remote_entries"] == 1
+
+    # An unknown/expired cache is forgotten and the prompt resent inline at once
+    reply, call = ask(GeminiError(404, "CachedContent not found (or permission denied)"))
+    assert reply == "Sure."
+    assert "system_instruction" in call.call_args[1]["generation_config"]
+    stats = brain.prompt_cache.stats()
+    assert stats["remote_entries"] == 0 and stats["remote_rejected"] == 1
+
+
+def test_too_small_prefix_is_remembered_without_disabling_caching():
+    backend = LocalPrefixBackend(error=GeminiError(400, "Cached content is too small. min_total_token_count=4096"))
+    cache = PromptPrefixCache(backend=backend, min_tokens=1)
+    small = PromptParts("Be brief and kind.", "Athlete: runner", "Hi")
+    assert cache.cached_content(small) is None
+    assert cache.cached_content(small) is None
+    assert backend.attempts == 1  # Not offered again
+
+    backend.error = None
+    assert cache.cached_content(PromptParts("Be brief and kind.", "Athlete: cyclist", "Hi")) == "cachedContents/1"
+    stats = cache.stats()
+    assert stats["remote_enabled"] is True and stats["remote_too_small"] == 1
+
+
+def test_transient_create_failure_holds_back_only_that_prefix():
+    backend = LocalPrefixBackend(error=GeminiError(503, "UNAVAILABLE"))
+    cache = PromptPrefixCache(backend=backend, min_tokens=1, failure_backoff=60)
+    parts = PromptParts("Be brief and kind.", "Athlete: runner", "Hi")
+    assert cache.cached_content(parts) is None
+    backend.error = None
+    assert cache.cached_content(parts) is None  # Still backing off
+    assert cache.stats()["remote_enabled"] is True
+
+    with patch("backend.services.prompt_cache.time.time", return_value=cache._held_back[next(iter(cache._held_back))] + 1):
+        assert cache.cached_content(parts) == "cachedContents/1"
+
+
+def test_concurrent_calls_create_a_prefix_once():
+    started, release = threading.Event(), threading.Event()
+
+    class SlowBackend(LocalPrefixBackend):
+        def create(self, system, context, ttl):
+            started.set()
+            release.wait(5)
+            return super().create(system, context, ttl)
+
+    backend = SlowBackend()
+    cache = PromptPrefixCache(backend=backend, min_tokens=1)
+    parts = PromptParts("Be brief and kind.", "Athlete: runner", "Hi")
+    results = []
+    creator = threading.Thread(target=lambda: results.append(cache.cached_content(parts)))
+    creator.start()
+    started.wait(5)
+    assert cache.cached_content(parts) is None  # Sent inline while the first call creates the prefix
+    release.set()
+    creator.join(5)
+
+    assert results == ["cachedContents/1"] and backend.attempts == 1
+    assert cache.cached_content(parts) == "cachedContents/1"
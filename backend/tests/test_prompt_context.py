@@ -0,0 +1,58 @@
+from backend.services.prompt_context import (
+    PromptContext,
+    estimate_tokens,
+    render_plan,
+    render_value,
+    render_weekly_summary,
+    truncate_to_tokens,
+)
+
+
+def test_weekly_summary_is_one_line_per_week_newest_first():
+    summary = {
+        "distance": {"2026-03-23/2026-03-29": 30000.0, "2026-03-30/2026-04-05": 42100.0},
+        "duration": {"2026-03-23/2026-03-29": 10800.0, "2026-03-30/2026-04-05": 18720.0},
+        "tss": {"2026-03-30/2026-04-05": 310.4},
+        "count": {"2026-03-23/2026-03-29": 3, "2026-03-30/2026-04-05": 5},
+    }
+    assert render_weekly_summary(summary) == (
+        "- 2026-03-30: 42.1 km, 5.2 h, TSS 310, 5 sessions\n"
+        "- 2026-03-23: 30.0 km, 3.0 h, 3 sessions"
+    )
+    assert estimate_tokens(render_weekly_summary(summary)) < estimate_tokens(str(summary)) / 2
+
+
+def test_render_value_is_deterministic_and_skips_empty_fields():
+    assert render_value({"b": None, "a": [1.2345, {}], "c": ""}) == '{"a":[1.23,{}]}'
+    assert render_value({"x": 1, "y": 2}) == render_value({"y": 2, "x": 1})
+
+
+def test_plan_keeps_one_line_per_day_without_step_structure():
+    plan = {"title": "Base 1", "summary": "Aerobic base", "weeks": [{"week_number": 1, "focus": "Endurance", "days": [
+        {"day_name": "Monday", "activity_type": "Run", "workout_title": "Easy run", "total_duration": "45 min",
+         "structure": {"warmup": {"duration": "10 min", "description": "jog"}}},
+    ]}]}
+    assert render_plan(plan) == "Base 1: Aerobic base\nWeek 1: Endurance\n- Mon Run: Easy run (45 min)"
+
+
+def test_truncation_keeps_head_or_tail_and_notes_the_cut():
+    text = "\n".join(f"line {i}" for i in range(100))
+    head = truncate_to_tokens(text, 20)
+    tail = truncate_to_tokens(text, 20, keep="tail")
+    assert head.startswith("line 0\n") and head.endswith("more lines omitted]")
+    assert tail.endswith("line 99") and tail.startswith("[...")
+    assert estimate_tokens(head) <= 30
+
+
+def test_lowest_priority_sections_are_cut_first():
+    context = PromptContext("test", budget=60)
+    context.add("today", "x" * 40, priority=0)
+    context.add("weekly", "\n".join(["week"] * 20), priority=1)
+    context.add("recent", "\n".join(["activity line"] * 50), priority=2)
+    fitted = context.fit()
+
+    assert fitted["today"] == "x" * 40
+    assert fitted["weekly"] == "\n".join(["week"] * 20)
+    assert fitted["recent"].endswith("omitted]")
+    assert context.truncated == ["recent"]
+    assert sum(estimate_tokens(t) for t in fitted.values()) <= 60
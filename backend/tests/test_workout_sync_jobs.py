@@ -0,0 +1,86 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from backend.models import User
+from backend.services.workout_sync_jobs import WorkoutSyncJobs
+
+WORKOUT = {"workoutName": "Tempo 5k", "sportType": {"sportTypeKey": "running"}}
+
+
+def make_garmin(create_result=None, create_error=None):
+    client = MagicMock()
+    client.create_workout = AsyncMock(return_value=create_result, side_effect=create_error)
+    client.schedule_workout = AsyncMock(return_value=True)
+    client.send_workout_to_device = AsyncMock(return_value=True)
+    return client
+
+
+def run_jobs(jobs, *submissions):
+    async def go():
+        results = [await jobs.submit(*args) for args in submissions]
+        await asyncio.gather(*list(jobs._tasks))
+        return results
+    return asyncio.run(go())
+
+
+def test_duplicate_submissions_collapse_into_one_job(db_session):
+    user = User(email="sync@example.com")
+    db_session.add(user)
+    db_session.commit()
+    garmin = make_garmin(create_result={"workoutId": 42})
+    jobs = WorkoutSyncJobs()
+
+    session_factory = lambda: type(db_session)(bind=db_session.get_bind())
+    with patch.object(WorkoutSyncJobs, "_session", staticmethod(session_factory)):
+        (first, first_dup), (second, second_dup) = run_jobs(
+            jobs, (user.id, garmin, WORKOUT, "dev1"), (user.id, garmin, WORKOUT, "dev1")
+        )
+        job = asyncio.run(jobs.get(user.id, first["jobId"]))
+        assert asyncio.run(jobs.get(user.id + 1, first["jobId"])) is None
+
+    assert second["jobId"] == first["jobId"]
+    assert (first_dup, second_dup) == (False, True)
+    garmin.create_workout.assert_awaited_once()
+    assert job["status"] == "succeeded" and job["progress"] == 100
+    assert job["result"]["workoutId"] == 42
+    assert job["result"]["scheduled"] is True and job["result"]["sentToDevice"] is True
+
+
+def test_failed_job_is_rerun_on_resubmission(db_session):
+    user = User(email="retry@example.com")
+    db_session.add(user)
+    db_session.commit()
+    jobs = WorkoutSyncJobs()
+
+    session_factory = lambda: type(db_session)(bind=db_session.get_bind())
+    with patch.object(WorkoutSyncJobs, "_session", staticmethod(session_factory)):
+        [(failed, _)] = run_jobs(jobs, (user.id, make_garmin(create_error=Exception("boom")), WORKOUT))
+        assert asyncio.run(jobs.get(user.id, failed["jobId"]))["status"] == "failed"
+
+        [(retried, deduplicated)] = run_jobs(jobs, (user.id, make_garmin(create_result={"workoutId": 7}), WORKOUT))
+        job = asyncio.run(jobs.get(user.id, retried["jobId"]))
+
+    assert retried["jobId"] == failed["jobId"] and deduplicated is False
+    assert job["status"] == "succeeded" and job["error"] is None
+
+
+def test_resend_after_window_runs_again_and_old_jobs_are_deleted(db_session):
+    from datetime import datetime, timedelta
+    from backend.models import WorkoutSyncJob
+    user = User(email="resend@example.com")
+    db_session.add(user)
+    db_session.commit()
+    db_session.add(WorkoutSyncJob(id="old", user_id=user.id, dedupe_key="old", status="succeeded",
+                                  created_at=datetime.utcnow() - timedelta(days=30)))
+    db_session.commit()
+    garmin = make_garmin(create_result={"workoutId": 42})
+    jobs = WorkoutSyncJobs(resend_after=0)
+
+    session_factory = lambda: type(db_session)(bind=db_session.get_bind())
+    with patch.object(WorkoutSyncJobs, "_session", staticmethod(session_factory)):
+        [(first, _)] = run_jobs(jobs, (user.id, garmin, WORKOUT))
+        [(again, deduplicated)] = run_jobs(jobs, (user.id, garmin, WORKOUT))
+        assert asyncio.run(jobs.get(user.id, "old")) is None
+
+    assert again["jobId"] == first["jobId"] and deduplicated is False
+    assert garmin.create_workout.await_count == 2
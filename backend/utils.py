@@ -1,5 +1,7 @@
+import json
 import math
 from datetime import date, datetime
+from fastapi.responses import StreamingResponse
 
 def sanitize_for_json(obj):
     """Recursively processes the response dict to ensure everything is JSON-compliant."""
@@ -18,3 +20,17 @@ def sanitize_for_json(obj):
     elif isinstance(obj, (date, datetime)):
         return obj.isoformat()
     return obj
+
+
+def sse_event(event, data):
+    """One Server-Sent Events frame carrying `data` as JSON."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def sse_response(frames):
+    """StreamingResponse for an async iterator of sse_event() frames (unbuffered by proxies)."""
+    return StreamingResponse(
+        frames,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
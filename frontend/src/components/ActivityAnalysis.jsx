@@ -73,8 +73,12 @@ export function ActivityAnalysis({ activityId, onClose }) {
         const fetchData = async () => {
             try {
                 setLoading(true);
-                const response = await client.get(`/dashboard/activities/${activityId}/details`);
-                setData(response.data);
+                // The raw high_res stream is large; charts use the server-side decimated streams instead
+                const [response, streams] = await Promise.all([
+                    client.get(`/dashboard/activities/${activityId}/details`, { params: { components: 'summary,splits' } }),
+                    client.get(`/dashboard/activities/${activityId}/streams`, { params: { points: 300 } }).catch(() => null),
+                ]);
+                setData({ ...response.data, streams: streams?.data?.channels });
             } catch (err) {
                 console.error("Failed to fetch activity details:", err);
                 setError("Could not load activity details.");
@@ -99,39 +103,26 @@ export function ActivityAnalysis({ activityId, onClose }) {
 
     // Attempt to use high-resolution stream data first for detailed "up down" visuals
     let chartData = [];
-    const highRes = data?.details?.high_res;
-
-    if (highRes && highRes.metrics && highRes.metricDescriptors) {
-        // Garmin Detailed Metrics format: metrics[] with indices matching metricDescriptors[]
-        const descriptors = highRes.metricDescriptors;
-        const hrIdx = descriptors.findIndex(d => d.key === 'directHeartRate');
-        const speedIdx = descriptors.findIndex(d => d.key === 'directSpeed');
-        const elevIdx = descriptors.findIndex(d => d.key === 'directAltitude' || d.key === 'directElevation');
-        const powerIdx = descriptors.findIndex(d => d.key === 'directPower');
-        const distIdx = descriptors.findIndex(d => d.key === 'sumDistance');
-
-        // Map and downsample (e.g., take every 5th-10th point if > 500 points)
-        const rawMetrics = highRes.metrics || [];
-        const skip = Math.max(1, Math.floor(rawMetrics.length / 300)); // Target ~300 points for smoothness
-
-        chartData = rawMetrics.filter((_, i) => i % skip === 0).map((m, index) => {
-            const items = m.metricsItems || [];
-            const speed = speedIdx !== -1 ? items[speedIdx] : 0;
-            let paceNum = 0;
-            if (speed > 0) {
-                paceNum = (1000 / speed) / 60;
-            }
-
-            return {
-                name: `Point ${index * skip}`,
-                distance: distIdx !== -1 ? Math.round(items[distIdx]) : 0,
-                avgHR: hrIdx !== -1 ? items[hrIdx] : null,
-                avgSpeed: speed,
-                pace: paceNum > 0 && paceNum < 30 ? paceNum : null, // Filter crazy outliers
-                elevation: elevIdx !== -1 ? Math.round(items[elevIdx]) : null,
-                power: powerIdx !== -1 ? items[powerIdx] : null
-            };
+    const streams = data?.streams;
+
+    if (streams && Object.keys(streams).length > 0) {
+        // Each channel is decimated on its own (LTTB), so merge the channels on elapsed time
+        const keys = { heart_rate: 'avgHR', pace: 'pace', elevation: 'elevation', power: 'power' };
+        const byTime = new Map();
+        Object.entries(streams).forEach(([channel, stream]) => {
+            stream.value.forEach((value, i) => {
+                const t = stream.time[i] ?? i;
+                const point = byTime.get(t) || { time: t, distance: stream.distance[i], avgHR: null, pace: null, elevation: null, power: null };
+                point[keys[channel]] = channel === 'elevation' ? Math.round(value) : value;
+                byTime.set(t, point);
+            });
         });
+
+        chartData = [...byTime.values()].sort((a, b) => a.time - b.time).map(point => ({
+            ...point,
+            name: `${Math.floor(point.time / 60)}:${Math.round(point.time % 60).toString().padStart(2, '0')}`,
+            distance: point.distance !== null && point.distance !== undefined ? Math.round(point.distance) : 0,
+        }));
     } else {
         // Fallback to coarse Lap data
         let laps = [];
@@ -431,7 +422,7 @@ export function ActivityAnalysis({ activityId, onClose }) {
                                                         contentStyle={{ backgroundColor: '#171717', border: '1px solid #374151', borderRadius: '8px' }}
                                                         itemStyle={{ color: '#fff' }}
                                                     />
-                                                    <Area type="monotone" dataKey="avgHR" stroke="#ef4444" strokeWidth={2} fillOpacity={1} fill="url(#colorHr)" activeDot={{ r: 6 }} />
+                                                    <Area type="monotone" dataKey="avgHR" connectNulls={true} stroke="#ef4444" strokeWidth={2} fillOpacity={1} fill="url(#colorHr)" activeDot={{ r: 6 }} />
                                                 </AreaChart>
                                             </ResponsiveContainer>
                                         </div>
@@ -460,7 +451,7 @@ export function ActivityAnalysis({ activityId, onClose }) {
                                                         itemStyle={{ color: '#fff' }}
                                                         formatter={(value) => [`${Math.floor(value)}:${Math.round((value % 1) * 60).toString().padStart(2, '0')}`, 'Pace']}
                                                     />
-                                                    <Area type="monotone" dataKey="pace" stroke="#3b82f6" strokeWidth={2} fillOpacity={1} fill="url(#colorPace)" activeDot={{ r: 6 }} />
+                                                    <Area type="monotone" dataKey="pace" connectNulls={true} stroke="#3b82f6" strokeWidth={2} fillOpacity={1} fill="url(#colorPace)" activeDot={{ r: 6 }} />
                                                 </AreaChart>
                                             </ResponsiveContainer>
                                         </div>
@@ -528,7 +519,7 @@ export function ActivityAnalysis({ activityId, onClose }) {
                                                             itemStyle={{ color: '#fff' }}
                                                             formatter={(value) => [`${Math.round(value)} W`, 'Power']}
                                                         />
-                                                        <Area type="monotone" dataKey="power" stroke="#f97316" strokeWidth={2} fillOpacity={1} fill="url(#colorPower)" activeDot={{ r: 6 }} />
+                                                        <Area type="monotone" dataKey="power" connectNulls={true} stroke="#f97316" strokeWidth={2} fillOpacity={1} fill="url(#colorPower)" activeDot={{ r: 6 }} />
                                                     </AreaChart>
                                                 </ResponsiveContainer>
                                             </div>
@@ -98,10 +98,17 @@ export function AdviceBlock({ advice, workout, isGenerating, language }) {
         if (!workout) return;
         setSyncStatus('loading');
         try {
-            await client.post('/coach/sync', {
+            const { data: queued } = await client.post('/coach/sync', {
                 workout,
                 deviceId: selectedDeviceId || null
             });
+            // The sync runs as a background job; poll until it finishes
+            let job = queued;
+            for (let i = 0; i < 60 && (job.status === 'queued' || job.status === 'running'); i++) {
+                await new Promise(resolve => setTimeout(resolve, 1000));
+                job = (await client.get(`/coach/sync/${queued.jobId}`)).data;
+            }
+            if (job.status !== 'succeeded') throw new Error(job.error || 'Workout sync did not finish');
             setSyncStatus('success');
             setTimeout(() => setSyncStatus(null), 3000);
         } catch (error) {